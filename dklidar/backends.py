@@ -0,0 +1,116 @@
+### Lazy loading of the processing backends (OPALS, GDAL, pandas etc.) for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The dklidar modules import their heavy dependencies from here rather than at the top of the module. The actual
+# import only happens once a function accesses an attribute of the backend, e.g. opals.Cell.Cell(). This way the
+# modules load instantly, each pool worker only pays for the backends its steps actually use, and everything that
+# does not need OPALS can be imported and run on machines without an OPALS install.
+# Numerical kernels (e.g. in hydrology.py) are likewise compiled with numba only on their first call, and run as plain
+# Python if numba is not installed (see jit()).
+
+# Imports
+import importlib
+
+
+## Lazy module proxy
+class LazyModule(object):
+    """
+    Placeholder for a module that is imported on first attribute access.
+    """
+
+    def __init__(self, module_name):
+        """
+        :param module_name: fully qualified name of the module, e.g. 'osgeo.gdal_array'
+        """
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        # Import module if this has not been done yet
+        if self.__dict__['_module'] is None:
+            self.__dict__['_module'] = importlib.import_module(self.__dict__['_module_name'])
+        return self.__dict__['_module']
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        if self.__dict__['_module'] is None:
+            return '<lazy module \'' + self.__dict__['_module_name'] + '\' (not loaded)>'
+        return repr(self.__dict__['_module'])
+
+
+## Check whether a backend is loaded
+def is_loaded(backend):
+    """
+    :param backend: LazyModule object
+    :return: True if the module has been imported, False otherwise
+    """
+    return backend.__dict__['_module'] is not None
+
+
+## Check whether a backend can be imported
+def is_available(backend):
+    """
+    Checks whether a backend is installed by trying to load it. Note: this triggers the import.
+    :param backend: LazyModule object
+    :return: True if the module can be imported, False otherwise
+    """
+    try:
+        backend._load()
+        return True
+    except ImportError:
+        return False
+
+
+## Numerical kernel compiled on first use
+class LazyJit(object):
+    """
+    Wrapper for a numerical kernel written as plain Python loops over numpy arrays. On the first call the kernel is
+    compiled with numba (nopython mode, releasing the GIL, cached on disk). If numba is not installed the plain Python
+    function is used instead, which gives the same results but is much slower.
+    """
+
+    def __init__(self, function):
+        """
+        :param function: kernel function (numba compatible)
+        """
+        self.function = function
+        self.compiled = None
+        self.__doc__ = function.__doc__
+        self.__name__ = function.__name__
+
+    def __call__(self, *args):
+        if self.compiled is None:
+            if is_available(numba):
+                self.compiled = numba.njit(nogil = True, cache = True)(self.function)
+            else:
+                self.compiled = self.function
+        return self.compiled(*args)
+
+
+## Decorator for numerical kernels
+def jit(function):
+    """
+    :param function: kernel function (numba compatible)
+    :return: LazyJit object, compiles the kernel with numba on the first call if numba is installed
+    """
+    return LazyJit(function)
+
+
+## Backends used by the dklidar modules
+opals = LazyModule('opals')
+gdal = LazyModule('osgeo.gdal')
+gdal_array = LazyModule('osgeo.gdal_array')
+ogr = LazyModule('osgeo.ogr')
+osr = LazyModule('osgeo.osr')
+pandas = LazyModule('pandas')
+laspy = LazyModule('laspy')
+zarr = LazyModule('zarr')
+numcodecs = LazyModule('numcodecs')
+xxhash = LazyModule('xxhash')
+blake3 = LazyModule('blake3')
+numba = LazyModule('numba')
@@ -0,0 +1,209 @@
+### Halo based block processing of neighbourhood dependent DTM derivatives for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Each derivative of the terrain model declares the halo (in cells) of context it needs around the cells it
+# calculates, e.g. one cell for slope and aspect, the search radius for openness or the catchment reach for the TWI
+# (see register()). The framework reads exactly the block plus its halo from the DTM source (the 0.4 m DTM tiles
+# aggregated to the cell size in-process), runs the kernel of the derivative and returns the core of the block. This
+# replaces building and aggregating a 3 km x 3 km neighbourhood mosaic per tile for every derivative.
+# A block can be a single tile or a super-block of n x n tiles (see tile_blocks()): the halo is only read once for
+# the whole block, the results are split back into the tiles afterwards (see split_tiles()).
+# Parts of the halo (or block) without DTM are no data (NaN), as at the edges of the neighbourhood mosaics.
+# With settings.n_threads > 1 the block is split into strips of rows (each with the halo of the derivative) that are
+# processed in parallel threads, the kernels are vectorised numpy operations that release the GIL. The aggregation of
+# the DTM tiles (gdal.Warp) is multithreaded likewise. The results are identical to processing the block as a whole.
+
+## Imports
+import math
+import numpy
+from multiprocessing.pool import ThreadPool
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import catalogue
+from dklidar.backends import gdal
+
+# Registered derivatives: name -> (halo in cells, kernel, whether the block can be split into strips)
+derivatives = {}
+
+##### Function definitions
+
+## Register a derivative
+def register(name, halo, kernel, split = True):
+    """
+    :param name: name of the derivative
+    :param halo: number of cells required around each cell calculated
+    :param kernel: function kernel(dem, cell_size, core_bounds, **options) that takes the DTM of a block plus halo
+    (2D array, north up, no data as NaN) and returns a dictionary of 2D arrays covering the block plus (part of) the
+    halo, centred on the block (the remaining halo is cropped by process_block())
+    :param split: whether the block can be split into strips of rows processed in parallel threads (False for
+    kernels whose halo is large compared to the block)
+    :return: nothing
+    """
+    derivatives[name] = (halo, kernel, split)
+
+
+## Extent of a block plus halo
+def expand_bounds(bounds, halo, cell_size):
+    """
+    :param bounds: extent (xmin, ymin, xmax, ymax) in m
+    :param halo: number of cells
+    :param cell_size: cell size in m
+    :return: extent (xmin, ymin, xmax, ymax) in m expanded by the halo on all sides
+    """
+    xmin, ymin, xmax, ymax = bounds
+    return xmin - halo * cell_size, ymin - halo * cell_size, xmax + halo * cell_size, ymax + halo * cell_size
+
+
+## Read the DTM aggregated to the cell size for an extent
+def read_dtm_window(bounds, cell_size = None, n_threads = None):
+    """
+    Aggregates the 1 km DTM tiles covering an extent (average) in-process. Only the tiles intersecting the extent are
+    read, the available tiles are looked up in the dtm catalogue (see catalogue.py).
+    :param bounds: extent (xmin, ymin, xmax, ymax) in m, aligned to the cell size
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :param n_threads: number of threads used by gdal.Warp, defaults to settings.n_threads
+    :return: 2D float64 array (north up) with no data as NaN, None if no DTM tile covers the extent
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    if n_threads is None: n_threads = settings.n_threads
+    xmin, ymin, xmax, ymax = bounds
+    rows, cols = numpy.meshgrid(numpy.arange(int(math.floor(ymin / float(tilegrid.tile_size))),
+                                             int(math.ceil(ymax / float(tilegrid.tile_size)))),
+                                numpy.arange(int(math.floor(xmin / float(tilegrid.tile_size))),
+                                             int(math.ceil(xmax / float(tilegrid.tile_size)))), indexing = 'ij')
+    dtm_catalogue = catalogue.get_catalogue('dtm')
+    indices = dtm_catalogue.find(rows.ravel(), cols.ravel())
+    dtm_files = dtm_catalogue.file_paths(dtm_catalogue.tile_ids[indices[indices >= 0]])
+    if len(dtm_files) == 0:
+        return None
+
+    dtm_vrt = gdal.BuildVRT('', dtm_files)
+    dtm_raster = gdal.Warp('', dtm_vrt, format = 'MEM', outputBounds = bounds, xRes = cell_size, yRes = cell_size,
+                           resampleAlg = 'average', dstNodata = -9999, multithread = n_threads > 1,
+                           warpOptions = ['NUM_THREADS=' + str(n_threads)])
+    values = dtm_raster.GetRasterBand(1).ReadAsArray().astype(numpy.float64)
+    values[values == -9999] = numpy.nan
+    dtm_raster = None
+    dtm_vrt = None
+    return values
+
+
+## Process a block
+def process_block(name, core_bounds, cell_size = None, halo = None, n_threads = None, **options):
+    """
+    Reads the DTM of a block plus the halo of the derivative and runs its kernel, split into strips of rows in
+    parallel threads if n_threads > 1 (see row_strips()).
+    :param name: name of a registered derivative
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m, e.g. the bounds of a tile
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :param halo: number of halo cells, defaults to the halo registered for the derivative
+    :param n_threads: number of parallel threads, defaults to settings.n_threads
+    :param options: passed on to the kernel
+    :return: dictionary of 2D arrays covering the block (no data as NaN), None if there is no DTM in the block
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    if halo is None: halo = derivatives[name][0]
+    if n_threads is None: n_threads = settings.n_threads
+    kernel, split = derivatives[name][1:]
+    dem = read_dtm_window(expand_bounds(core_bounds, halo, cell_size), cell_size, n_threads)
+    if dem is None or numpy.all(numpy.isnan(dem)):
+        return None
+    n_rows = int(round((core_bounds[3] - core_bounds[1]) / float(cell_size)))
+    n_cols = int(round((core_bounds[2] - core_bounds[0]) / float(cell_size)))
+
+    # Process a strip of rows of the block (rows of the dem are offset by the halo)
+    def process_strip(strip):
+        start, end = strip
+        strip_bounds = (core_bounds[0], core_bounds[3] - end * cell_size, core_bounds[2],
+                        core_bounds[3] - start * cell_size)
+        results = kernel(dem[start:(end + 2 * halo)], cell_size, strip_bounds, **options)
+        return dict((key, crop_core(values, end - start, n_cols)) for key, values in results.items())
+
+    strips = row_strips(n_rows, halo, n_threads) if split else [(0, n_rows)]
+    if len(strips) > 1:
+        pool = ThreadPool(processes = min(n_threads, len(strips)))
+        strip_results = pool.map(process_strip, strips)
+        pool.close()
+        pool.join()
+        return dict((key, numpy.concatenate([results[key] for results in strip_results]))
+                    for key in strip_results[0])
+    return process_strip(strips[0])
+
+
+## Split the rows of a block into strips
+def row_strips(n_rows, halo, n_threads):
+    """
+    Splits the rows of a block into up to n_threads strips of (almost) equal height. Strips are at least twice the
+    halo high, so that the halo read by each strip at most doubles the cells processed.
+    :param n_rows: number of rows of the block
+    :param halo: number of halo cells
+    :param n_threads: number of parallel threads
+    :return: list of (first row, last row + 1) tuples
+    """
+    n_strips = max(1, min(n_threads, n_rows // max(2 * halo, 1)))
+    edges = [int(round(i * n_rows / float(n_strips))) for i in range(n_strips + 1)]
+    return [(edges[i], edges[i + 1]) for i in range(n_strips)]
+
+
+## Crop the halo of an array
+def crop_core(values, n_rows, n_cols):
+    """
+    :param values: 2D array of a block plus halo (centred on the block)
+    :param n_rows: number of rows of the block
+    :param n_cols: number of columns of the block
+    :return: 2D array of the block
+    """
+    row_halo = (values.shape[0] - n_rows) // 2
+    col_halo = (values.shape[1] - n_cols) // 2
+    return values[row_halo:(row_halo + n_rows), col_halo:(col_halo + n_cols)]
+
+
+## Group tiles into super-blocks
+def tile_blocks(tile_ids, n_tiles = 1):
+    """
+    :param tile_ids: sequence of tile ids
+    :param n_tiles: edge length of the super-blocks in tiles (1 = each tile is a block)
+    :return: list of (core bounds, list of the tile ids in the block) tuples, the blocks are aligned to multiples of
+    n_tiles on the tile grid, their core bounds cover all n_tiles x n_tiles tiles (whether requested or not)
+    """
+    blocks = {}
+    for tile_id in tile_ids:
+        row, col = tilegrid.parse_tile_id(tile_id)
+        blocks.setdefault((row // n_tiles, col // n_tiles), []).append(tile_id)
+    return [((block_col * n_tiles * tilegrid.tile_size, block_row * n_tiles * tilegrid.tile_size,
+              (block_col + 1) * n_tiles * tilegrid.tile_size, (block_row + 1) * n_tiles * tilegrid.tile_size),
+             blocks[(block_row, block_col)]) for block_row, block_col in sorted(blocks.keys(), reverse = True)]
+
+
+## Split the results of a block into tiles
+def split_tiles(results, core_bounds, tile_ids, cell_size = None):
+    """
+    :param results: dictionary of 2D arrays covering the core of a block (see process_block())
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m
+    :param tile_ids: tile ids within the block
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: dictionary of tile id -> dictionary of 2D arrays covering the tile
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    geo_transform = (core_bounds[0], cell_size, 0, core_bounds[3], 0, -cell_size)
+    return dict((tile_id, dict((key, tilegrid.crop_to_tile(values, geo_transform, tile_id))
+                               for key, values in results.items())) for tile_id in tile_ids)
+
+
+## Process a derivative for a set of tiles
+def process_tiles(name, tile_ids, n_tiles = 1, cell_size = None, **options):
+    """
+    Processes the tiles in super-blocks of n_tiles x n_tiles tiles, the halo is only read once per block.
+    :param name: name of a registered derivative
+    :param tile_ids: sequence of tile ids
+    :param n_tiles: edge length of the super-blocks in tiles
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :param options: passed on to the kernel
+    :return: generator of (tile id, dictionary of 2D arrays covering the tile or None if there is no DTM) tuples
+    """
+    for core_bounds, block_tile_ids in tile_blocks(tile_ids, n_tiles):
+        results = process_block(name, core_bounds, cell_size, **options)
+        tile_results = split_tiles(results, core_bounds, block_tile_ids, cell_size) if results is not None else {}
+        for tile_id in block_tile_ids:
+            yield tile_id, tile_results.get(tile_id)
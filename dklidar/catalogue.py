@@ -0,0 +1,305 @@
+### Tile catalogues: index of the tiles in a folder for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# A tile catalogue holds the tiles of a folder (e.g. the laz or dtm input files) as compact arrays: tile ids, file
+# names, file sizes and grid coordinates (row / col in km, see tilegrid.py). The folder is scanned once and the
+# catalogue is persisted (numpy .npz in settings.catalogue_folder), it is only scanned again if the folder has been
+# modified since. Existence checks are set look ups and neighbour queries are vectorised look ups (binary search in
+# the sorted grid keys) instead of os.path.exists() calls for each candidate file, and catalogues can be compared
+# with set operations (e.g. laz tiles without dtm tile).
+
+## Imports
+import os
+import re
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+
+# Factor combining row and col number into one grid key (row * key_factor + col), col numbers are < 10000
+key_factor = 10000
+
+# Catalogues loaded in this process (name -> TileCatalogue)
+loaded_catalogues = {}
+
+##### Function and class definitions
+
+## Scan a folder for tile files
+def scan_folder(folder, pattern):
+    """
+    :param folder: folder to scan (not recursive)
+    :param pattern: regular expression matching the file names, the first group has to match the tile id
+    :return: list of (tile id, file name, file size in bytes) tuples sorted by file name
+    """
+    file_pattern = re.compile(pattern)
+    entries = []
+    # scandir returns the file sizes without an extra call per file (Python >= 3.5)
+    if hasattr(os, 'scandir'):
+        for entry in os.scandir(folder):
+            match = file_pattern.search(entry.name)
+            if match is not None and entry.is_file():
+                entries.append((match.group(1), entry.name, entry.stat().st_size))
+    else:
+        for file_name in os.listdir(folder):
+            match = file_pattern.search(file_name)
+            if match is not None and os.path.isfile(folder + '/' + file_name):
+                entries.append((match.group(1), file_name, os.path.getsize(folder + '/' + file_name)))
+    return sorted(entries, key = lambda entry: entry[1])
+
+
+## Tile catalogue
+class TileCatalogue(object):
+    """
+    Index of the tiles in a folder: tile ids, file names, file sizes and grid coordinates as arrays (in the order of
+    the file names).
+    """
+
+    def __init__(self, folder, tile_ids, file_names = None, sizes = None, folder_mtime = 0.0):
+        """
+        :param folder: folder of the tile files
+        :param tile_ids: sequence of tile ids in the format "rrrr_ccc"
+        :param file_names: sequence of file names (relative to the folder), same length as tile_ids
+        :param sizes: sequence of file sizes in bytes, same length as tile_ids
+        :param folder_mtime: modification time of the folder when it was scanned
+        """
+        self.folder = re.sub('[\\\\/]+$', '', re.sub('\\\\', '/', folder))
+        self.tile_ids = numpy.array(tile_ids, dtype = str).reshape(-1)
+        self.file_names = numpy.array(file_names if file_names is not None else [''] * len(self.tile_ids),
+                                      dtype = str).reshape(-1)
+        self.sizes = numpy.array(sizes if sizes is not None else [0] * len(self.tile_ids), dtype = numpy.int64)
+        self.folder_mtime = folder_mtime
+        grid = [tilegrid.parse_tile_id(tile_id) for tile_id in self.tile_ids]
+        self.rows = numpy.array([row for row, col in grid], dtype = numpy.int32)
+        self.cols = numpy.array([col for row, col in grid], dtype = numpy.int32)
+        self.keys = self.rows.astype(numpy.int64) * key_factor + self.cols
+        # Sorted keys for the vectorised look ups, set of tile ids for single existence checks
+        self.key_order = numpy.argsort(self.keys, kind = 'mergesort')
+        self.sorted_keys = self.keys[self.key_order]
+        self.tile_id_set = set(self.tile_ids.tolist())
+
+    def __len__(self):
+        return len(self.tile_ids)
+
+    def __iter__(self):
+        return iter(self.tile_ids.tolist())
+
+    def __contains__(self, tile_id):
+        return tile_id in self.tile_id_set
+
+    def __repr__(self):
+        return '<TileCatalogue of ' + self.folder + ': ' + str(len(self)) + ' tiles>'
+
+    ## Scan a folder
+    @classmethod
+    def scan(cls, folder, pattern):
+        """
+        :param folder: folder to scan (not recursive)
+        :param pattern: regular expression matching the file names, the first group has to match the tile id
+        :return: TileCatalogue of the folder
+        """
+        folder_mtime = os.path.getmtime(folder)
+        entries = scan_folder(folder, pattern)
+        return cls(folder, [entry[0] for entry in entries], [entry[1] for entry in entries],
+                   [entry[2] for entry in entries], folder_mtime)
+
+    ## Load a persisted catalogue
+    @classmethod
+    def load(cls, catalogue_file):
+        """
+        :param catalogue_file: path of the .npz file written by save()
+        :return: TileCatalogue
+        """
+        # Copy the arrays and close the file, an open handle would lock the file on Windows (see save())
+        with numpy.load(catalogue_file) as arrays:
+            folder = str(arrays['folder'])
+            tile_ids = arrays['tile_ids'].copy()
+            file_names = arrays['file_names'].copy()
+            sizes = arrays['sizes'].copy()
+            folder_mtime = float(arrays['folder_mtime'])
+        return cls(folder, tile_ids, file_names, sizes, folder_mtime)
+
+    ## Persist the catalogue
+    def save(self, catalogue_file):
+        """
+        Writes the catalogue to a temporary file first, which then atomically replaces the catalogue file (os.replace,
+        Python >= 3.3), so other processes never read a partial catalogue. Without os.replace (Python 2) the old file
+        is removed before the rename and a reader can briefly find no catalogue; get_catalogue() then scans the
+        folder instead. The catalogue is a cache of the folder: if the file can not be replaced (e.g. another process
+        saves or reads it at the same time on Windows), the temporary file is removed and the existing file kept.
+        :param catalogue_file: path of the .npz file
+        :return: True if the catalogue was written, False otherwise
+        """
+        temp_file = re.sub('\.npz$', '', catalogue_file) + '_' + str(os.getpid()) + '_temp.npz'
+        numpy.savez(temp_file, folder = numpy.array(self.folder), tile_ids = self.tile_ids,
+                    file_names = self.file_names, sizes = self.sizes, folder_mtime = numpy.array(self.folder_mtime))
+        try:
+            if hasattr(os, 'replace'):
+                os.replace(temp_file, catalogue_file)
+            else:
+                if os.path.exists(catalogue_file): os.remove(catalogue_file)
+                os.rename(temp_file, catalogue_file)
+            return True
+        except OSError:
+            if os.path.exists(temp_file): os.remove(temp_file)
+            return False
+
+    ## Subset of the catalogue
+    def subset(self, selection):
+        """
+        :param selection: boolean mask or index array over the tiles of the catalogue
+        :return: TileCatalogue with the selected tiles
+        """
+        return TileCatalogue(self.folder, self.tile_ids[selection], self.file_names[selection], self.sizes[selection],
+                             self.folder_mtime)
+
+    ## Vectorised look up of grid positions
+    def find(self, rows, cols):
+        """
+        :param rows: array of row numbers
+        :param cols: array of column numbers
+        :return: array of the indices of the tiles in the catalogue, -1 where no tile exists
+        """
+        keys = numpy.asarray(rows, dtype = numpy.int64) * key_factor + numpy.asarray(cols, dtype = numpy.int64)
+        if len(self) == 0: return numpy.full(keys.shape, -1, dtype = numpy.int64)
+        positions = numpy.minimum(numpy.searchsorted(self.sorted_keys, keys), len(self) - 1)
+        return numpy.where(self.sorted_keys[positions] == keys, self.key_order[positions], -1)
+
+    ## Vectorised existence check of tile ids
+    def contains(self, tile_ids):
+        """
+        :param tile_ids: sequence of tile ids
+        :return: boolean array, True where the tile is in the catalogue
+        """
+        return numpy.array([tile_id in self.tile_id_set for tile_id in tile_ids], dtype = bool)
+
+    ## File path of a tile
+    def file_path(self, tile_id):
+        """
+        :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+        :return: path of the file of the tile, None if the tile is not in the catalogue
+        """
+        if tile_id not in self.tile_id_set: return None
+        row, col = tilegrid.parse_tile_id(tile_id)
+        return self.folder + '/' + self.file_names[self.find([row], [col])[0]]
+
+    ## File paths of several tiles
+    def file_paths(self, tile_ids):
+        """
+        :param tile_ids: sequence of tile ids
+        :return: list of the file paths of the tiles that are in the catalogue
+        """
+        return [self.file_path(tile_id) for tile_id in tile_ids if tile_id in self.tile_id_set]
+
+    ## Available tiles in the neighbourhood of a tile
+    def neighbours(self, tile_id, distance = 1):
+        """
+        :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+        :param distance: size of the neighbourhood in tiles
+        :return: list of the tile ids in the (2 * distance + 1) x (2 * distance + 1) neighbourhood (including the tile
+        itself) that are in the catalogue, in raster order
+        """
+        row, col = tilegrid.parse_tile_id(tile_id)
+        row_offsets, col_offsets = numpy.meshgrid(numpy.arange(distance, -distance - 1, -1),
+                                                  numpy.arange(-distance, distance + 1), indexing = 'ij')
+        indices = self.find(row + row_offsets.ravel(), col + col_offsets.ravel())
+        return self.tile_ids[indices[indices >= 0]].tolist()
+
+    ## Number of available neighbours of all tiles
+    def neighbour_counts(self, distance = 1):
+        """
+        :param distance: size of the neighbourhood in tiles
+        :return: array of the number of tiles in the catalogue in the neighbourhood of each tile (including itself)
+        """
+        counts = numpy.zeros(len(self), dtype = numpy.int32)
+        for row_offset in range(-distance, distance + 1):
+            for col_offset in range(-distance, distance + 1):
+                counts += self.find(self.rows + row_offset, self.cols + col_offset) >= 0
+        return counts
+
+    ## Bounding box of the catalogue
+    def bounds(self):
+        """
+        :return: tuple of (xmin, ymin, xmax, ymax) in m of the tiles in the catalogue, None if it is empty
+        """
+        if len(self) == 0: return None
+        return (int(self.cols.min()) * tilegrid.tile_size, int(self.rows.min()) * tilegrid.tile_size,
+                (int(self.cols.max()) + 1) * tilegrid.tile_size, (int(self.rows.max()) + 1) * tilegrid.tile_size)
+
+    ## Total size of the files
+    def total_size(self):
+        """
+        :return: total size of the files in the catalogue in bytes
+        """
+        return int(self.sizes.sum())
+
+    ## Set operations
+    def intersection(self, other):
+        """
+        :param other: TileCatalogue
+        :return: TileCatalogue with the tiles of this catalogue that are also in the other catalogue
+        """
+        return self.subset(other.find(self.rows, self.cols) >= 0)
+
+    def difference(self, other):
+        """
+        :param other: TileCatalogue
+        :return: TileCatalogue with the tiles of this catalogue that are not in the other catalogue
+        """
+        return self.subset(other.find(self.rows, self.cols) < 0)
+
+    def union(self, other):
+        """
+        :param other: TileCatalogue
+        :return: TileCatalogue with the tiles of both catalogues, the files of this catalogue take precedence (the
+        file names of the tiles only in the other catalogue are made relative to the folder of this catalogue)
+        """
+        extra = other.difference(self)
+        extra_file_names = [os.path.relpath(other.folder + '/' + file_name, self.folder).replace('\\', '/')
+                            for file_name in extra.file_names]
+        return TileCatalogue(self.folder, numpy.concatenate([self.tile_ids, extra.tile_ids]),
+                             numpy.concatenate([self.file_names, numpy.array(extra_file_names, dtype = str)]),
+                             numpy.concatenate([self.sizes, extra.sizes]), self.folder_mtime)
+
+
+## Get a catalogue by name
+def get_catalogue(name, rebuild = False):
+    """
+    Returns a catalogue of an input folder defined in settings.catalogues. The catalogue is loaded from
+    settings.catalogue_folder if it is up to date with the folder, otherwise the folder is scanned and the catalogue
+    persisted. Catalogues are kept in memory for subsequent calls in the same process.
+    :param name: name of the catalogue, e.g. 'laz' or 'dtm'
+    :param rebuild: if True the folder is scanned again in any case
+    :return: TileCatalogue
+    """
+    if not rebuild and name in loaded_catalogues: return loaded_catalogues[name]
+
+    folder, pattern = settings.catalogues[name]
+    catalogue_file = settings.catalogue_folder + '/catalogue_' + name + '.npz'
+    tile_catalogue = None
+    if not rebuild and os.path.exists(catalogue_file):
+        # Scan the folder if the file has disappeared or can not be read (e.g. while another process replaces it)
+        try:
+            tile_catalogue = TileCatalogue.load(catalogue_file)
+        except Exception:
+            tile_catalogue = None
+        # Scan again if the folder has been modified (files added or removed) since the catalogue was built
+        if tile_catalogue is not None and tile_catalogue.folder_mtime != os.path.getmtime(folder):
+            tile_catalogue = None
+    if tile_catalogue is None:
+        tile_catalogue = TileCatalogue.scan(folder, pattern)
+        if not os.path.exists(settings.catalogue_folder): os.makedirs(settings.catalogue_folder)
+        tile_catalogue.save(catalogue_file)
+
+    loaded_catalogues[name] = tile_catalogue
+    return tile_catalogue
+
+
+## Use catalogues loaded in another process
+def set_loaded_catalogues(catalogues):
+    """
+    Initialiser for worker processes (multiprocessing.Pool(initializer = ...)): the catalogues loaded in the main
+    process are handed to the workers, so the workers do not stat, load or re-scan the folders on their own.
+    :param catalogues: dictionary of name -> TileCatalogue, e.g. catalogue.loaded_catalogues of the main process
+    :return: nothing
+    """
+    loaded_catalogues.update(catalogues)
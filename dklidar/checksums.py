@@ -0,0 +1,193 @@
+### Checksums of files and folder trees for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Files are hashed with large buffered reads, in parallel across files using threads (the hash functions release
+# the GIL while hashing large buffers, so no worker processes are needed). Besides md5 (compatible with the checksums
+# supplied with the downloads and used for the archives) the faster blake2b (hashlib), xxh3 (xxhash) and blake3
+# (blake3) hashes are available; the latter two are optional dependencies.
+# The checksums of a tree are kept in a sqlite checksum manifest, keyed by the path relative to the root of the tree,
+# the file size and modification time. Unchanged files are never hashed twice, and two trees (e.g. the source and
+# destination of a copy) can be compared by comparing their manifests.
+
+## Imports
+import os
+import re
+import sqlite3
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+from dklidar import settings
+from dklidar.backends import xxhash, blake3
+
+# Hash algorithms
+algorithms = ['md5', 'blake2b', 'xxh3', 'blake3']
+
+##### Function definitions
+
+## Create a new hash object
+def new_hash(algorithm = 'md5'):
+    """
+    :param algorithm: one of 'md5', 'blake2b', 'xxh3' (requires xxhash) or 'blake3' (requires blake3)
+    :return: hash object with update() and hexdigest() methods
+    """
+    if algorithm == 'md5':
+        return hashlib.md5()
+    elif algorithm == 'blake2b':
+        return hashlib.blake2b()
+    elif algorithm == 'xxh3':
+        return xxhash.xxh3_128()
+    elif algorithm == 'blake3':
+        return blake3.blake3()
+    raise ValueError('Unknown hash algorithm: ' + str(algorithm))
+
+
+## Hash a file
+def file_hash(file_name, algorithm = 'md5', buffer_size = None):
+    """
+    Hashes a file reading it in large blocks into a single re-used buffer.
+    :param file_name: path to the file
+    :param algorithm: hash algorithm (see new_hash())
+    :param buffer_size: number of bytes read at a time, defaults to settings.checksum_buffer_size
+    :return: checksum as hex string
+    """
+    if buffer_size is None: buffer_size = settings.checksum_buffer_size
+    checksum = new_hash(algorithm)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    in_file = open(file_name, 'rb')
+    n_bytes = in_file.readinto(buffer)
+    while n_bytes:
+        checksum.update(view[:n_bytes])
+        n_bytes = in_file.readinto(buffer)
+    in_file.close()
+    return checksum.hexdigest()
+
+
+## Hash a file (for use with a thread pool)
+def hash_file_task(task):
+    """
+    :param task: tuple of (root, relative path, size, mtime, algorithm)
+    :return: tuple of (relative path, size, mtime, algorithm, checksum), checksum is None if the file can't be read
+    """
+    root, path, size, mtime, algorithm = task
+    try:
+        checksum = file_hash(root + '/' + path, algorithm)
+    except (IOError, OSError):
+        checksum = None
+    return path, size, mtime, algorithm, checksum
+
+
+## Open (and if needed create) a checksum manifest
+def open_checksum_manifest(manifest_file = None):
+    """
+    :param manifest_file: path to the manifest, defaults to settings.checksum_manifest_file
+    :return: sqlite3 connection to the manifest
+    """
+    if manifest_file is None: manifest_file = settings.checksum_manifest_file
+    connection = sqlite3.connect(manifest_file)
+    connection.execute('CREATE TABLE IF NOT EXISTS checksums (path TEXT, size INTEGER, mtime REAL, algorithm TEXT, '
+                       'checksum TEXT, PRIMARY KEY (path, algorithm))')
+    connection.commit()
+    return connection
+
+
+## List the files in a tree
+def scan_tree(root, pattern = None):
+    """
+    :param root: root folder of the tree
+    :param pattern: optional regular expression the relative paths have to match, e.g. '\.tif$'
+    :return: list of (relative path, size, mtime) tuples, paths with forward slashes
+    """
+    files = []
+    for folder, sub_folders, file_names in os.walk(root):
+        for file_name in file_names:
+            full_path = os.path.join(folder, file_name)
+            path = re.sub('\\\\', '/', os.path.relpath(full_path, root))
+            if pattern is not None and not re.search(pattern, path): continue
+            stat = os.stat(full_path)
+            files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+## Hash all files in a tree, skipping the files that are unchanged since they were last hashed
+def hash_tree(root, manifest_file = None, algorithm = None, pattern = None, n_threads = None):
+    """
+    :param root: root folder of the tree
+    :param manifest_file: path to the checksum manifest of the tree, defaults to settings.checksum_manifest_file
+    :param algorithm: hash algorithm (see new_hash()), defaults to settings.checksum_algorithm
+    :param pattern: optional regular expression the relative paths have to match
+    :param n_threads: number of parallel threads, defaults to settings.checksum_n_threads
+    :return: dictionary of relative path -> checksum of the files in the tree (None for unreadable files)
+    """
+    if algorithm is None: algorithm = settings.checksum_algorithm
+    if n_threads is None: n_threads = settings.checksum_n_threads
+    root = re.sub('[\\\\/]+$', '', re.sub('\\\\', '/', root))
+    connection = open_checksum_manifest(manifest_file)
+
+    # Determine which files are new or changed
+    files = scan_tree(root, pattern)
+    records = dict([(row[0], row[1:]) for row in
+                    connection.execute('SELECT path, size, mtime, checksum FROM checksums WHERE algorithm = ?',
+                                       (algorithm,))])
+    tasks = [(root, path, size, mtime, algorithm) for path, size, mtime in files
+             if path not in records or records[path][0] != size or records[path][1] != mtime
+             or records[path][2] is None]
+
+    # Hash new and changed files
+    if n_threads > 1 and len(tasks) > 1:
+        pool = ThreadPool(processes = n_threads)
+        results = pool.imap_unordered(hash_file_task, tasks, chunksize = 16)
+    else:
+        pool = None
+        results = (hash_file_task(task) for task in tasks)
+    batch = []
+    for result in results:
+        batch.append(result)
+        if len(batch) >= 1000:
+            connection.executemany('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)', batch)
+            connection.commit()
+            batch = []
+    connection.executemany('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)', batch)
+    connection.commit()
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Remove files that no longer exist
+    existing = set([path for path, size, mtime in files])
+    connection.executemany('DELETE FROM checksums WHERE path = ? AND algorithm = ?',
+                           [(path, algorithm) for path in records if path not in existing])
+    connection.commit()
+
+    checksums = dict(connection.execute('SELECT path, checksum FROM checksums WHERE algorithm = ?', (algorithm,)))
+    connection.close()
+    return checksums
+
+
+## Read the checksums from a manifest
+def read_checksums(manifest_file, algorithm = None):
+    """
+    :param manifest_file: path to the checksum manifest
+    :param algorithm: hash algorithm, defaults to settings.checksum_algorithm
+    :return: dictionary of relative path -> checksum
+    """
+    if algorithm is None: algorithm = settings.checksum_algorithm
+    connection = open_checksum_manifest(manifest_file)
+    checksums = dict(connection.execute('SELECT path, checksum FROM checksums WHERE algorithm = ?', (algorithm,)))
+    connection.close()
+    return checksums
+
+
+## Compare the checksums of two trees
+def compare_checksums(checksums_a, checksums_b):
+    """
+    :param checksums_a: dictionary of relative path -> checksum of the first tree (e.g. from hash_tree())
+    :param checksums_b: dictionary of relative path -> checksum of the second tree
+    :return: dictionary with the sorted lists of relative paths 'missing_in_b', 'missing_in_a' and 'mismatch'
+    """
+    paths_a = set(checksums_a.keys())
+    paths_b = set(checksums_b.keys())
+    return {'missing_in_b': sorted(paths_a - paths_b),
+            'missing_in_a': sorted(paths_b - paths_a),
+            'mismatch': sorted([path for path in paths_a & paths_b
+                                if checksums_a[path] is None or checksums_a[path] != checksums_b[path]])}
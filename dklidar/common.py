@@ -4,13 +4,16 @@
 # Imports
 import os
 import glob
-import pandas
 import re
 import shutil
 import datetime
 import subprocess
+import time
+import numpy
 
 from dklidar import settings
+from dklidar import tilegrid
+from dklidar.backends import pandas, gdal
 
 ## Function definitons
 
@@ -141,18 +144,21 @@ def gather_logs(script_name, step_name, tile_id):
     where it stores them in a sub-subfolder according to the step_name and tile_id parameters.
     :param script_name: name of the script that is calling the function
     :param step_name: name of the step that should be logged for
-    :param tile_id: tile id in the usual format (rrrr_ccc)
+    :param tile_id: tile id in the usual format (rrrr_ccc), or list of tile ids for a step processing a batch of
+    tiles (the logs are copied to the folder of each tile)
     :return: nothing
     """
-    # Generate string for log folder for the tile and create the directory if it does not exist
-    log_folder_tile = settings.log_folder + '/' + script_name + '/' + tile_id
-    if not os.path.exists(log_folder_tile):
-        os.mkdir(log_folder_tile)
-
-    # Generate string for log folder and create the directory if it does not exist
-    log_folder_step = log_folder_tile + '/' + step_name
-    if not os.path.exists(log_folder_step):
-        os.mkdir(log_folder_step)
+    # Generate strings for the log folders of the tiles and the step and create the directories if they do not exist
+    tile_ids = tile_id if isinstance(tile_id, list) else [tile_id]
+    log_folders_step = []
+    for tile_id in tile_ids:
+        log_folder_tile = settings.log_folder + '/' + script_name + '/' + tile_id
+        if not os.path.exists(log_folder_tile):
+            os.mkdir(log_folder_tile)
+        log_folder_step = log_folder_tile + '/' + step_name
+        if not os.path.exists(log_folder_step):
+            os.mkdir(log_folder_step)
+        log_folders_step.append(log_folder_step)
 
     # Confirm function is executed from temporary work dir using regex
     wd = os.getcwd()
@@ -165,25 +171,159 @@ def gather_logs(script_name, step_name, tile_id):
     # Check whether dklidar logfile exists if yes copy:
     if os.path.exists(wd + '/log.txt'):
         # copy file to tile log directory
-        shutil.copy(wd + '/log.txt', log_folder_step)
+        for log_folder_step in log_folders_step: shutil.copy(wd + '/log.txt', log_folder_step)
         # remove log file from temp directory
         os.remove(wd + '/log.txt')
 
     # Check whether opalslog logfile exists if yes copy:
     if os.path.exists(wd + '/opalsLog.xml'):
         # copy file to tile log directory
-        shutil.copy(wd + '/opalsLog.xml', log_folder_step)
+        for log_folder_step in log_folders_step: shutil.copy(wd + '/opalsLog.xml', log_folder_step)
         # remove log file from temp directory
         os.remove(wd + '/opalsLog.xml')
 
     # Check whether opalsError logfile exists if yes copy:
     if os.path.exists(wd + '/opalsErrors.txt'):
         # copy file to tile log directory
-        shutil.copy(wd + '/opalsErrors.txt', log_folder_step)
+        for log_folder_step in log_folders_step: shutil.copy(wd + '/opalsErrors.txt', log_folder_step)
         # remove log file from temp directory
         os.remove(wd + '/opalsErrors.txt')
 
 
+## Function to record a step completion event for the progress monitor
+def log_progress_event(script_name, tile_id, step_name, status):
+    """
+    Appends a single step completion event to the progress event log of a processing script. Each worker process
+    writes to its own event file (log/<script_name>/events/events_<pid>.csv), so no file locking is needed and the
+    progress monitor can tail the files incrementally rather than crawling the tile log folders.
+    Events are written as comma separated lines without header: unix time stamp, tile_id, step_name, status.
+    :param script_name: name of the processing script that is calling the function
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param step_name: name of the processing step that was completed
+    :param status: execution status returned by the processing step
+    :return: nothing
+    """
+    # Generate string for event folder and create the directory if it does not exist
+    events_folder = settings.log_folder + '/' + script_name + '/events'
+    if not os.path.exists(events_folder):
+        try:
+            os.mkdir(events_folder)
+        except OSError:
+            # another worker was faster
+            pass
+
+    # Commas and line breaks would break the event format, so strip them from the status
+    status = re.sub('[,\r\n]', ';', str(status))
+
+    # Append event to the event file of this process
+    event_file = open(events_folder + '/events_' + str(os.getpid()) + '.csv', 'a')
+    event_file.write('%.3f' % time.time() + ',' + tile_id + ',' + step_name + ',' + status + '\n')
+    event_file.close()
+
+
+## Function to write an array as a raster for a tile
+def write_tile_raster(values, out_file, tile_id, data_type = 'Int16', no_data = -9999, band_names = None,
+                      creation_options = None):
+    """
+    Writes a 2D array (or a 3D array of bands) covering the extent of a tile as a GeoTiff (in-process, no temporary
+    files or gdal binaries). The cell size is derived from the size of the array. NaN values are written as no data.
+    :param values: 2D array (north up) covering the tile, or 3D array with the bands along the first axis
+    :param out_file: path of the output raster
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param data_type: gdal data type name of the output, e.g. 'Int16', 'Int32' or 'Float32'
+    :param no_data: no data value of the output
+    :param band_names: optional list of band descriptions
+    :param creation_options: optional list of GTiff creation options, e.g. ['TILED=YES', 'COMPRESS=DEFLATE']
+    :return: nothing
+    """
+    xmin, ymin, xmax, ymax = tilegrid.tile_bounds(tile_id)
+    if values.ndim == 2: values = values[numpy.newaxis]
+    n_bands, n_rows, n_cols = values.shape
+    values = numpy.where(numpy.isnan(values), no_data, values) if values.dtype.kind == 'f' else values
+
+    driver = gdal.GetDriverByName('GTiff')
+    out_raster = driver.Create(out_file, n_cols, n_rows, n_bands, getattr(gdal, 'GDT_' + data_type),
+                               options = creation_options if creation_options is not None else [])
+    out_raster.SetGeoTransform((xmin, (xmax - xmin) / float(n_cols), 0, ymax, 0, -(ymax - ymin) / float(n_rows)))
+    out_raster.SetProjection(settings.crs_wkt_gdal)
+    for band in range(n_bands):
+        out_band = out_raster.GetRasterBand(band + 1)
+        out_band.SetNoDataValue(no_data)
+        if band_names is not None: out_band.SetDescription(band_names[band])
+        out_band.WriteArray(values[band])
+        out_band.FlushCache()
+        out_band = None
+    out_raster = None
+
+
+## Function to crop a raster to a tile
+def crop_raster_to_tile(in_file, out_file, tile_id, halo = 0):
+    """
+    Crops a raster aligned to the tile grid (e.g. a neighbourhood mosaic) to a tile using a source window derived from
+    the tile id and the geo transform of the raster (in-process, no footprint file or gdalwarp cutline required).
+    :param in_file: path of the input raster
+    :param out_file: path of the output raster (GeoTiff)
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param halo: number of cells to include around the tile
+    :return: nothing, raises an exception if the cropping failed
+    """
+    in_raster = gdal.Open(in_file.strip())
+    if in_raster is None:
+        raise Exception('Unable to open raster: ' + in_file)
+    window = tilegrid.pixel_window(tile_id, in_raster.GetGeoTransform(), halo)
+    out_raster = gdal.Translate(out_file.strip(), in_raster, format = 'GTiff', srcWin = list(window))
+    if out_raster is None:
+        raise Exception('gdal.Translate failed for: ' + in_file)
+    out_raster = None
+    in_raster = None
+
+
+## Function to read a single band raster into an array
+def read_raster(in_file):
+    """
+    :param in_file: path of the input raster
+    :return: tuple of (2D float64 array (north up) with no data as NaN, gdal geo transform of the raster)
+    """
+    in_raster = gdal.Open(in_file.strip())
+    if in_raster is None:
+        raise Exception('Unable to open raster: ' + in_file)
+    band = in_raster.GetRasterBand(1)
+    values = band.ReadAsArray().astype(numpy.float64)
+    no_data = band.GetNoDataValue()
+    if no_data is not None:
+        values[values == no_data] = numpy.nan
+    geo_transform = in_raster.GetGeoTransform()
+    band = None
+    in_raster = None
+    return values, geo_transform
+
+
+## Function to read the window of a tile from a raster
+def read_tile_window(in_file, tile_id, halo = 0):
+    """
+    Reads only the cells covering a tile (plus halo) from a raster aligned to the tile grid.
+    :param in_file: path of the input raster
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param halo: number of cells to include around the tile, the raster has to cover the tile plus halo
+    :return: 2D float64 array (north up) with no data as NaN
+    """
+    in_raster = gdal.Open(in_file.strip())
+    if in_raster is None:
+        raise Exception('Unable to open raster: ' + in_file)
+    col_start, row_start, n_cols, n_rows = tilegrid.pixel_window(tile_id, in_raster.GetGeoTransform(), halo)
+    if col_start < 0 or row_start < 0 or col_start + n_cols > in_raster.RasterXSize or \
+            row_start + n_rows > in_raster.RasterYSize:
+        raise ValueError('Raster does not cover tile ' + tile_id + ': ' + in_file)
+    band = in_raster.GetRasterBand(1)
+    values = band.ReadAsArray(col_start, row_start, n_cols, n_rows).astype(numpy.float64)
+    no_data = band.GetNoDataValue()
+    if no_data is not None:
+        values[values == no_data] = numpy.nan
+    band = None
+    in_raster = None
+    return values
+
+
 ## Function to generate sea and inland water masks for a tile
 def generate_water_masks(tile_id):
     """
@@ -278,6 +418,10 @@ def generate_water_masks(tile_id):
                          stderr=subprocess.STDOUT) + \
                      '\n' + inland_mask_file + ' inland water mask created. \n\n ')
 
+        # Apply output profile
+        apply_output_profile(sea_mask_file)
+        apply_output_profile(inland_mask_file)
+
         # Remove temporary files
         temp_file_list = glob.glob(os.getcwd() + '/temp*.*')
         for file in temp_file_list: os.remove(file)
@@ -379,4 +523,47 @@ def apply_mask(target_raster = '', sea_mask = False, inland_water_mask = False):
     # Close log file
     log_file.close()
 
+    # Apply output profile (mask application is the last step for each raster output)
+    if apply_output_profile(target_raster) != 'success':
+        return_value = 'gdalError'
+
+    return return_value
+
+
+## Function to apply the output profile to a raster output
+def apply_output_profile(target_raster):
+    """
+    Rewrites a raster output with the driver and creation options of the output profile set in the settings
+    (settings.output_profile), e.g. as a Cloud Optimised GeoTiff. Nothing is done for the default 'gtiff' profile.
+    The intermediate raster is written to the working directory (the temporary directory of the worker), so no
+    temporary files are left in the output folders if the processing fails.
+    :param target_raster: target raster file path
+    :return: execution status
+    """
+    profile = settings.output_profiles[settings.output_profile]
+    if profile['driver'] == 'GTiff' and len(profile['creation_options']) == 0:
+        return 'success'
+
+    # Initiate log output
+    log_file = open('log.txt', 'a+')
+
+    target_raster = target_raster.strip()
+    temp_file = os.getcwd() + '/' + re.sub('\.tif$', '', os.path.basename(target_raster)) + '_profile_temp.tif'
+    try:
+        out_raster = gdal.Translate(temp_file, target_raster, format = profile['driver'],
+                                    creationOptions = profile['creation_options'])
+        if out_raster is None: raise Exception('gdal.Translate failed.')
+        out_raster = None
+        shutil.copyfile(temp_file, target_raster)
+        os.remove(temp_file)
+        log_file.write('\n' + target_raster + ' output profile "' + settings.output_profile + '" applied. \n\n ')
+        return_value = 'success'
+    except:
+        log_file.write('\n' + target_raster + ' applying output profile failed. \n\n ')
+        if os.path.exists(temp_file): os.remove(temp_file)
+        return_value = 'gdalError'
+
+    # Close log file
+    log_file.close()
+
     return return_value
@@ -0,0 +1,183 @@
+### Functions for exporting the EcoDes-DK outputs into a national data cube for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The data cube is a Zarr group with one 2D array per output variable (see variables.py), all on the common 10 m
+# ETRS89 / UTM zone 32N grid covering settings.cube_extent. The arrays are chunked in 100 x 100 cells, i.e. one chunk
+# per 1 km tile. As the cube extent is aligned to the tile grid, each tile maps onto exactly one chunk of each array
+# and every chunk is only ever written by the worker processing that tile. Workers can therefore write their tiles
+# concurrently without any locking. The metadata of the group is consolidated into a single file, so opening the
+# cube only needs a single read.
+
+## Imports
+import os
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import variables
+from dklidar.backends import zarr, numcodecs
+
+# Numpy data types of the gdal data types in the variable registry
+numpy_data_types = {'Int16': 'int16',
+                    'Int32': 'int32',
+                    'Float32': 'float32'}
+
+# No data value of the arrays (same as for the GeoTiff outputs)
+no_data = -9999
+
+##### Function definitions
+
+## Shape of the cube arrays
+def cube_shape(cell_size = None):
+    """
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (n_rows, n_cols) of the arrays in the cube
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = settings.cube_extent
+    return int(round((ymax - ymin) / float(cell_size))), int(round((xmax - xmin) / float(cell_size)))
+
+
+## Geo transform of the cube arrays
+def cube_transform(cell_size = None):
+    """
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: gdal style geo transform (x_origin, cell_size, 0, y_origin, 0, -cell_size) of the arrays in the cube
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = settings.cube_extent
+    return (xmin, float(cell_size), 0, ymax, 0, -float(cell_size))
+
+
+## Array window of a tile
+def tile_window(tile_id, cell_size = None):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (row slice, column slice) of the tile in the cube arrays
+    """
+    return bounds_window(tilegrid.tile_bounds(tile_id), cell_size)
+
+
+## Array window of a bounding box
+def bounds_window(bounds, cell_size = None):
+    """
+    :param bounds: tuple of (xmin, ymin, xmax, ymax) in m, must be aligned to the cell grid
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (row slice, column slice) of the bounding box in the cube arrays
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    cube_xmin, cube_ymin, cube_xmax, cube_ymax = settings.cube_extent
+    xmin, ymin, xmax, ymax = bounds
+    if xmin < cube_xmin or ymin < cube_ymin or xmax > cube_xmax or ymax > cube_ymax:
+        raise ValueError('Bounds ' + str(bounds) + ' outside of the cube extent ' + str(settings.cube_extent))
+    row_start = int(round((cube_ymax - ymax) / float(cell_size)))
+    row_end = int(round((cube_ymax - ymin) / float(cell_size)))
+    col_start = int(round((xmin - cube_xmin) / float(cell_size)))
+    col_end = int(round((xmax - cube_xmin) / float(cell_size)))
+    return slice(row_start, row_end), slice(col_start, col_end)
+
+
+## Create an empty cube
+def create_cube(cube_file = None, names = None, overwrite = False):
+    """
+    Creates the cube with one empty array per variable. No chunks are written, empty chunks read as no data.
+    :param cube_file: path to the cube, defaults to settings.cube_file
+    :param names: names of the variables to include, defaults to all variables in the registry
+    :param overwrite: overwrite an existing cube
+    :return: path to the cube
+    """
+    if cube_file is None: cube_file = settings.cube_file
+    if names is None: names = [variable[0] for variable in variables.variables]
+    n_rows, n_cols = cube_shape()
+    chunk_size = int(tilegrid.tile_size / settings.out_cell_size)
+    compressor = numcodecs.Blosc(cname = settings.cube_compression, clevel = settings.cube_compression_level,
+                                 shuffle = numcodecs.Blosc.BITSHUFFLE)
+
+    cube = zarr.open_group(cube_file, mode = 'w' if overwrite else 'w-')
+    cube.attrs.update({'crs_wkt': settings.crs_wkt_gdal,
+                       'geo_transform': list(cube_transform()),
+                       'extent': list(settings.cube_extent),
+                       'cell_size': settings.out_cell_size,
+                       'tile_size': tilegrid.tile_size,
+                       'no_data': no_data})
+    for name in names:
+        name, folder, data_type, theme = variables.variable_info[name]
+        array = cube.create_dataset(name, shape = (n_rows, n_cols), chunks = (chunk_size, chunk_size),
+                                    dtype = numpy_data_types[data_type], fill_value = no_data,
+                                    compressor = compressor)
+        array.attrs.update({'folder': folder, 'theme': theme, 'data_type': data_type})
+    zarr.consolidate_metadata(cube_file)
+    return cube_file
+
+
+## Open the cube
+def open_cube(cube_file = None, mode = 'r'):
+    """
+    :param cube_file: path to the cube, defaults to settings.cube_file
+    :param mode: 'r' for read only, 'r+' for writing tiles
+    :return: zarr group of the cube (opened from the consolidated metadata)
+    """
+    if cube_file is None: cube_file = settings.cube_file
+    return zarr.open_consolidated(cube_file, mode = mode)
+
+
+## Write the outputs of a tile into the cube
+def write_tile(tile_id, cube_file = None, names = None):
+    """
+    Writes the outputs of a tile (single band or stacked layout) into the chunk of the tile in each array of the
+    cube. Variables without an output for the tile are skipped. Each variable is written on its own, so a failure
+    only affects that variable. Safe to run for different tiles concurrently.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cube_file: path to the cube, defaults to settings.cube_file
+    :param names: names of the variables to write, defaults to all arrays in the cube
+    :return: execution status, 'gdalError: ' followed by the names of the variables that failed (comma separated)
+    """
+    try:
+        cube = open_cube(cube_file, mode = 'r+')
+        rows, cols = tile_window(tile_id)
+        if names is None: names = list(cube.array_keys())
+    except Exception:
+        return 'gdalError: ' + ', '.join(names if names is not None else ['cube'])
+
+    failed = []
+    for name in names:
+        try:
+            if not os.path.exists(variables.variable_file(name, tile_id)) and \
+                    not os.path.exists(variables.stack_file(variables.variable_info[name][3], tile_id)):
+                continue
+            values = variables.read_variable(name, tile_id)
+            array = cube[name]
+            values[numpy.isnan(values)] = no_data
+            array[rows, cols] = values.astype(array.dtype)
+        except Exception:
+            failed.append(name)
+    if len(failed) > 0:
+        return 'gdalError: ' + ', '.join(failed)
+    return 'success'
+
+
+## Read a window from the cube
+def read_window(name, bounds, cube = None):
+    """
+    :param name: variable name
+    :param bounds: tuple of (xmin, ymin, xmax, ymax) in m, must be aligned to the cell grid
+    :param cube: zarr group of the cube (see open_cube()), defaults to opening settings.cube_file
+    :return: tuple of (float64 array with no data values set to NaN, gdal style geo transform of the window)
+    """
+    if cube is None: cube = open_cube()
+    rows, cols = bounds_window(bounds)
+    values = cube[name][rows, cols].astype(numpy.float64)
+    values[values == no_data] = numpy.nan
+    return values, (bounds[0], float(settings.out_cell_size), 0, bounds[3], 0, -float(settings.out_cell_size))
+
+
+## Read a tile from the cube
+def read_tile(name, tile_id, cube = None):
+    """
+    :param name: variable name
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cube: zarr group of the cube (see open_cube()), defaults to opening settings.cube_file
+    :return: float64 array with no data values set to NaN
+    """
+    return read_window(name, tilegrid.tile_bounds(tile_id), cube)[0]
@@ -4,21 +4,29 @@
 import os
 import subprocess
 import re
-import pandas
-import opals
 import glob
 import time
 import shutil
+import numpy
 
 from dklidar import settings
 from dklidar import common
+from dklidar import tilegrid
+from dklidar import catalogue
+from dklidar import blocks
+from dklidar import footprints
+# openness, hydrology and terrain also register their derivatives for the block processing (see blocks.py)
+from dklidar import openness
+from dklidar import hydrology
+from dklidar import terrain
+from dklidar.backends import opals, pandas
 
 #### Function definitions
 
 ## Generate tile footprint
 def dtm_generate_footprint(tile_id):
     """
-    Generates a footprint file using gdal.
+    Generates a footprint file from the header of the DTM tile in-process (see footprints.py).
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
     :return execution status
     """
@@ -28,13 +36,10 @@ def dtm_generate_footprint(tile_id):
     log_file = open('log.txt', 'a')
 
     try:
-        cmd = settings.gdaltlindex_bin + \
-          settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-          settings.dtm_folder + '/DTM_1km_' + tile_id + '.tif'
-        cmd_return = subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
-        log_file.write( '\n' + tile_id + ' footprint generation... \n' +
-                        cmd_return + \
-                        '\n' + tile_id + ' successful.\n\n')
+        bounds = footprints.raster_bounds(settings.dtm_folder + '/DTM_1km_' + tile_id + '.tif')
+        footprints.write_footprints(settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp',
+                                    [(tile_id, bounds)])
+        log_file.write('\n' + tile_id + ' footprint generation... \n' + tile_id + ' successful.\n\n')
         return_value = 'success'
     except:
         log_file.write('\n' + tile_id + ' footprint generation failed. \n')
@@ -62,27 +67,9 @@ def dtm_neighbourhood_mosaic(tile_id):
     # get current (temporary) work directory
     temp_wd = os.getcwd()
 
-    # Retrieve row and col numbers for the current tile_id
-    center_row = int(re.sub('(\d+)_\d+', '\g<1>', tile_id))
-    center_col = int(re.sub('\d+_(\d+)', '\g<1>', tile_id))
-
-    # Determine row and column numbers for tiles in the 3 x 3 window
-    rows_to_load = [center_row - 1, center_row, center_row + 1]
-    cols_to_load = [center_col - 1, center_col, center_col + 1]
-
-    # Generate list of tile_ids for tiles to load
-    tiles_to_load = []
-    for row in rows_to_load:
-        for col in cols_to_load:
-            tile_to_load = str(row) + '_' + str(col)
-            tiles_to_load.extend([tile_to_load])
-
-    # Prep filenames and check if files exists:
-    tile_file_names = []
-    for tile_to_load in tiles_to_load:
-        tile_file_name = settings.dtm_folder + '/DTM_1km_' + tile_to_load + '.tif'
-        if os.path.exists(tile_file_name):
-            tile_file_names.append(tile_file_name)
+    # Look up the available tiles in the 3 x 3 neighbourhood in the dtm catalogue
+    dtm_catalogue = catalogue.get_catalogue('dtm')
+    tile_file_names = dtm_catalogue.file_paths(dtm_catalogue.neighbours(tile_id))
     n_neighbours = len(tile_file_names)
     tile_file_names = ' '.join(tile_file_names)
 
@@ -163,7 +150,8 @@ def dtm_validate_crs(tile_id, mosaic = True):
 ## Aggregate dem to 10 m
 def dtm_aggregate_tile(tile_id):
     """
-    Aggregates the 0.4 m DTM to 10 m size for final output and further calculations.
+    Aggregates the 0.4 m DTM to 10 m size for final output and further calculations. The aggregation (average) is
+    carried out in-process with settings.n_threads threads (see blocks.read_dtm_window()).
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
     :return: execution status
     """
@@ -172,37 +160,21 @@ def dtm_aggregate_tile(tile_id):
     return_value = ''
     log_file = open('log.txt', 'a+')
 
-    # get temporary work directory
-    wd = os.getcwd()
-
     # Prepare output folder
     out_folder = settings.output_folder + '/dtm_10m'
     if not os.path.exists(out_folder): os.mkdir(out_folder)
 
     try:
-        ## Aggregate dtm to temporary file:
-        # Specify gdal command
-        cmd = settings.gdalwarp_bin + \
-              '-tr 10 10 -r average ' + \
-              settings.dtm_folder + '/DTM_1km_' + tile_id + '.tif ' + \
-              wd + '/dtm_10m_' + tile_id + '_float.tif '
-
-        # Execute gdal command
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' aggregating dtm_10m successful.\n\n')
+        ## Aggregate dtm
+        dtm_10m = blocks.read_dtm_window(tilegrid.tile_bounds(tile_id))
+        if dtm_10m is None: raise Exception('No DTM for tile ' + tile_id)
+        log_file.write('\n' + tile_id + ' aggregating dtm_10m successful.\n\n')
 
         out_file = out_folder + '/dtm_10m_' + tile_id + '.tif'
 
         # Stretch by 100, round and store as int16
-        # Specify gdal command
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/dtm_10m_' + tile_id + '_float.tif ' + \
-              ' --outfile=' + out_file + \
-              ' --calc=rint(100*A)' + ' --type=Int16' + ' --NoDataValue=-9999'
-
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' converting dtm_10m to int16... \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
+        common.write_tile_raster(numpy.rint(100 * dtm_10m), out_file, tile_id, 'Int16')
+        log_file.write('\n' + tile_id + ' converting dtm_10m to int16... \n')
 
         # Apply mask(s)
         common.apply_mask(out_file)
@@ -215,12 +187,6 @@ def dtm_aggregate_tile(tile_id):
     # Close log file
     log_file.close()
 
-    # Remove temporary files
-    try:
-        os.remove(wd + '/dtm_10m_' + tile_id + '_float.tif')
-    except:
-        pass
-
     return return_value
 
 ## Aggregate dem mosaic to 10 m
@@ -292,13 +258,9 @@ def dtm_calc_slope(tile_id):
                      subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
 
         # Crop slope mosaic output to original tile size 
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-               '-crop_to_cutline -overwrite ' + \
-              wd + '/slope_' + tile_id + '_mosaic.tif ' + \
-              wd + '/slope_' + tile_id + '_mosaic_cropped.tif '
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropped slope.\n\n')
+        common.crop_raster_to_tile(wd + '/slope_' + tile_id + '_mosaic.tif ',
+                                   wd + '/slope_' + tile_id + '_mosaic_cropped.tif ', tile_id)
+        log_file.write('\n' + tile_id + ' cropped slope.\n\n')
 
         # Round and store slope as int16
         cmd = settings.gdal_calc_bin + \
@@ -360,13 +322,9 @@ def dtm_calc_aspect(tile_id, slope_zero = 'nodata'):
                      subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
 
         # Crop aspect output to original tile size 
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              '-crop_to_cutline -overwrite ' + \
-              wd + '/aspect_' + tile_id + '_mosaic.tif ' + \
-              wd + '/aspect_' + tile_id + '_mosaic_cropped.tif '
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                 '\n' + tile_id + ' aspect mosaic cropped.\n\n')
+        common.crop_raster_to_tile(wd + '/aspect_' + tile_id + '_mosaic.tif ',
+                                   wd + '/aspect_' + tile_id + '_mosaic_cropped.tif ', tile_id)
+        log_file.write('\n' + tile_id + ' aspect mosaic cropped.\n\n')
 
         # Set aspect for cells slope = 0 if the value is not nodata
         if slope_zero != 'nodata':
@@ -379,13 +337,9 @@ def dtm_calc_aspect(tile_id, slope_zero = 'nodata'):
                      subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
         	
             # Crop slope mosaic
-            cmd = settings.gdalwarp_bin + \
-                  ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-                  '-crop_to_cutline -overwrite ' + \
-                  wd + '/slope_' + tile_id + '_mosaic.tif ' + \
-                  wd + '/slope_' + tile_id + '_mosaic_cropped.tif '
-            log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' slope mosaic cropped.\n\n')
+            common.crop_raster_to_tile(wd + '/slope_' + tile_id + '_mosaic.tif ',
+                                       wd + '/slope_' + tile_id + '_mosaic_cropped.tif ', tile_id)
+            log_file.write('\n' + tile_id + ' slope mosaic cropped.\n\n')
         
             # Prepare mask from slope raster for slope = 0
             cmd = settings.gdal_calc_bin + \
@@ -708,101 +662,98 @@ def dtm_calc_solar_radiation(tile_id):
     return return_value
 
 
+## Calculate slope, aspect, heat load index and solar radiation in one pass
+def dtm_terrain_indices(tile_id, slope_zero = 'nodata', indices = None):
+    """
+    Calculates slope, aspect, heat load index and solar radiation (McCune and Keon 2002) for a tile in-process from
+    one 10 m DTM window covering the tile plus a one cell halo (see terrain.py). Heat load index and solar radiation
+    are derived from the unrounded slope and aspect. Replaces dtm_calc_slope(), dtm_calc_aspect(),
+    dtm_calc_heat_index() and dtm_calc_solar_radiation(). The window is read from the DTM tiles (see blocks.py).
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param slope_zero: value in degrees assigned to the aspect of cells with slope = 0 or 'nodata'
+    :param indices: terrain indices of the tile calculated for a batch of tiles (see dtm_process_batch()), if None
+    they are calculated for the tile
+    :return: execution status
+    """
+
+    # Initiate return value and log output
+    return_value = ''
+    log_file = open('log.txt', 'a+')
+
+    # Outputs: folder / file prefix, scaling factor and data type
+    outputs = [('slope', 10, 'Int16'),
+               ('aspect', 10, 'Int16'),
+               ('heat_load_index', 10000, 'Int16'),
+               ('solar_radiation', 1000000, 'Int32')]
+
+    try:
+        # Read DTM window covering the tile plus one cell and calculate indices
+        if indices is None:
+            indices = blocks.process_block('terrain_indices', tilegrid.tile_bounds(tile_id), slope_zero = slope_zero)
+        if indices is None: raise Exception('No DTM for tile ' + tile_id)
+        log_file.write('\n' + tile_id + ' terrain indices calculated. \n')
+
+        # Stretch, round and export
+        for name, factor, data_type in outputs:
+            out_folder = settings.output_folder + '/' + name
+            if not os.path.exists(out_folder): os.mkdir(out_folder)
+            out_file = out_folder + '/' + name + '_' + tile_id + '.tif'
+            common.write_tile_raster(numpy.rint(factor * indices[name]), out_file, tile_id, data_type)
+
+            # Apply mask(s)
+            common.apply_mask(out_file)
+            log_file.write('\n' + tile_id + ' ' + name + ' exported. \n')
+
+        return_value = 'success'
+
+    except:
+        log_file.write('\n' + tile_id + ' terrain indices calculation failed. \n\n')
+        return_value = 'gdalError'
+
+    # Close log file
+    log_file.close()
+
+    return return_value
+
+
 ## Calculate landscape openness mean
-def dtm_openness_mean(tile_id):
+def dtm_openness_mean(tile_id, results = None):
     """
     Exports the mean landscape openness for all eight cardinal directions with a 150 m search radius
-    using the OPALS Openness module.
+    calculated in-process (see openness.py) on the DTM of the tile plus a 150 m halo (see blocks.py).
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param results: openness of the tile calculated for a batch of tiles (see dtm_process_batch()), if None it is
+    calculated for the tile
     :return: execution status
     """
     # Initiate return value
     return_value = ''
     log_file = open('log.txt', 'a+')
 
-    # Get working directory
-    wd = os.getcwd()
-
     # Generate folder paths
     out_folder = settings.output_folder + '/openness_mean'
     if not os.path.exists(out_folder): os.mkdir(out_folder)
 
     # Attempt calculation of mean openness
     try:
-  
-        # Initialise Opals Openness Module
-        export_openness = opals.Openness.Openness()
-
-        # Export positive openness for a given cell cell with a search radius of 150 m (15 cells)
-        export_openness.inFile = settings.dtm_mosaics_10m_folder + '/dtm_' + tile_id + '_float_mosaic_10m.tif '
-        export_openness.outFile = wd + '/openness_150m_' + tile_id + '_mosaic.tif '
-        export_openness.feature = opals.Types.OpennessFeature.positive
-        export_openness.kernelSize = 15  # 15 x 10 m = 150 m
-        export_openness.selMode = 0
-        export_openness.noData = -9999
-        export_openness.commons.screenLogLevel = opals.Types.LogLevel.none
-        export_openness.commons.nbThreads = settings.nbThreads
-        export_openness.run()
+        # Calculate positive openness with a search radius of 150 m (15 cells) on the 10 m DTM of the tile plus halo
+        if results is None: results = blocks.process_block('openness_mean', tilegrid.tile_bounds(tile_id))
+        if results is None: raise Exception('No DTM for tile ' + tile_id)
+        openness_mean = results['openness_mean']
 
         # Convert to degrees, round and store as int16
-        # Specify gdal command
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/openness_150m_' + tile_id + '_mosaic.tif ' + \
-              ' --outfile=' + wd + '/landscape_openness_' + tile_id + '_mosaic.tif ' + \
-              ' --calc=rint(degrees(A))' + \
-              ' --type=Int16 --NoDataValue=-9999'
-
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' converted and rounded to degrees. \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
-        # Obtain file extent for cropping then remove outer 150 m of mosaic to avoid edge effects
-        cmd = settings.gdalinfo_bin + wd + '/landscape_openness_' + tile_id + '_mosaic.tif '
-
-        mosaic_info = subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
-        upper_left = re.search("Upper *Left *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        lower_right = re.search("Lower *Right *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        xmin = float(upper_left.group(1)) + 150
-        ymax = float(upper_left.group(2)) - 150
-        xmax = float(lower_right.group(1)) - 150
-        ymin = float(lower_right.group(2)) + 150
-
-        # remove 150 m on outer edge using gdalwarp
-        cmd = settings.gdalwarp_bin + \
-              '-te ' + str(xmin) + ' ' + str(ymin) + ' ' + str(xmax) + ' ' + str(ymax) + ' -overwrite ' + \
-              wd + '/landscape_openness_' + tile_id + '_mosaic.tif ' + \
-              wd + '/landscape_openness_' + tile_id + '_mosaic_cropped.tif '
-
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropping landscape openness mosaic finished.\n\n')
-
-        # Crop openness mosaic to original tile size (this will set all edges removed earlier to NA)
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              '-crop_to_cutline -overwrite ' + \
-              wd + '/landscape_openness_' + tile_id + '_mosaic_cropped.tif ' + \
-              out_folder + '/openness_mean_' + tile_id + '.tif '
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' landscape openness calculation successful.\n\n')
+        common.write_tile_raster(numpy.rint(numpy.degrees(openness_mean)),
+                                 out_folder + '/openness_mean_' + tile_id + '.tif', tile_id, 'Int16')
+        log_file.write('\n' + tile_id + ' landscape openness calculation successful.\n\n')
 
         # Apply mask(s)
-        common.apply_mask(out_folder + '/openness_mean_' + tile_id + '.tif ')
+        common.apply_mask(out_folder + '/openness_mean_' + tile_id + '.tif')
 
         return_value = 'success'
 
     except:
-        return_value = 'opals/gdal/Error'
-
-    # Remove temporary files
-    try:
-        os.remove(wd + '/openness_150m_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/landscape_openness_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/landscape_openness_' + tile_id + '_mosaic_cropped.tif ')
-        # and are super random files created by OPALS
-        for temp_file in glob.glob(wd + '/../*' + tile_id + '_mosaic_dz._dz.tif'):
-            os.remove(temp_file)
-    except:
-        pass
+        log_file.write('\n' + tile_id + ' landscape openness calculation failed.\n\n')
+        return_value = 'gdalError'
 
     # Close log file
     log_file.close()
@@ -811,129 +762,104 @@ def dtm_openness_mean(tile_id):
 
 
 ## Calculate landscape openness difference
-def dtm_openness_difference(tile_id):
+def dtm_openness_difference(tile_id, results = None):
     """
-    Exports the difference between the minimum and maximum positive openness within a 50 m search radius
-    using the Opals Openness module.
+    Exports the difference between the minimum and maximum positive openness of the eight cardinal directions within
+    a 50 m search radius calculated in-process (see openness.py) on the DTM of the tile plus a 50 m halo (see
+    blocks.py).
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param results: openness of the tile calculated for a batch of tiles (see dtm_process_batch()), if None it is
+    calculated for the tile
     :return: execution status
     """
     # Initiate return value
     return_value = ''
     log_file = open('log.txt', 'a+')
 
-    # Get working directory
-    wd = os.getcwd()
-
     # Generate folder paths
     out_folder = settings.output_folder + '/openness_difference'
     if not os.path.exists(out_folder): os.mkdir(out_folder)
 
-
     # Attempt openness difference calculation
     try:
+        # Calculate minimum and maximum positive openness with a search radius of 50 m (5 cells) on the 10 m DTM of
+        # the tile plus halo
+        if results is None: results = blocks.process_block('openness_difference', tilegrid.tile_bounds(tile_id))
+        if results is None: raise Exception('No DTM for tile ' + tile_id)
 
-        # Initialise Opals Openness Module
-        export_openness = opals.Openness.Openness()
-
-        # Export minimum positive openness for a given cell cell with a kernel size of 50 m x 50 m
-        export_openness.inFile = settings.dtm_mosaics_10m_folder + '/dtm_' + tile_id + '_float_mosaic_10m.tif '
-        export_openness.outFile = wd + '/openness_50m_min_' + tile_id + '_mosaic.tif '
-        export_openness.feature = opals.Types.OpennessFeature.positive
-        export_openness.kernelSize = 5  # 5 x 10 m = 50 m
-        export_openness.selMode = 1
-        export_openness.noData = -9999
-        export_openness.commons.screenLogLevel = opals.Types.LogLevel.none
-        export_openness.commons.nbThreads = settings.nbThreads
-        export_openness.run()
-
-        export_openness.reset()
-
-        # Export maximum positive openness for a given cell with a kernel size of 50 m x 50 m
-        export_openness.inFile = settings.dtm_mosaics_10m_folder + '/dtm_' + tile_id + '_float_mosaic_10m.tif '
-        export_openness.outFile = wd + '/openness_50m_max_' + tile_id + '_mosaic.tif '
-        export_openness.feature = opals.Types.OpennessFeature.positive
-        export_openness.kernelSize = 5  # 5 x 10 m = 50 m
-        export_openness.selMode = 2
-        export_openness.noData = -9999
-        export_openness.commons.screenLogLevel = opals.Types.LogLevel.none
-        export_openness.commons.nbThreads = settings.nbThreads
-        export_openness.run()
-
-        # Calculate difference, round and store as int16
-        # Specify gdal command
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/openness_50m_min_' + tile_id + '_mosaic.tif ' + \
-              '-B ' + wd + '/openness_50m_max_' + tile_id + '_mosaic.tif ' + \
-              ' --outfile=' + wd + '/diff_openness_' + tile_id + '_mosaic.tif ' + \
-              ' --calc=rint(degrees(B)-degrees(A))' + \
-              ' --type=Int16 --NoDataValue=-9999'
+        # Calculate difference in degrees and round
+        openness_diff = numpy.rint(numpy.degrees(results['openness_max']) - numpy.degrees(results['openness_min']))
 
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' calculated difference openness. \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
+        # Store as int16
+        common.write_tile_raster(openness_diff, out_folder + '/openness_difference_' + tile_id + '.tif', tile_id,
+                                 'Int16')
+        log_file.write('\n' + tile_id + ' openness calculation successful.\n\n')
 
-        # Obtain file extent for cropping (remove outer 50 m of mosaic)
-        cmd = settings.gdalinfo_bin + wd + '/diff_openness_' + tile_id + '_mosaic.tif '
+        # Apply mask(s)
+        common.apply_mask(out_folder + '/openness_difference_' + tile_id + '.tif')
 
-        mosaic_info = subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
-        upper_left = re.search("Upper *Left *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        lower_right = re.search("Lower *Right *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        xmin = float(upper_left.group(1)) + 50
-        ymax = float(upper_left.group(2)) - 50
-        xmax = float(lower_right.group(1)) - 50
-        ymin = float(lower_right.group(2)) + 50
+        return_value = 'success'
 
-        # Remove 50 m on outer edge using gdalwarp
-        cmd = settings.gdalwarp_bin + \
-              '-te ' + str(xmin) + ' ' + str(ymin) + ' ' + str(xmax) + ' ' + str(ymax) + ' -overwrite ' + \
-              wd + '/diff_openness_' + tile_id + '_mosaic.tif ' + \
-              wd + '/diff_openness_' + tile_id + '_mosaic_cropped.tif '
+    except:
+        log_file.write('\n' + tile_id + ' openness calculation failed.\n\n')
+        return_value = 'gdalError'
 
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropped openness difference mosaic.\n\n')
+    # Close log file
+    log_file.close()
 
-        # Crop diff openness to original tile size (this will set all edges removed earlier to NA)
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              '-crop_to_cutline -overwrite ' + \
-              wd + '/diff_openness_' + tile_id + '_mosaic_cropped.tif ' + \
-              out_folder + '/openness_difference_' + tile_id + '.tif '
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' openness calculation successful.\n\n')
+    # Return exist status
+    return return_value
 
-        # Apply mask(s)
-        common.apply_mask(out_folder + '/openness_difference_' + tile_id + '.tif ')
 
-        return_value = 'success'
+## Calculate a DTM derivative for a batch of tiles
+def dtm_process_batch(step_name, tile_ids, **options):
+    """
+    Calculates a neighbourhood dependent DTM derivative for a batch of tiles (e.g. a block of
+    settings.batch_n_tiles x settings.batch_n_tiles tiles, see blocks.tile_blocks()) and exports it for each tile.
+    The DTM of the block plus the halo of the derivative is read and processed only once for all tiles of the
+    batch (see blocks.py), rather than once for each tile. If the calculation for the block fails, the tiles are
+    processed one by one.
+    :param step_name: 'dtm_terrain_indices', 'dtm_openness_mean' or 'dtm_openness_difference'
+    :param tile_ids: list of tile ids
+    :param options: passed on to the step, e.g. slope_zero for dtm_terrain_indices()
+    :return: dictionary of tile id -> execution status
+    """
+    # Steps: name of the derivative (see blocks.register()), step function and keyword of its results parameter
+    batch_steps = {'dtm_terrain_indices': ('terrain_indices', dtm_terrain_indices, 'indices'),
+                   'dtm_openness_mean': ('openness_mean', dtm_openness_mean, 'results'),
+                   'dtm_openness_difference': ('openness_difference', dtm_openness_difference, 'results')}
+    name, step_function, results_keyword = batch_steps[step_name]
 
-    except:
-        return_value = 'opals/gdal/Error'
+    # Initiate log output
+    log_file = open('log.txt', 'a+')
 
-    # Remove temporary files
     try:
-        os.remove(wd + '/openness_50m_min_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/openness_50m_max_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/diff_openness_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/diff_openness_' + tile_id + '_mosaic_cropped.tif ')
-        # and are super random files created by OPALS
-        for temp_file in glob.glob(wd + '/../*' + tile_id + '_mosaic_dz._dz.tif'):
-            os.remove(temp_file)
+        tile_results = dict(blocks.process_tiles(name, tile_ids, settings.batch_n_tiles, **options))
+        log_file.write('\n' + name + ' calculated for batch of ' + str(len(tile_ids)) + ' tiles: ' +
+                       ', '.join(tile_ids) + '\n')
     except:
-        pass
+        log_file.write('\n' + name + ' calculation for batch of tiles failed, processing tiles one by one.\n')
+        tile_results = {}
 
-    # Close log file
+    # Close log file, the steps append their own log output
     log_file.close()
 
-    # Return exist status
-    return return_value
+    # Export tiles (tiles without results, e.g. no DTM in the block, are calculated by the step itself)
+    return_values = {}
+    for tile_id in tile_ids:
+        step_options = dict(options)
+        step_options[results_keyword] = tile_results.get(tile_id)
+        return_values[tile_id] = step_function(tile_id, **step_options)
+
+    return return_values
+
 
 ## Calculate TWI following Kopecky et al. 2020
 def dtm_kopecky_twi(tile_id):
     """
-    Calculates the topographic wetness indec (TWI) following Kopecky et al. 2020.
-    Requires SAGA GIS 7.8.2 or later to be specified in settings.py.
-    Calculations are done on the aggregated 10 m tile neighbourhood mosaic.
+    Exports the topographic wetness indec (TWI) following Kopecky et al. 2020 for a tile.
+    The TWI is sliced from the national TWI raster (settings.twi_file) calculated by the national hydrology stage
+    (scripts/calc_hydrology.py, see hydrology.py), which needs to be run beforehand.
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
     :return: execution status
     """
@@ -942,106 +868,30 @@ def dtm_kopecky_twi(tile_id):
     return_value = ''
     log_file = open('log.txt', 'a+')
 
-    # get temporary work directory
-    wd = os.getcwd()
-    # Replace backslash with forward slash for SAGA GIS
-    wd = re.sub('\\\\', '/', wd)
-
     # Prepare output folder
     out_folder = settings.output_folder + '/twi'
     if not os.path.exists(out_folder): os.mkdir(out_folder)
 
     try:
+        # Slice tile from national TWI raster
+        twi = hydrology.read_twi_tile(tile_id)
 
-        # Fill in sinks on mosaic
-        cmd = settings.saga_bin + 'ta_preprocessor 5 ' + \
-              '-ELEV ' + settings.dtm_mosaics_10m_folder + '/dtm_' + tile_id + '_float_mosaic_10m.tif ' + \
-              '-FILLED ' + wd + '/' + tile_id + '_mosaic_10m_filled.sdat ' + \
-              '-MINSLOPE 0.01'
-        log_file.write(tile_id + ' finished filling sinks. \n ' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
+        # Stretch by 1000, round and store as int16
+        common.write_tile_raster(numpy.rint(1000 * twi), out_folder + '/twi_' + tile_id + '.tif', tile_id, 'Int16')
+        log_file.write('\n' + tile_id + ' TWI calculation successful. \n')
 
-        # Calculate Flow Accumulation on filled mosaic
-        cmd = settings.saga_bin + 'ta_hydrology 0 ' + \
-              '-ELEVATION ' + wd + '/' + tile_id + '_mosaic_10m_filled.sdat ' + \
-              '-METHOD 4 -CONVERGENCE 1.0 ' + \
-              '-FLOW ' + wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd.sdat ' 
-        log_file.write(tile_id + ' finished flow claculation. \n ' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
+        # Apply output profile
+        common.apply_output_profile(out_folder + '/twi_' + tile_id + '.tif')
 
-        # Calculate Flow Width and Catchment Area
-        cmd = settings.saga_bin + 'ta_hydrology 19 ' + \
-              '-DEM ' + wd + '/' + tile_id + '_mosaic_10m_filled.sdat ' + \
-              '-TCA ' + wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd.sdat ' + \
-              '-WIDTH ' + wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd_width.sdat ' + \
-              '-SCA ' + wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd_sca.sdat '
-        log_file.write(tile_id + ' finished flow width and catchment area calculation. \n ' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
-        # Calculate slope on mosaic
-        cmd = settings.saga_bin + 'ta_morphometry 0 ' + \
-              '-ELEVATION ' + wd + '/' + tile_id + '_mosaic_10m_filled.sdat ' + \
-              '-METHOD 7 ' + \
-              '-SLOPE ' + wd + '/' + tile_id + '_mosaic_10m_filled_slope.sdat ' 
-        log_file.write(tile_id + ' finished slope claculation. \n ' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
-        # Calculate TWI on mosaic
-        cmd = settings.saga_bin + 'ta_hydrology 20 ' + \
-              '-SLOPE ' + wd + '/' + tile_id + '_mosaic_10m_filled_slope.sdat ' + \
-              '-AREA ' +wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd_sca.sdat ' + \
-              '-TWI  '+ wd + '/' + tile_id + '_mosaic_10m_filled_twi.sdat ' 
-        log_file.write(tile_id + ' finished twi claculation. \n ' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
-        # Crop output to original tile size and convert to tif:
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              ' -crop_to_cutline -overwrite ' + \
-              wd + '/' + tile_id + '_mosaic_10m_filled_twi.sdat ' + \
-              wd + '/twi_' + tile_id + '_float.tif '
-
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropping wetness index mosaic successful.\n\n')
         return_value = 'success'
 
-        # Stretch to by 1000, round and convert to int 16
-        # Construct gdal command:
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/twi_' + tile_id + '_float.tif ' + \
-              '--outfile=' + out_folder + '/twi_' + tile_id + '.tif ' + \
-              ' --calc=rint(1000*A) --type=Int16 --NoDataValue=-9999 --overwrite'
-
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' rounding and conversion finished. ' \
-                                                   'TWI calculation successful. \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
     except:
         log_file.write('\n' + tile_id + ' wetness index calculation failed.\n\n')
-        return_value = 'SAGA/GDAL Error'
+        return_value = 'gdalError'
 
     # Close log file
     log_file.close()
 
-    # Remove temporary file
-    try:
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled.*'):
-            os.remove(temp_file)
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd.*'):
-            os.remove(temp_file)
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd_width.*'):
-            os.remove(temp_file)
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled_flow_mfd_sca.*'):
-            os.remove(temp_file)
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled_slope.*'):
-            os.remove(temp_file)
-        for temp_file in glob.glob(wd + '/' + tile_id + '_mosaic_10m_filled_twi.*'):
-            os.remove(temp_file)
-        os.remove(wd + '/twi_' + tile_id + '_float.tif ')
-    except:
-        pass
-
     return return_value
     
 ## Calculate SAGA Wetness Index for a tile
@@ -1071,33 +921,24 @@ def dtm_saga_wetness(tile_id):
         log_file.write(tile_id + ' wetness index calculation finished. \n ' + \
                      subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
 
-        # Crop output to original tile size:
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              '-tr 10 10 -r med -crop_to_cutline -overwrite ' + \
-              wd + '/wetness_index_' + tile_id + '_mosaic.sdat ' + \
-              wd + '/wetness_index_' + tile_id + '.tif '
+        # Crop output to original tile size and aggregate to 10 m (median)
+        wetness_index = common.read_tile_window(wd + '/wetness_index_' + tile_id + '_mosaic.sdat', tile_id)
+        n_cells = int(tilegrid.tile_size / settings.out_cell_size)
+        factor = wetness_index.shape[0] // n_cells
+        wetness_index = numpy.nanmedian(wetness_index.reshape(n_cells, factor, n_cells, factor), axis = (1, 3))
+        log_file.write('\n' + tile_id + ' cropping wetness index mosaic successful.\n\n')
 
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropping wetness index mosaic successful.\n\n')
-        return_value = 'success'
-
-        # Set input file path
-        in_file = wd + '/wetness_index_' + tile_id + '.tif '
         # Set output file path
-        out_file = out_folder + '/wetness_index_' + tile_id + '.tif '
+        out_file = out_folder + '/wetness_index_' + tile_id + '.tif'
 
-        # Stretch to by 1000, round and convert to int 16
-        # Construct gdal command:
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/wetness_index_' + tile_id + '.tif ' + \
-              '--outfile=' + out_file + \
-              ' --calc=rint(1000*A) --type=Int16 --NoDataValue=-9999 --overwrite'
-
-        # Execute gdal command
+        # Stretch to by 1000, round and store as int 16
+        common.write_tile_raster(numpy.rint(1000 * wetness_index), out_file, tile_id, 'Int16')
         log_file.write('\n' + tile_id + ' rounding and conversion finished. ' \
-                                                   'Wetness index calculation successful. \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
+                                         'Wetness index calculation successful. \n')
+        return_value = 'success'
+
+        # Apply output profile
+        common.apply_output_profile(out_file)
 
     except:
         log_file.write('\n' + tile_id + ' wetness index calculation failed.\n\n')
@@ -1113,7 +954,6 @@ def dtm_saga_wetness(tile_id):
         os.remove(wd + '/wetness_index_' + tile_id + '_mosaic.sgrd ')
         os.remove(wd + '/wetness_index_' + tile_id + '_mosaic.mgrd ')
         os.remove(wd + '/wetness_index_' + tile_id + '_mosaic.tif ')
-        os.remove(wd + '/wetness_index_' + tile_id + '.tif ')
     except:
         pass
 
@@ -1161,45 +1001,18 @@ def dtm_saga_landscape_openness(tile_id):
         log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
                      '\n' + tile_id + ' openness from mosaic successful.\n\n')
 
-        # Obtain file extent for cropping (remove outer 150 m of mosaic)
-        cmd = settings.gdalinfo_bin + wd + '/openness_10m_' + tile_id + '_mosaic.sdat '
-
-        mosaic_info = subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
-        upper_left = re.search("Upper *Left *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        lower_right = re.search("Lower *Right *\( *(\d+.\d+), *(\d+.\d+)\)", mosaic_info)
-        xmin = float(upper_left.group(1)) + 150
-        ymax = float(upper_left.group(2)) - 150
-        xmax = float(lower_right.group(1)) - 150
-        ymin = float(lower_right.group(2)) + 150
-
-        # remove 150 m on outer edge using gdal warp
-        cmd = settings.gdalwarp_bin + \
-              '-te ' + str(xmin) + ' ' + str(ymin) + ' ' + str(xmax) + ' ' + str(ymax) + ' -overwrite ' + \
-              wd + '/openness_10m_' + tile_id + '_mosaic.sdat ' + \
-              wd + '/openness_10m_' + tile_id + '_mosaic.tif '
-
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' cropping wetness index mosaic.\n\n')
+        # Remove outer 150 m of mosaic, then crop to original tile size
+        openness_10m, geo_transform = common.read_raster(wd + '/openness_10m_' + tile_id + '_mosaic.sdat')
+        openness_10m = tilegrid.crop_to_tile(openness.mask_edge(openness_10m, 15), geo_transform, tile_id)
+        log_file.write('\n' + tile_id + ' cropping openness mosaic successful.\n\n')
 
         # Convert to degrees, round and store as int16
-        # Specify gdal command
-        cmd = settings.gdal_calc_bin + \
-              '-A ' + wd + '/openness_10m_' + tile_id + '_mosaic.tif ' + \
-              ' --outfile=' + wd + '/openness_10m_' + tile_id + '_mosaic_deg.tif ' + \
-              ' --calc=rint(degrees(A))' + ' --type=Int16' + ' --NoDataValue=-9999'
+        common.write_tile_raster(numpy.rint(numpy.degrees(openness_10m)), out_folder + '/openness_10m_' + tile_id +
+                                 '.tif', tile_id, 'Int16')
+        log_file.write('\n' + tile_id + ' openness calculation successful.\n\n')
 
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' converting dtm_10m to int16 successful. \n' + \
-                     subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
-
-        # Crop slope output to original tile size:
-        cmd = settings.gdalwarp_bin + \
-              ' -cutline ' + settings.dtm_footprint_folder + '/DTM_1km_' + tile_id + '_footprint.shp ' + \
-              '-crop_to_cutline -overwrite ' + \
-              wd + '/openness_10m_' + tile_id + '_mosaic_deg.tif ' + \
-              out_folder + '/openness_10m_' + tile_id + '.tif '
-        log_file.write(subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT) + \
-                     '\n' + tile_id + ' openness calculation successful.\n\n')
+        # Apply output profile
+        common.apply_output_profile(out_folder + '/openness_10m_' + tile_id + '.tif')
         return_value = 'success'
     except:
         log_file.write('\n' + tile_id + ' opennes calculation failed.\n\n')
@@ -1215,8 +1028,6 @@ def dtm_saga_landscape_openness(tile_id):
         os.remove(wd + '/openness_10m_' + tile_id + '_mosaic.sgrd')
         os.remove(wd + '/openness_10m_' + tile_id + '_mosaic.prj')
         os.remove(wd + '/openness_10m_' + tile_id + '_mosaic.mgrd')
-        os.remove(wd + wd + '/openness_10m_' + tile_id + '_mosaic.tif')
-        os.remove(wd + '/openness_10m_' + tile_id + '_mosaic_deg.tif')
     except:
         pass
 
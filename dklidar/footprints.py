@@ -0,0 +1,124 @@
+### Functions for generating tile footprints in-process for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# A footprint is the rectangle covered by a tile. It follows from the tile id alone for tiles on the 1 km grid (see
+# tilegrid.py), from the geo transform and size in the header of a raster (no cells are read) or from the bounding
+# box in the public header of a laz file, snapped to the output cells as the opals 'corner' limit. The footprints are
+# written with OGR in a single transaction, with the tile_id field set when each feature is created. This replaces
+# running gdaltindex on each tile (and on a raster exported from the ODM only for this purpose), as well as the
+# second pass over all features that derived the tile_id field from the file names written by gdaltindex.
+
+## Imports
+import os
+import math
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import pointcloud
+from dklidar.backends import gdal, ogr, osr
+
+# OGR drivers by file extension
+drivers = {'.shp': 'ESRI Shapefile', '.gpkg': 'GPKG', '.fgb': 'FlatGeobuf'}
+
+##### Function definitions
+
+## Extent of a raster from its header
+def raster_bounds(raster_file):
+    """
+    :param raster_file: path to a north up raster
+    :return: tuple of (xmin, ymin, xmax, ymax) in m
+    """
+    raster = gdal.Open(raster_file)
+    if raster is None:
+        raise Exception('Unable to open raster: ' + raster_file)
+    geo_transform = raster.GetGeoTransform()
+    n_cols = raster.RasterXSize
+    n_rows = raster.RasterYSize
+    raster = None
+    return (geo_transform[0], geo_transform[3] + n_rows * geo_transform[5],
+            geo_transform[0] + n_cols * geo_transform[1], geo_transform[3])
+
+
+## Extent of the points of a tile from the point cloud header
+def point_cloud_bounds(tile_id, cell_size = None):
+    """
+    Bounding box of the points of a tile snapped outwards to the cells of the output grid, i.e. the extent of a raster
+    exported from the points with the opals limit 'corner'. The bounding box is read from the public header of the laz
+    file (see pointcloud.read_las_bounds()), which does not require a point cloud backend.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (xmin, ymin, xmax, ymax) in m
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    header = pointcloud.read_las_bounds(pointcloud.laz_file_name(tile_id))
+    return (math.floor(header['xmin'] / float(cell_size)) * cell_size,
+            math.floor(header['ymin'] / float(cell_size)) * cell_size,
+            math.ceil(header['xmax'] / float(cell_size)) * cell_size,
+            math.ceil(header['ymax'] / float(cell_size)) * cell_size)
+
+
+## Polygon of an extent
+def footprint_geometry(bounds):
+    """
+    :param bounds: extent (xmin, ymin, xmax, ymax) in m
+    :return: ogr polygon (ring from the upper left corner clockwise, as written by gdaltindex)
+    """
+    xmin, ymin, xmax, ymax = bounds
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in [(xmin, ymax), (xmax, ymax), (xmax, ymin), (xmin, ymin), (xmin, ymax)]:
+        ring.AddPoint_2D(x, y)
+    polygon = ogr.Geometry(ogr.wkbPolygon)
+    polygon.AddGeometry(ring)
+    return polygon
+
+
+## Write footprints to a vector file
+def write_footprints(out_file, footprints):
+    """
+    Writes the footprints in one transaction, an existing file is overwritten. The format follows from the file
+    extension: ESRI Shapefile (.shp), GeoPackage (.gpkg) or FlatGeobuf (.fgb).
+    :param out_file: path of the vector file
+    :param footprints: sequence of (tile id, extent (xmin, ymin, xmax, ymax) in m) tuples
+    :return: number of footprints written
+    """
+    driver = ogr.GetDriverByName(drivers[os.path.splitext(out_file)[1].lower()])
+    if os.path.exists(out_file): driver.DeleteDataSource(out_file)
+    data_source = driver.CreateDataSource(out_file)
+    if data_source is None:
+        raise Exception('Unable to create footprint file: ' + out_file)
+
+    # Create layer with the tile_id field
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(settings.crs_wkt_gdal)
+    layer = data_source.CreateLayer(os.path.splitext(os.path.basename(out_file))[0], srs, ogr.wkbPolygon)
+    tile_id_field = ogr.FieldDefn('tile_id', ogr.OFTString)
+    tile_id_field.SetWidth(8)
+    layer.CreateField(tile_id_field)
+    layer_definition = layer.GetLayerDefn()
+
+    # Create features
+    n_features = 0
+    layer.StartTransaction()
+    for tile_id, bounds in footprints:
+        feature = ogr.Feature(layer_definition)
+        feature.SetField('tile_id', tile_id)
+        feature.SetGeometry(footprint_geometry(bounds))
+        layer.CreateFeature(feature)
+        feature = None
+        n_features += 1
+    layer.CommitTransaction()
+
+    # Close file
+    layer = None
+    data_source = None
+    return n_features
+
+
+## Write the footprints of tiles on the tile grid
+def write_tile_footprints(out_file, tile_ids):
+    """
+    :param out_file: path of the vector file (see write_footprints())
+    :param tile_ids: sequence of tile ids
+    :return: number of footprints written
+    """
+    return write_footprints(out_file, [(tile_id, tilegrid.tile_bounds(tile_id)) for tile_id in tile_ids])
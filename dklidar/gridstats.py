@@ -0,0 +1,579 @@
+### Functions for calculating cell statistics of point attributes for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The points are grouped by their cell index once, after which any number of statistics ("features", named as in
+# opals.Cell) can be calculated for any number of attributes using vectorised segment reductions. This replaces the
+# repeated opals.Cell runs (one feature at a time) over the same ODM.
+#
+# Supported features:
+# - 'pcount'          number of points
+# - 'mean'            mean
+# - 'stdDev'          population standard deviation (ddof = 0)
+# - 'min' / 'max'     minimum / maximum
+# - 'quantile:<q>'    quantile q (0 - 1), linear interpolation between the closest ranks
+# - 'mode'            most common value (exact), ties are resolved in favour of the smallest value
+# Cells without points are returned as NaN (pcount: 0). Points with NaN values are ignored.
+
+## Imports
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+
+##### Function definitions
+
+## Shape of the raster of a tile
+def grid_shape(tile_id, cell_size = None):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (number of rows, number of cols)
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = tilegrid.tile_bounds(tile_id)
+    return int(round((ymax - ymin) / float(cell_size))), int(round((xmax - xmin) / float(cell_size)))
+
+
+## Cell index of points in a tile
+def cell_index(x, y, tile_id, cell_size = None):
+    """
+    Determines the index of the cell of the tile raster that each point falls into. Cells are numbered row by row
+    from the upper left corner of the tile (i.e. in the order of the raster). Points on the outer edge of the tile
+    are assigned to the outermost cells.
+    :param x: array of x coordinates
+    :param y: array of y coordinates
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (array of cell indices with -1 for points outside of the tile, number of rows, number of cols)
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = tilegrid.tile_bounds(tile_id)
+    n_rows, n_cols = grid_shape(tile_id, cell_size)
+
+    col = numpy.floor((x - xmin) / cell_size).astype(numpy.int64)
+    row = numpy.floor((ymax - y) / cell_size).astype(numpy.int64)
+    col[x == xmax] = n_cols - 1
+    row[y == ymin] = n_rows - 1
+
+    cells = row * n_cols + col
+    cells[(col < 0) | (col >= n_cols) | (row < 0) | (row >= n_rows)] = -1
+    return cells, n_rows, n_cols
+
+
+## Group points by cell
+def group_by_cell(cells, n_cells):
+    """
+    Sorts the points by cell index and determines the segments of points that fall into each cell.
+    :param cells: array of cell indices (points with index -1 are dropped)
+    :param n_cells: number of cells in the raster
+    :return: tuple of (order of the points sorted by cell, cell index of each segment, start of each segment in the
+    sorted points, number of points in each segment)
+    """
+    order = numpy.argsort(cells, kind = 'mergesort')
+    order = order[cells[order] >= 0]
+    sorted_cells = cells[order]
+    segment_starts = numpy.flatnonzero(numpy.r_[True, sorted_cells[1:] != sorted_cells[:-1]]) \
+        if len(sorted_cells) > 0 else numpy.empty(0, dtype = numpy.intp)
+    segment_cells = sorted_cells[segment_starts]
+    segment_counts = numpy.diff(numpy.r_[segment_starts, len(sorted_cells)])
+    return order, segment_cells, segment_starts, segment_counts
+
+
+## Calculate statistics for each cell
+def cell_statistics(cells, n_cells, attributes, features):
+    """
+    Calculates a set of features for a set of point attributes for each cell in a single sweep.
+    :param cells: array of cell indices of the points (e.g. from cell_index()), -1 for points to be ignored
+    :param n_cells: number of cells in the raster
+    :param attributes: dictionary of attribute name -> array of values (same length as cells)
+    :param features: dictionary of attribute name -> list of features, e.g. {'normalizedZ': ['mean', 'stdDev']}
+    :return: dictionary of (attribute name, feature) -> float64 array of length n_cells
+    """
+    grouping = group_by_cell(cells, n_cells)
+
+    results = {}
+    for attribute in features:
+        attribute_features = features[attribute]
+        values = numpy.asarray(attributes[attribute], dtype = numpy.float64)
+
+        # Points with NaN values (e.g. no DTM below the point) are ignored for the attribute
+        missing = numpy.isnan(values)
+        if missing.any():
+            order, segment_cells, segment_starts, segment_counts = group_by_cell(numpy.where(missing, -1, cells),
+                                                                                  n_cells)
+        else:
+            order, segment_cells, segment_starts, segment_counts = grouping
+        n_segments = len(segment_starts)
+        values = values[order]
+
+        # Moments and extrema only require the grouping by cell
+        sums = None
+        for feature in attribute_features:
+            out = numpy.full(n_cells, numpy.nan)
+            if feature == 'pcount':
+                out[:] = 0
+                out[segment_cells] = segment_counts
+            elif n_segments == 0:
+                pass
+            elif feature in ['mean', 'stdDev']:
+                if sums is None:
+                    sums = numpy.add.reduceat(values, segment_starts)
+                means = sums / segment_counts
+                if feature == 'mean':
+                    out[segment_cells] = means
+                else:
+                    deviations = values - numpy.repeat(means, segment_counts)
+                    out[segment_cells] = numpy.sqrt(numpy.add.reduceat(deviations ** 2, segment_starts) /
+                                                    segment_counts)
+            elif feature == 'min':
+                out[segment_cells] = numpy.minimum.reduceat(values, segment_starts)
+            elif feature == 'max':
+                out[segment_cells] = numpy.maximum.reduceat(values, segment_starts)
+            elif feature == 'mode' or feature.startswith('quantile:'):
+                # handled below as these require the values to be sorted within each cell
+                continue
+            else:
+                raise ValueError('Unknown feature: ' + str(feature))
+            results[(attribute, feature)] = out
+
+        # Quantiles and mode: sort values within cells (the order of the cells is preserved)
+        rank_features = [feature for feature in attribute_features
+                         if feature == 'mode' or feature.startswith('quantile:')]
+        if len(rank_features) == 0:
+            continue
+        segment_ids = numpy.repeat(numpy.arange(n_segments), segment_counts)
+        sorted_values = values[numpy.lexsort((values, segment_ids))]
+        for feature in rank_features:
+            out = numpy.full(n_cells, numpy.nan)
+            if n_segments > 0 and feature == 'mode':
+                out[segment_cells] = segment_mode(sorted_values, segment_ids)
+            elif n_segments > 0:
+                quantile = float(feature.split(':')[1])
+                out[segment_cells] = segment_quantile(sorted_values, segment_starts, segment_counts, quantile)
+            results[(attribute, feature)] = out
+
+    return results
+
+
+## Quantile of sorted segments
+def segment_quantile(sorted_values, segment_starts, segment_counts, quantile):
+    """
+    :param sorted_values: values sorted within each segment
+    :param segment_starts: start of each segment
+    :param segment_counts: length of each segment
+    :param quantile: quantile (0 - 1)
+    :return: array with the quantile of each segment (linear interpolation between the closest ranks)
+    """
+    position = quantile * (segment_counts - 1)
+    lower = numpy.floor(position).astype(numpy.int64)
+    upper = numpy.minimum(lower + 1, segment_counts - 1)
+    fraction = position - lower
+    lower_values = sorted_values[segment_starts + lower]
+    upper_values = sorted_values[segment_starts + upper]
+    return lower_values + fraction * (upper_values - lower_values)
+
+
+## Mode of sorted segments
+def segment_mode(sorted_values, segment_ids):
+    """
+    :param sorted_values: values sorted within each segment
+    :param segment_ids: segment id of each value (sorted)
+    :return: array with the most common value of each segment, ties are resolved in favour of the smallest value
+    """
+    # Runs of identical values within a segment
+    run_starts = numpy.flatnonzero(numpy.r_[True, (sorted_values[1:] != sorted_values[:-1]) |
+                                                  (segment_ids[1:] != segment_ids[:-1])])
+    run_lengths = numpy.diff(numpy.r_[run_starts, len(sorted_values)])
+    run_segments = segment_ids[run_starts]
+    run_values = sorted_values[run_starts]
+
+    # Longest run in each segment (the runs are already ordered by value within each segment)
+    run_order = numpy.lexsort((run_values, -run_lengths, run_segments))
+    first_runs = run_order[numpy.r_[True, run_segments[run_order][1:] != run_segments[run_order][:-1]]]
+    return run_values[first_runs]
+
+
+## Histogram of values for each cell
+def cell_histogram(cells, n_cells, values, edges, groups = None, n_groups = 1):
+    """
+    Counts the points in each cell falling into each of a set of value bins (and optionally groups, e.g. point
+    classes) with a single bincount. Bins are closed on the lower and open on the upper edge (edge[i] <= value <
+    edge[i + 1]), points outside of the bins, with NaN values or a group of -1 are ignored.
+    :param cells: array of cell indices of the points, -1 for points to be ignored
+    :param n_cells: number of cells in the raster
+    :param values: array of values
+    :param edges: sorted array of bin edges
+    :param groups: optional array of group indices (0 to n_groups - 1) of the points
+    :param n_groups: number of groups
+    :return: int64 array of counts with shape (n_cells, n_groups, number of bins)
+    """
+    edges = numpy.asarray(edges, dtype = numpy.float64)
+    n_bins = len(edges) - 1
+    bins = numpy.searchsorted(edges, values, side = 'right') - 1
+    if groups is None:
+        groups = numpy.zeros(len(cells), dtype = numpy.int64)
+
+    valid = (cells >= 0) & (bins >= 0) & (bins < n_bins) & (groups >= 0)
+    index = (cells[valid].astype(numpy.int64) * n_groups + groups[valid]) * n_bins + bins[valid]
+    counts = numpy.bincount(index, minlength = n_cells * n_groups * n_bins)
+    return counts.reshape((n_cells, n_groups, n_bins))
+
+
+## Sparse counts of (cell, key) pairs
+def sparse_counts(cells, keys, counts = None):
+    """
+    Counts the occurrences of each unique (cell, key) pair, e.g. the number of points for each value in each cell.
+    :param cells: array of cell indices, -1 for points to be ignored
+    :param keys: array of keys (e.g. values or value bins)
+    :param counts: optional array of counts for each pair (used to merge previous results)
+    :return: tuple of (cells, keys, counts) of the unique pairs, sorted by cell and key
+    """
+    valid = cells >= 0
+    cells = cells[valid]
+    keys = keys[valid]
+    counts = numpy.ones(len(cells), dtype = numpy.int64) if counts is None else counts[valid]
+    if len(cells) == 0:
+        return cells, keys, counts
+    order = numpy.lexsort((keys, cells))
+    cells = cells[order]
+    keys = keys[order]
+    counts = counts[order]
+    starts = numpy.flatnonzero(numpy.r_[True, (cells[1:] != cells[:-1]) | (keys[1:] != keys[:-1])])
+    return cells[starts], keys[starts], numpy.add.reduceat(counts, starts)
+
+
+## Streaming calculation of cell statistics
+class CellAccumulator(object):
+    """
+    Calculates the same cell statistics as cell_statistics(), but from points supplied in chunks, so the memory
+    required does not depend on the number of points in a tile. Per cell the accumulator keeps:
+    - count, mean and sum of squared deviations (merged between chunks with Chan et al.'s parallel algorithm)
+      for 'pcount', 'mean' and 'stdDev',
+    - the running minimum and maximum for 'min' and 'max',
+    - the number of points for each distinct value for 'mode' (exact),
+    - the number of points in each bin of width quantile_bin_width for 'quantile:<q>'.
+    Quantiles are exact and require a second pass over the chunks (see refine()): the first pass locates the bins
+    holding the ranks of the requested quantiles, the second pass collects only the values in those bins.
+    Counts, minima, maxima, modes and quantiles are identical to cell_statistics(), means and sds only differ by
+    floating point rounding (the order of summation differs).
+    """
+
+    def __init__(self, n_cells, features, quantile_bin_width = 1.0):
+        """
+        :param n_cells: number of cells in the raster
+        :param features: dictionary of attribute name -> list of features as for cell_statistics()
+        :param quantile_bin_width: width of the value bins used to locate the quantiles (in attribute units)
+        """
+        self.n_cells = n_cells
+        self.features = features
+        self.quantile_bin_width = quantile_bin_width
+        self.state = {}
+        for attribute in features:
+            self.state[attribute] = {'count': numpy.zeros(n_cells, dtype = numpy.int64),
+                                     'mean': numpy.zeros(n_cells),
+                                     'm2': numpy.zeros(n_cells),
+                                     'min': numpy.full(n_cells, numpy.inf),
+                                     'max': numpy.full(n_cells, -numpy.inf),
+                                     'mode': None,
+                                     'bins': None,
+                                     'candidates': []}
+
+    def quantiles(self, attribute):
+        """
+        :return: list of the quantiles requested for an attribute
+        """
+        return [float(feature.split(':')[1]) for feature in self.features[attribute]
+                if feature.startswith('quantile:')]
+
+    def needs_refine(self):
+        """
+        :return: True if a second pass over the chunks (refine()) is required for the quantiles
+        """
+        return any([len(self.quantiles(attribute)) > 0 for attribute in self.features])
+
+    def update(self, cells, attributes):
+        """
+        Adds a chunk of points.
+        :param cells: array of cell indices of the points, -1 for points to be ignored
+        :param attributes: dictionary of attribute name -> array of values
+        :return: nothing
+        """
+        for attribute in self.features:
+            state = self.state[attribute]
+            values = numpy.asarray(attributes[attribute], dtype = numpy.float64)
+            attribute_cells = numpy.where(numpy.isnan(values), -1, cells)
+            order, segment_cells, segment_starts, segment_counts = group_by_cell(attribute_cells, self.n_cells)
+            if len(segment_starts) == 0:
+                continue
+            sorted_values = values[order]
+
+            # Merge count, mean and sum of squared deviations of the chunk with those of the previous chunks
+            chunk_means = numpy.add.reduceat(sorted_values, segment_starts) / segment_counts
+            deviations = sorted_values - numpy.repeat(chunk_means, segment_counts)
+            chunk_m2 = numpy.add.reduceat(deviations ** 2, segment_starts)
+            count = state['count'][segment_cells]
+            total = count + segment_counts
+            delta = chunk_means - state['mean'][segment_cells]
+            state['mean'][segment_cells] += delta * segment_counts / total
+            state['m2'][segment_cells] += chunk_m2 + delta ** 2 * count * segment_counts / total
+            state['count'][segment_cells] = total
+
+            # Minimum and maximum
+            state['min'][segment_cells] = numpy.minimum(state['min'][segment_cells],
+                                                        numpy.minimum.reduceat(sorted_values, segment_starts))
+            state['max'][segment_cells] = numpy.maximum(state['max'][segment_cells],
+                                                        numpy.maximum.reduceat(sorted_values, segment_starts))
+
+            # Value counts for the mode and bin counts for the quantiles
+            if 'mode' in self.features[attribute]:
+                state['mode'] = self.merge_counts(state['mode'], sparse_counts(attribute_cells, values))
+            if len(self.quantiles(attribute)) > 0:
+                bins = numpy.floor(numpy.nan_to_num(values) / self.quantile_bin_width).astype(numpy.int64)
+                state['bins'] = self.merge_counts(state['bins'], sparse_counts(attribute_cells, bins))
+
+    def merge_counts(self, previous, new):
+        """
+        Merges two sets of sparse counts as returned by sparse_counts().
+        """
+        if previous is None:
+            return new
+        return sparse_counts(numpy.concatenate([previous[0], new[0]]), numpy.concatenate([previous[1], new[1]]),
+                             numpy.concatenate([previous[2], new[2]]))
+
+    def merge(self, other):
+        """
+        Merges the state of another accumulator for the same cells and features (e.g. one for another part of the
+        tile processed in parallel) into this one. Only valid before refine() has been called.
+        :param other: CellAccumulator
+        :return: nothing
+        """
+        for attribute in self.features:
+            state = self.state[attribute]
+            other_state = other.state[attribute]
+            count = state['count']
+            total = count + other_state['count']
+            with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+                delta = other_state['mean'] - state['mean']
+                weight = numpy.where(total > 0, other_state['count'] / numpy.maximum(total, 1).astype(numpy.float64), 0)
+                state['mean'] += delta * weight
+                state['m2'] += other_state['m2'] + delta ** 2 * count * weight
+            state['count'] = total
+            state['min'] = numpy.minimum(state['min'], other_state['min'])
+            state['max'] = numpy.maximum(state['max'], other_state['max'])
+            for key in ['mode', 'bins']:
+                if other_state[key] is not None:
+                    state[key] = self.merge_counts(state[key], other_state[key])
+
+    def target_ranks(self, attribute):
+        """
+        Determines the ranks (0-based, within each cell) required for the quantiles of an attribute and the bins
+        holding them.
+        :return: list of tuples of (quantile, cells, lower rank, upper rank, fraction) for cells with points
+        """
+        count = self.state[attribute]['count']
+        cells = numpy.flatnonzero(count > 0)
+        targets = []
+        for quantile in self.quantiles(attribute):
+            position = quantile * (count[cells] - 1)
+            lower = numpy.floor(position).astype(numpy.int64)
+            upper = numpy.minimum(lower + 1, count[cells] - 1)
+            targets.append((quantile, cells, lower, upper, position - lower))
+        return targets
+
+    def locate_ranks(self, attribute, cells, ranks):
+        """
+        :return: tuple of (index of the bin holding each rank in the sparse bin counts, rank within that bin)
+        """
+        bin_cells, bin_keys, bin_counts = self.state[attribute]['bins']
+        cumulative = numpy.cumsum(bin_counts)
+        cell_offsets = numpy.r_[0, cumulative][numpy.searchsorted(bin_cells, cells)]
+        global_ranks = cell_offsets + ranks
+        bin_index = numpy.searchsorted(cumulative, global_ranks, side = 'right')
+        return bin_index, global_ranks - (cumulative[bin_index] - bin_counts[bin_index])
+
+    def pair_keys(self, attribute, cells, bins):
+        """
+        :return: single integer key for each (cell, bin) pair of an attribute, ordered as the sparse bin counts
+        """
+        bin_keys = self.state[attribute]['bins'][1]
+        bin_min = numpy.min(bin_keys)
+        span = numpy.max(bin_keys) - bin_min + 1
+        return cells.astype(numpy.int64) * span + (numpy.clip(bins, bin_min, bin_min + span - 1) - bin_min)
+
+    def refine(self, cells, attributes):
+        """
+        Second pass for the quantiles: adds a chunk of points, keeping only the values that fall into the bins
+        holding the ranks of the requested quantiles. The chunks have to be the same as in the first pass.
+        :param cells: array of cell indices of the points, -1 for points to be ignored
+        :param attributes: dictionary of attribute name -> array of values
+        :return: nothing
+        """
+        for attribute in self.features:
+            state = self.state[attribute]
+            if len(self.quantiles(attribute)) == 0 or state['bins'] is None or len(state['bins'][0]) == 0:
+                continue
+            bin_cells, bin_keys, bin_counts = state['bins']
+
+            # Keys of the (cell, bin) pairs holding the target ranks
+            if 'target_keys' not in state:
+                target_bins = []
+                for quantile, target_cells, lower, upper, fraction in self.target_ranks(attribute):
+                    target_bins.append(self.locate_ranks(attribute, target_cells, lower)[0])
+                    target_bins.append(self.locate_ranks(attribute, target_cells, upper)[0])
+                target_bins = numpy.unique(numpy.concatenate(target_bins))
+                state['target_keys'] = self.pair_keys(attribute, bin_cells[target_bins], bin_keys[target_bins])
+
+            # Keep the values in the target bins
+            values = numpy.asarray(attributes[attribute], dtype = numpy.float64)
+            valid = (cells >= 0) & ~numpy.isnan(values)
+            values = values[valid]
+            keys = self.pair_keys(attribute, cells[valid],
+                                  numpy.floor(values / self.quantile_bin_width).astype(numpy.int64))
+            position = numpy.minimum(numpy.searchsorted(state['target_keys'], keys), len(state['target_keys']) - 1)
+            keep = state['target_keys'][position] == keys
+            state['candidates'].append((keys[keep], values[keep]))
+
+    def result(self):
+        """
+        :return: dictionary of (attribute name, feature) -> float64 array of length n_cells, as cell_statistics()
+        """
+        results = {}
+        for attribute in self.features:
+            state = self.state[attribute]
+            count = state['count']
+            has_points = count > 0
+            for feature in self.features[attribute]:
+                out = numpy.full(self.n_cells, numpy.nan)
+                if feature == 'pcount':
+                    out = count.astype(numpy.float64)
+                elif feature == 'mean':
+                    out[has_points] = state['mean'][has_points]
+                elif feature == 'stdDev':
+                    out[has_points] = numpy.sqrt(state['m2'][has_points] / count[has_points])
+                elif feature == 'min':
+                    out[has_points] = state['min'][has_points]
+                elif feature == 'max':
+                    out[has_points] = state['max'][has_points]
+                elif feature == 'mode':
+                    if state['mode'] is not None and len(state['mode'][0]) > 0:
+                        mode_cells, mode_values, mode_counts = state['mode']
+                        # highest count first, ties in favour of the smallest value
+                        order = numpy.lexsort((mode_values, -mode_counts, mode_cells))
+                        first = order[numpy.r_[True, mode_cells[order][1:] != mode_cells[order][:-1]]]
+                        out[mode_cells[first]] = mode_values[first]
+                elif feature.startswith('quantile:'):
+                    quantile = float(feature.split(':')[1])
+                    out = self.quantile_result(attribute, quantile)
+                else:
+                    raise ValueError('Unknown feature: ' + str(feature))
+                results[(attribute, feature)] = out
+        return results
+
+    def quantile_result(self, attribute, quantile):
+        """
+        :return: array with the quantile of an attribute for each cell from the values collected by refine()
+        """
+        state = self.state[attribute]
+        out = numpy.full(self.n_cells, numpy.nan)
+        if len(state['candidates']) == 0:
+            return out
+
+        # Sort the collected values by (cell, bin) pair and value
+        candidate_keys = numpy.concatenate([candidates[0] for candidates in state['candidates']])
+        candidate_values = numpy.concatenate([candidates[1] for candidates in state['candidates']])
+        order = numpy.lexsort((candidate_values, candidate_keys))
+        candidate_keys = candidate_keys[order]
+        candidate_values = candidate_values[order]
+
+        bin_cells, bin_keys, bin_counts = state['bins']
+        for target_quantile, cells, lower, upper, fraction in self.target_ranks(attribute):
+            if target_quantile != quantile:
+                continue
+            rank_values = []
+            for ranks in [lower, upper]:
+                # value with the rank within the bin, counted from the start of the bin in the sorted values
+                bin_index, bin_rank = self.locate_ranks(attribute, cells, ranks)
+                starts = numpy.searchsorted(candidate_keys,
+                                            self.pair_keys(attribute, bin_cells[bin_index], bin_keys[bin_index]))
+                rank_values.append(candidate_values[starts + bin_rank])
+            out[cells] = rank_values[0] + fraction * (rank_values[1] - rank_values[0])
+        return out
+
+
+## Mergeable approximate quantiles of heights
+class HeightSketch(object):
+    """
+    Fixed-resolution histogram of (normalised) heights for each cell. A sketch can be updated chunk by chunk and
+    merged with other sketches for the same cells (e.g. from other chunks, other workers or the points of a
+    neighbouring tile falling into the same cells), as only bin counts are kept. Any number of quantiles can then be
+    derived from the same sketch at no extra cost. Memory: n_cells x ((upper - lower) / resolution + 2) x 4 bytes
+    (10 000 cells, -1 to 50 m at 0.1 m -> ~20 MB).
+    Error bound: quantiles are calculated as by cell_statistics() (linear interpolation between the closest ranks),
+    but with each ranked value replaced by the centre of its bin. The absolute error is therefore at most
+    resolution / 2, provided the two ranked values the quantile is interpolated between lie within [lower, upper).
+    Values outside of the range are counted in an under- / overflow bin and are represented by lower / upper
+    respectively (use scripts/validate_height_sketch.py to check the error against the exact quantiles).
+    """
+
+    def __init__(self, n_cells, lower = -1.0, upper = 50.0, resolution = 0.1):
+        """
+        :param n_cells: number of cells in the raster
+        :param lower: lower edge of the histogram range (m)
+        :param upper: upper edge of the histogram range (m)
+        :param resolution: bin width (m)
+        """
+        self.n_cells = n_cells
+        self.lower = lower
+        self.upper = upper
+        self.resolution = resolution
+        self.n_bins = int(round((upper - lower) / resolution))
+        # bin 0 is the underflow bin, bin n_bins + 1 the overflow bin
+        self.counts = numpy.zeros((n_cells, self.n_bins + 2), dtype = numpy.uint32)
+
+    def update(self, cells, heights):
+        """
+        Adds a chunk of points.
+        :param cells: array of cell indices of the points, -1 for points to be ignored
+        :param heights: array of heights, NaN values are ignored
+        :return: nothing
+        """
+        valid = (cells >= 0) & ~numpy.isnan(heights)
+        bins = numpy.floor((heights[valid] - self.lower) / self.resolution).astype(numpy.int64) + 1
+        bins = numpy.clip(bins, 0, self.n_bins + 1)
+        index = cells[valid].astype(numpy.int64) * (self.n_bins + 2) + bins
+        self.counts += numpy.bincount(index, minlength = self.counts.size).reshape(self.counts.shape).astype(
+            numpy.uint32)
+
+    def merge(self, other):
+        """
+        Merges another sketch for the same cells and histogram range into this one.
+        :param other: HeightSketch
+        :return: nothing
+        """
+        if (other.n_cells, other.lower, other.upper, other.resolution) != \
+                (self.n_cells, self.lower, self.upper, self.resolution):
+            raise ValueError('Sketches with different cells or histogram ranges can not be merged.')
+        self.counts += other.counts
+
+    def quantile(self, quantile):
+        """
+        :param quantile: quantile (0 - 1)
+        :return: float64 array with the approximate quantile for each cell, NaN for cells without points
+        """
+        out = numpy.full(self.n_cells, numpy.nan)
+        count = self.counts.sum(axis = 1, dtype = numpy.int64)
+        cells = numpy.flatnonzero(count > 0)
+        if len(cells) == 0:
+            return out
+        cumulative = numpy.cumsum(self.counts[cells], axis = 1, dtype = numpy.int64)
+
+        # Value of each bin: bin centre, range limits for the under- and overflow bins
+        bin_values = numpy.r_[self.lower, self.lower + (numpy.arange(self.n_bins) + 0.5) * self.resolution, self.upper]
+
+        position = quantile * (count[cells] - 1)
+        lower = numpy.floor(position).astype(numpy.int64)
+        upper = numpy.minimum(lower + 1, count[cells] - 1)
+        lower_values = bin_values[(cumulative <= lower[:, numpy.newaxis]).sum(axis = 1)]
+        upper_values = bin_values[(cumulative <= upper[:, numpy.newaxis]).sum(axis = 1)]
+        out[cells] = lower_values + (position - lower) * (upper_values - lower_values)
+        return out
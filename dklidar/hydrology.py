@@ -0,0 +1,367 @@
+### Functions for sink filling, flow accumulation and the topographic wetness index for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# In-process replacement for the SAGA GIS tools used for the TWI following Kopecky et al. 2020 (ta_preprocessor 5,
+# ta_hydrology 0, 19, 20 and ta_morphometry 0):
+# - Sink filling following Wang & Liu 2006 with a minimum slope (priority-flood: cells are processed from the edge of
+#   the raster inwards in order of their spill elevation using a heap, each cell is raised to at least the spill
+#   elevation of the cell it was reached from plus the minimum slope drop). The order in which the cells leave the
+#   heap is recorded: the spill elevations leave the heap in ascending order, so the reversed order is a topological
+#   order of the flow network and no sorting of the cells is needed for the accumulation.
+# - Multiple flow direction accumulation following Freeman 1991 with a convergence parameter: the cells are processed
+#   in topological order (descending filled elevation) and pass their catchment area on to all lower neighbours,
+#   weighted by (drop / distance) ^ convergence. The result is the total catchment area in m2.
+# - Specific catchment area (catchment area / flow width, flow width from the aspect), slope (Zevenbergen & Thorne
+#   1987) and TWI = ln(specific catchment area / tan(slope)).
+# The kernels loop over the cells and are compiled with numba if it is installed (see backends.jit()). Besides the
+# input and output arrays they only need one byte (processed flag) and four bytes (order, int32 for rasters of less
+# than 2^31 cells) per cell, the heap only holds the cells on the current flooding front.
+# Use scripts/validate_hydrology.py to compare the results with SAGA GIS 7.8.2 and scripts/benchmark_hydrology.py to
+# time the calculations for different block sizes.
+# The national hydrology stage (scripts/calc_hydrology.py) runs the calculations on large blocks of the 10 m DTM
+# (settings.hydrology_block_size) with a halo (settings.hydrology_halo) so that catchments reaching beyond a tile are
+# no longer truncated at the edge of the 3 km tile neighbourhood mosaic. The TWI is written into one national raster
+# (settings.twi_file), from which dtm.dtm_kopecky_twi() slices the tiles. The blocks are read and processed with the
+# block processing framework (see blocks.py), the TWI is registered with a halo of settings.hydrology_halo.
+
+## Imports
+import math
+import heapq
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import blocks
+from dklidar.backends import gdal, jit
+
+# Neighbours as (row, col) steps: N, NE, E, SE, S, SW, W, NW (diagonals at odd indices)
+row_steps = numpy.array([-1, -1, 0, 1, 1, 1, 0, -1])
+col_steps = numpy.array([0, 1, 1, 1, 0, -1, -1, -1])
+
+# Minimum slope (radians) used for the TWI of flat cells (as in SAGA GIS)
+min_twi_slope = 0.001
+
+##### Function definitions
+
+## Priority-flood sink filling kernel
+@jit
+def fill_sinks_kernel(dem, min_diff_orthogonal, min_diff_diagonal, order):
+    """
+    :param dem: 2D float64 array with no data as NaN
+    :param min_diff_orthogonal: minimum elevation drop between orthogonal neighbours
+    :param min_diff_diagonal: minimum elevation drop between diagonal neighbours
+    :param order: integer array with one element per cell, receives the flat indices of the valid cells in the order
+    they were processed (ascending filled elevation)
+    :return: tuple of (filled 2D float64 array, number of valid cells in order)
+    """
+    n_rows, n_cols = dem.shape
+    filled = dem.copy()
+    closed = numpy.zeros((n_rows, n_cols), numpy.bool_)
+    n_processed = 0
+    heap = [(0.0, 0)]
+    heap.pop()
+
+    # Seed the queue with the cells on the edge of the raster or next to no data
+    for row in range(n_rows):
+        for col in range(n_cols):
+            if numpy.isnan(dem[row, col]):
+                closed[row, col] = True
+                continue
+            edge = row == 0 or col == 0 or row == n_rows - 1 or col == n_cols - 1
+            if not edge:
+                for i in range(8):
+                    if numpy.isnan(dem[row + row_steps[i], col + col_steps[i]]):
+                        edge = True
+                        break
+            if edge:
+                heapq.heappush(heap, (dem[row, col], row * n_cols + col))
+                closed[row, col] = True
+
+    # Process cells in order of their spill elevation, raise neighbours where needed
+    while len(heap) > 0:
+        z, cell = heapq.heappop(heap)
+        order[n_processed] = cell
+        n_processed += 1
+        row = cell // n_cols
+        col = cell % n_cols
+        for i in range(8):
+            neighbour_row = row + row_steps[i]
+            neighbour_col = col + col_steps[i]
+            if neighbour_row < 0 or neighbour_row >= n_rows or neighbour_col < 0 or neighbour_col >= n_cols:
+                continue
+            if closed[neighbour_row, neighbour_col]:
+                continue
+            closed[neighbour_row, neighbour_col] = True
+            min_z = z + (min_diff_diagonal if i % 2 == 1 else min_diff_orthogonal)
+            if filled[neighbour_row, neighbour_col] < min_z:
+                filled[neighbour_row, neighbour_col] = min_z
+            heapq.heappush(heap, (filled[neighbour_row, neighbour_col], neighbour_row * n_cols + neighbour_col))
+    return filled, n_processed
+
+
+## Multiple flow direction accumulation kernel
+@jit
+def mfd_accumulation_kernel(filled, order, cell_size, convergence):
+    """
+    :param filled: filled 2D float64 array with no data as NaN
+    :param order: flat indices of the valid cells in ascending order of their elevation (processed in reverse)
+    :param cell_size: cell size in m
+    :param convergence: convergence parameter (Freeman 1991)
+    :return: 2D float64 array of the total catchment area in m2
+    """
+    n_rows, n_cols = filled.shape
+    accumulation = numpy.zeros((n_rows, n_cols))
+    weights = numpy.zeros(8)
+    diagonal_length = cell_size * math.sqrt(2.0)
+    for k in range(order.shape[0] - 1, -1, -1):
+        row = order[k] // n_cols
+        col = order[k] % n_cols
+        accumulation[row, col] += cell_size * cell_size
+        z = filled[row, col]
+        total = 0.0
+        for i in range(8):
+            weights[i] = 0.0
+            neighbour_row = row + row_steps[i]
+            neighbour_col = col + col_steps[i]
+            if neighbour_row < 0 or neighbour_row >= n_rows or neighbour_col < 0 or neighbour_col >= n_cols:
+                continue
+            drop = z - filled[neighbour_row, neighbour_col]
+            if drop > 0:
+                weights[i] = (drop / (diagonal_length if i % 2 == 1 else cell_size)) ** convergence
+                total += weights[i]
+        if total > 0:
+            for i in range(8):
+                if weights[i] > 0:
+                    accumulation[row + row_steps[i], col + col_steps[i]] += \
+                        accumulation[row, col] * weights[i] / total
+    return accumulation
+
+
+## Fill sinks and determine the topological order of the cells
+def priority_flood(dem, cell_size, min_slope = None):
+    """
+    Fills the sinks of a terrain model following Wang & Liu 2006 (as SAGA GIS ta_preprocessor 5).
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param min_slope: minimum slope in degrees to preserve between cells, defaults to settings.hydrology_min_slope
+    :return: tuple of (filled 2D float64 array, flat indices of the valid cells in ascending order of their filled
+    elevation)
+    """
+    if min_slope is None: min_slope = settings.hydrology_min_slope
+    min_diff = math.tan(math.radians(min_slope)) * cell_size
+    order = numpy.empty(dem.size, dtype = numpy.int32 if dem.size < 2 ** 31 else numpy.int64)
+    filled, n_processed = fill_sinks_kernel(numpy.asarray(dem, dtype = numpy.float64), min_diff,
+                                            min_diff * math.sqrt(2.0), order)
+    return filled, order[:n_processed]
+
+
+## Fill sinks
+def fill_sinks(dem, cell_size, min_slope = None):
+    """
+    Fills the sinks of a terrain model following Wang & Liu 2006 (as SAGA GIS ta_preprocessor 5).
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param min_slope: minimum slope in degrees to preserve between cells, defaults to settings.hydrology_min_slope
+    :return: filled 2D float64 array
+    """
+    return priority_flood(dem, cell_size, min_slope)[0]
+
+
+## Flow accumulation
+def flow_accumulation(filled, cell_size, convergence = None, order = None):
+    """
+    Multiple flow direction accumulation following Freeman 1991 (as SAGA GIS ta_hydrology 0, method 4).
+    :param filled: filled 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param convergence: convergence parameter, defaults to settings.hydrology_convergence
+    :param order: optional flat indices of the valid cells in ascending order of their elevation (as returned by
+    priority_flood()), the cells are sorted if not supplied
+    :return: 2D float64 array of the total catchment area in m2, NaN for no data cells
+    """
+    if convergence is None: convergence = settings.hydrology_convergence
+    filled = numpy.asarray(filled, dtype = numpy.float64)
+    if order is None:
+        valid = numpy.flatnonzero(~numpy.isnan(filled))
+        order = valid[numpy.argsort(filled.ravel()[valid], kind = 'stable')]
+    accumulation = mfd_accumulation_kernel(filled, order, float(cell_size), float(convergence))
+    accumulation[numpy.isnan(filled)] = numpy.nan
+    return accumulation
+
+
+## Gradient of a terrain model
+def gradient(dem, cell_size):
+    """
+    Calculates the gradient from the four orthogonal neighbours (Zevenbergen & Thorne 1987). Neighbours outside the
+    raster or with no data are replaced by mirroring the opposite neighbour (or by the cell itself), as in SAGA GIS.
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :return: tuple of 2D arrays (dz / dx towards east, dz / dy towards north)
+    """
+    padded = numpy.pad(numpy.asarray(dem, dtype = numpy.float64), 1, mode = 'constant', constant_values = numpy.nan)
+    north, south = padded[:-2, 1:-1], padded[2:, 1:-1]
+    west, east = padded[1:-1, :-2], padded[1:-1, 2:]
+
+    def mirror(neighbour, opposite):
+        return numpy.where(numpy.isnan(neighbour), numpy.where(numpy.isnan(opposite), dem, 2 * dem - opposite),
+                           neighbour)
+
+    north, south = mirror(north, south), mirror(south, north)
+    west, east = mirror(west, east), mirror(east, west)
+    return (east - west) / (2.0 * cell_size), (north - south) / (2.0 * cell_size)
+
+
+## Slope
+def slope(dem, cell_size):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :return: 2D array of the slope in radians
+    """
+    dz_dx, dz_dy = gradient(dem, cell_size)
+    return numpy.arctan(numpy.hypot(dz_dx, dz_dy))
+
+
+## Specific catchment area
+def specific_catchment_area(accumulation, dem, cell_size):
+    """
+    Divides the total catchment area by the flow width derived from the aspect (as SAGA GIS ta_hydrology 19,
+    method 2): cell size x (|sin(aspect)| + |cos(aspect)|), cell size for flat cells.
+    :param accumulation: 2D array of the total catchment area in m2
+    :param dem: 2D array of the (filled) elevations
+    :param cell_size: cell size in m
+    :return: 2D array of the specific catchment area in m
+    """
+    dz_dx, dz_dy = gradient(dem, cell_size)
+    steepness = numpy.hypot(dz_dx, dz_dy)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        width = numpy.where(steepness > 0, cell_size * (numpy.abs(dz_dx) + numpy.abs(dz_dy)) / steepness, cell_size)
+    return accumulation / width
+
+
+## Topographic wetness index
+def twi(dem, cell_size, min_slope = None, convergence = None):
+    """
+    Calculates the topographic wetness index following Kopecky et al. 2020: sink filling, multiple flow direction
+    accumulation, specific catchment area and slope of the filled terrain model, TWI = ln(SCA / tan(slope)).
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param min_slope: minimum slope of the sink filling in degrees, defaults to settings.hydrology_min_slope
+    :param convergence: convergence parameter of the flow accumulation, defaults to settings.hydrology_convergence
+    :return: 2D float64 array of the TWI, NaN for no data cells
+    """
+    filled, order = priority_flood(dem, cell_size, min_slope)
+    accumulation = flow_accumulation(filled, cell_size, convergence, order)
+    order = None
+    sca = specific_catchment_area(accumulation, filled, cell_size)
+    return numpy.log(sca / numpy.tan(numpy.maximum(slope(filled, cell_size), min_twi_slope)))
+
+
+## Core extents of the blocks of the national hydrology stage
+def block_bounds(extent = None, block_size = None):
+    """
+    :param extent: extent (xmin, ymin, xmax, ymax) in m to cover, defaults to settings.vrt_extent
+    :param block_size: edge length of a block in m, defaults to settings.hydrology_block_size
+    :return: list of (xmin, ymin, xmax, ymax) tuples
+    """
+    if extent is None: extent = settings.vrt_extent
+    if block_size is None: block_size = settings.hydrology_block_size
+    xmin, ymin, xmax, ymax = extent
+    blocks = []
+    for block_ymax in range(int(ymax), int(ymin), -int(block_size)):
+        for block_xmin in range(int(xmin), int(xmax), int(block_size)):
+            blocks.append((block_xmin, max(block_ymax - block_size, ymin), min(block_xmin + block_size, xmax),
+                           block_ymax))
+    return blocks
+
+
+## TWI of a block (kernel for the block processing, see blocks.py)
+def twi_kernel(dem, cell_size, core_bounds):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, covering the block plus a halo
+    :param cell_size: cell size in m
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m
+    :return: dictionary with the 2D array of the TWI ('twi')
+    """
+    return {'twi': twi(dem, cell_size)}
+
+
+## TWI of a block
+def twi_block(core_bounds, halo = None, cell_size = None):
+    """
+    Calculates the TWI for the core of a block, using the DTM of the core plus a halo around it.
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the core of the block in m
+    :param halo: width of the halo in m, defaults to settings.hydrology_halo
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: tuple of (core bounds, 2D float32 array of the TWI of the core with no data as NaN or None if there is no
+    DTM in the block)
+    """
+    if halo is None: halo = settings.hydrology_halo
+    if cell_size is None: cell_size = settings.out_cell_size
+    results = blocks.process_block('twi', core_bounds, cell_size, int(round(halo / float(cell_size))))
+    if results is None:
+        return core_bounds, None
+    return core_bounds, results['twi'].astype(numpy.float32)
+
+
+## Create the national TWI raster
+def create_twi_raster(twi_file = None, extent = None, cell_size = None):
+    """
+    :param twi_file: path of the raster, defaults to settings.twi_file
+    :param extent: extent (xmin, ymin, xmax, ymax) in m, defaults to settings.vrt_extent
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: gdal dataset opened for writing
+    """
+    if twi_file is None: twi_file = settings.twi_file
+    if extent is None: extent = settings.vrt_extent
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = extent
+    driver = gdal.GetDriverByName('GTiff')
+    twi_raster = driver.Create(twi_file, int(round((xmax - xmin) / float(cell_size))),
+                               int(round((ymax - ymin) / float(cell_size))), 1, gdal.GDT_Float32,
+                               options = ['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=3', 'BIGTIFF=YES',
+                                          'SPARSE_OK=TRUE'])
+    twi_raster.SetGeoTransform((xmin, cell_size, 0, ymax, 0, -cell_size))
+    twi_raster.SetProjection(settings.crs_wkt_gdal)
+    twi_raster.GetRasterBand(1).SetNoDataValue(-9999)
+    return twi_raster
+
+
+## Write the TWI of a block into the national raster
+def write_twi_block(twi_raster, core_bounds, values):
+    """
+    :param twi_raster: gdal dataset of the national TWI raster (see create_twi_raster())
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the core of the block in m
+    :param values: 2D array of the TWI of the core with no data as NaN
+    :return: nothing
+    """
+    geo_transform = twi_raster.GetGeoTransform()
+    x_off = int(round((core_bounds[0] - geo_transform[0]) / geo_transform[1]))
+    y_off = int(round((geo_transform[3] - core_bounds[3]) / -geo_transform[5]))
+    twi_raster.GetRasterBand(1).WriteArray(numpy.where(numpy.isnan(values), -9999, values).astype(numpy.float32),
+                                           x_off, y_off)
+
+
+## Read the TWI of a tile from the national raster
+def read_twi_tile(tile_id, twi_file = None):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param twi_file: path of the national TWI raster, defaults to settings.twi_file
+    :return: 2D float64 array of the TWI of the tile with no data as NaN
+    """
+    if twi_file is None: twi_file = settings.twi_file
+    twi_raster = gdal.Open(twi_file)
+    if twi_raster is None:
+        raise Exception('Unable to open TWI raster: ' + twi_file)
+    geo_transform = twi_raster.GetGeoTransform()
+    xmin, ymin, xmax, ymax = tilegrid.tile_bounds(tile_id)
+    x_off = int(round((xmin - geo_transform[0]) / geo_transform[1]))
+    y_off = int(round((geo_transform[3] - ymax) / -geo_transform[5]))
+    n_cells = int(round(tilegrid.tile_size / geo_transform[1]))
+    values = twi_raster.GetRasterBand(1).ReadAsArray(x_off, y_off, n_cells, n_cells).astype(numpy.float64)
+    values[values == -9999] = numpy.nan
+    twi_raster = None
+    return values
+
+
+blocks.register('twi', int(round(settings.hydrology_halo / float(settings.out_cell_size))), twi_kernel,
+                split = False)
@@ -0,0 +1,181 @@
+### Manifest of the output files and output validation for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The manifest is a sqlite database with one record per output raster: path, size, modification time, data type,
+# dimensions, no data value, checksum and the outcome of the last validation. Files whose size and modification time
+# match the manifest have not changed since they were last validated and are skipped, so repeated validation runs
+# only need to look at new or changed files.
+# Two validation modes are available: 'header' only opens the file with gdal (reads the header), 'deep' in addition
+# checks that the raster has the dimensions of a tile, the data type of its variable (variables.py) and the common
+# crs (settings.crs_wkt_gdal), decodes all data and calculates the checksum.
+
+## Imports
+import os
+import re
+import sqlite3
+import datetime
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import vrt
+from dklidar import checksums
+from dklidar.backends import gdal, osr
+
+# Fields of the manifest
+manifest_fields = ['path', 'size', 'mtime', 'data_type', 'x_size', 'y_size', 'n_bands', 'no_data', 'checksum',
+                   'mode', 'status', 'error', 'checked']
+
+##### Function definitions
+
+## Open (and if needed create) the manifest
+def open_manifest(manifest_file = None):
+    """
+    :param manifest_file: path to the manifest, defaults to settings.manifest_file
+    :return: sqlite3 connection to the manifest
+    """
+    if manifest_file is None: manifest_file = settings.manifest_file
+    connection = sqlite3.connect(manifest_file)
+    connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                       'data_type TEXT, x_size INTEGER, y_size INTEGER, n_bands INTEGER, no_data REAL, '
+                       'checksum TEXT, mode TEXT, status TEXT, error TEXT, checked TEXT)')
+    connection.commit()
+    return connection
+
+
+## List the output rasters with their size and modification time
+def scan_files(folders = None):
+    """
+    :param folders: folders to scan, defaults to all variable folders in the output folder
+    :return: list of (path, size, mtime) tuples of the tif files in the folders
+    """
+    if folders is None: folders = vrt.list_variable_folders()
+    files = []
+    for folder in folders:
+        for file_name in os.listdir(folder):
+            if not file_name.endswith('.tif'): continue
+            path = folder + '/' + file_name
+            stat = os.stat(path)
+            files.append((path, stat.st_size, stat.st_mtime))
+    return files
+
+
+## Determine the files that need (re-)validation
+def files_to_validate(connection, files, mode = 'header'):
+    """
+    :param connection: sqlite3 connection to the manifest
+    :param files: list of (path, size, mtime) tuples (see scan_files())
+    :param mode: validation mode, 'header' or 'deep'. Files only validated in header mode are re-validated in deep
+    mode.
+    :return: list of (path, size, mtime, mode) tuples of the files that are new, changed, or not validated in the mode
+    """
+    records = dict([(row[0], row[1:]) for row in connection.execute('SELECT path, size, mtime, mode FROM files')])
+    to_validate = []
+    for path, size, mtime in files:
+        record = records.get(path)
+        if record is None or record[0] != size or record[1] != mtime or (mode == 'deep' and record[2] != 'deep'):
+            to_validate.append((path, size, mtime, mode))
+    return to_validate
+
+
+## Validate a file
+def validate_file(file_info):
+    """
+    :param file_info: tuple of (path, size, mtime, mode) (see files_to_validate())
+    :return: manifest record as tuple (in the order of manifest_fields)
+    """
+    path, size, mtime, mode = file_info
+    data_type = x_size = y_size = n_bands = no_data = checksum = None
+    errors = []
+    try:
+        gdal.UseExceptions()
+        raster = gdal.Open(path)
+        band = raster.GetRasterBand(1)
+        data_type = gdal.GetDataTypeName(band.DataType)
+        x_size = raster.RasterXSize
+        y_size = raster.RasterYSize
+        n_bands = raster.RasterCount
+        no_data = band.GetNoDataValue()
+        band = None
+
+        if mode == 'deep':
+            # Dimensions
+            tile_cells = int(round(tilegrid.tile_size / float(settings.out_cell_size)))
+            if x_size != tile_cells or y_size != tile_cells:
+                errors.append('dimensions ' + str(x_size) + ' x ' + str(y_size) + ' instead of ' +
+                              str(tile_cells) + ' x ' + str(tile_cells))
+            # Data type of the variable
+            expected_data_type = vrt.expected_data_type(os.path.dirname(path))
+            if expected_data_type is not None and data_type != expected_data_type:
+                errors.append('data type ' + data_type + ' instead of ' + expected_data_type)
+            # Crs
+            crs = osr.SpatialReference()
+            crs.ImportFromWkt(raster.GetProjection())
+            common_crs = osr.SpatialReference()
+            common_crs.ImportFromWkt(settings.crs_wkt_gdal)
+            if not crs.IsSame(common_crs):
+                errors.append('crs does not match settings.crs_wkt_gdal')
+            # Decode data
+            for band_number in range(1, n_bands + 1):
+                raster.GetRasterBand(band_number).ReadAsArray()
+            checksum = checksums.file_hash(path, settings.checksum_algorithm)
+        raster = None
+    except Exception as e:
+        errors.append(re.sub('\s+', ' ', str(e)))
+
+    status = 'ok' if len(errors) == 0 else 'error'
+    return (path, size, mtime, data_type, x_size, y_size, n_bands, no_data, checksum, mode, status,
+            '; '.join(errors), datetime.datetime.now().isoformat())
+
+
+## Write validation records to the manifest
+def update_manifest(connection, records):
+    """
+    :param connection: sqlite3 connection to the manifest
+    :param records: list of manifest records (see validate_file())
+    :return: nothing
+    """
+    connection.executemany('INSERT OR REPLACE INTO files (' + ', '.join(manifest_fields) + ') VALUES (' +
+                           ', '.join(['?'] * len(manifest_fields)) + ')', records)
+    connection.commit()
+
+
+## Remove files that no longer exist from the manifest
+def remove_missing(connection, files):
+    """
+    :param connection: sqlite3 connection to the manifest
+    :param files: list of (path, size, mtime) tuples of the existing files (see scan_files())
+    :return: number of records removed
+    """
+    existing = set([path for path, size, mtime in files])
+    missing = [(path,) for (path,) in connection.execute('SELECT path FROM files') if path not in existing]
+    connection.executemany('DELETE FROM files WHERE path = ?', missing)
+    connection.commit()
+    return len(missing)
+
+
+## List the files that failed validation
+def failed_files(connection):
+    """
+    :param connection: sqlite3 connection to the manifest
+    :return: list of (path, mode, error) tuples of the files that failed their last validation
+    """
+    return list(connection.execute("SELECT path, mode, error FROM files WHERE status != 'ok' ORDER BY path"))
+
+
+## Data types of the tiles in a folder from the manifest
+def folder_data_types(connection, folder):
+    """
+    :param connection: sqlite3 connection to the manifest
+    :param folder: variable folder
+    :return: dictionary of file name -> data type of the tiles in the folder whose size and modification time match
+    their record in the manifest (i.e. files that have not changed since they were last validated)
+    """
+    records = dict([(row[0], row[1:]) for row in
+                    connection.execute('SELECT path, size, mtime, data_type FROM files WHERE path LIKE ?',
+                                       (folder + '/%',))])
+    data_types = {}
+    for path, size, mtime in scan_files([folder]):
+        record = records.get(path)
+        if record is not None and record[0] == size and record[1] == mtime and record[2] is not None:
+            data_types[os.path.basename(path)] = record[2]
+    return data_types
@@ -0,0 +1,208 @@
+### Functions for merging the outputs of several processing batches into one output tree for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# A merge is defined by a tile source plan: for each tile the processing batch its outputs are taken from. The files
+# of the merged tree are created as hardlinks where possible (same file system, no extra disk space), otherwise as
+# reflinks (copy-on-write clones, e.g. on btrfs / xfs), with copy_file_range (in-kernel copy) or as a plain copy, in
+# that order (see settings.merge_methods). Files are merged in parallel. Every merged file is recorded in a provenance
+# manifest (sqlite: destination, tile id, batch, source, method and size), which also makes the merge resumable:
+# files that were already merged are skipped when the merge is run again.
+# NB: Hardlinked files share their content with the batch outputs, changes to one also affect the other.
+
+## Imports
+import os
+import re
+import shutil
+import sqlite3
+import datetime
+from multiprocessing.pool import ThreadPool
+
+from dklidar import settings
+from dklidar import vrt
+
+# fcntl is only available on unix systems (used for reflinks)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request for cloning a file (FICLONE, Linux)
+ficlone = 0x40049409
+
+# Pattern of the tile id in a file name
+tile_id_pattern = re.compile('.*(\d{4}_\d{3}).*')
+
+##### Function definitions
+
+## Plan a merge
+def plan_merge(tile_sources, source_folders, folders = None):
+    """
+    :param tile_sources: dictionary of tile id -> name of the batch to source the tile from
+    :param source_folders: dictionary of batch name -> output folder of the batch
+    :param folders: variable folders to merge (relative to the output folders), defaults to the variable folders of
+    the first batch
+    :return: list of (source file, destination file relative to the merged output folder, tile id, batch) tuples
+    """
+    if folders is None:
+        first_folder = source_folders[sorted(source_folders.keys())[0]]
+        folders = [os.path.relpath(folder, first_folder) for folder in vrt.list_variable_folders(first_folder)]
+    folders = [re.sub('\\\\', '/', folder).strip('/') for folder in folders]
+
+    plan = []
+    for batch in sorted(source_folders.keys()):
+        for folder in folders:
+            source_folder = source_folders[batch] + '/' + folder
+            if not os.path.exists(source_folder): continue
+            for file_name in sorted(os.listdir(source_folder)):
+                match = tile_id_pattern.match(file_name)
+                if match is None or tile_sources.get(match.group(1)) != batch: continue
+                plan.append((source_folder + '/' + file_name, folder + '/' + file_name, match.group(1), batch))
+    return plan
+
+
+## Clone a file (copy-on-write)
+def reflink_file(source, destination):
+    """
+    :param source: source file
+    :param destination: destination file
+    :return: nothing, raises an OSError / IOError if the file system does not support cloning
+    """
+    if fcntl is None: raise OSError('reflinks not supported on this system')
+    with open(source, 'rb') as in_file:
+        with open(destination, 'wb') as out_file:
+            fcntl.ioctl(out_file.fileno(), ficlone, in_file.fileno())
+
+
+## Copy a file in the kernel
+def copy_file_range_file(source, destination):
+    """
+    :param source: source file
+    :param destination: destination file
+    :return: nothing, raises an OSError if copy_file_range is not available (Python >= 3.8 on Linux)
+    """
+    if not hasattr(os, 'copy_file_range'): raise OSError('copy_file_range not available')
+    size = os.path.getsize(source)
+    with open(source, 'rb') as in_file:
+        with open(destination, 'wb') as out_file:
+            copied = 0
+            while copied < size:
+                n_bytes = os.copy_file_range(in_file.fileno(), out_file.fileno(), size - copied)
+                if n_bytes == 0: break
+                copied += n_bytes
+
+
+## Link or copy a file
+def link_file(source, destination, methods = None):
+    """
+    Creates the destination file with the first of the methods that works. Copies are written to a temporary
+    file first, so that an interrupted merge never leaves a partial file behind.
+    :param source: source file
+    :param destination: destination file
+    :param methods: list of methods to try, defaults to settings.merge_methods ('hardlink', 'reflink',
+    'copy_file_range', 'copy')
+    :return: method used
+    """
+    if methods is None: methods = settings.merge_methods
+    if os.path.exists(destination): os.remove(destination)
+    for method in methods:
+        try:
+            if method == 'hardlink':
+                if not hasattr(os, 'link'): continue
+                os.link(source, destination)
+                return method
+            temp_file = destination + '.partial'
+            if method == 'reflink':
+                reflink_file(source, temp_file)
+            elif method == 'copy_file_range':
+                copy_file_range_file(source, temp_file)
+            elif method == 'copy':
+                shutil.copyfile(source, temp_file)
+            else:
+                raise ValueError('Unknown merge method: ' + str(method))
+            os.rename(temp_file, destination)
+            return method
+        except (OSError, IOError):
+            if method != 'hardlink' and os.path.exists(destination + '.partial'):
+                os.remove(destination + '.partial')
+    raise OSError('Merging ' + source + ' failed with all methods: ' + ', '.join(methods))
+
+
+## Open (and if needed create) a provenance manifest
+def open_provenance(provenance_file):
+    """
+    :param provenance_file: path to the provenance manifest
+    :return: sqlite3 connection to the manifest
+    """
+    connection = sqlite3.connect(provenance_file)
+    connection.execute('CREATE TABLE IF NOT EXISTS provenance (destination TEXT PRIMARY KEY, tile_id TEXT, '
+                       'batch TEXT, source TEXT, method TEXT, size INTEGER, merged TEXT)')
+    connection.commit()
+    return connection
+
+
+## Merge a single file (for use with a thread pool)
+def merge_file_task(task):
+    """
+    :param task: tuple of (source file, destination file, tile id, batch, methods)
+    :return: tuple of (destination, tile id, batch, source, method, size, time stamp), method is 'error: ...' if
+    the file could not be merged
+    """
+    source, destination, tile_id, batch, methods = task
+    try:
+        method = link_file(source, destination, methods)
+        size = os.path.getsize(destination)
+    except Exception as e:
+        method = 'error: ' + str(e)
+        size = None
+    return destination, tile_id, batch, source, method, size, datetime.datetime.now().isoformat()
+
+
+## Merge the outputs of several batches
+def merge_files(plan, dest_folder, provenance_file = None, methods = None, n_threads = None):
+    """
+    Executes a merge plan (see plan_merge()). Files already recorded in the provenance manifest with the same source
+    and size are skipped, so an interrupted merge can simply be run again.
+    :param plan: list of (source file, destination file relative to dest_folder, tile id, batch) tuples
+    :param dest_folder: merged output folder
+    :param provenance_file: path to the provenance manifest, defaults to <dest_folder>/merge_provenance.sqlite
+    :param methods: list of merge methods to try (see link_file())
+    :param n_threads: number of parallel threads, defaults to settings.merge_n_threads
+    :return: dictionary of method (or 'skipped' / 'error') -> number of files
+    """
+    dest_folder = re.sub('[\\\\/]+$', '', re.sub('\\\\', '/', dest_folder))
+    if provenance_file is None: provenance_file = dest_folder + '/merge_provenance.sqlite'
+    if n_threads is None: n_threads = settings.merge_n_threads
+    if not os.path.exists(dest_folder): os.makedirs(dest_folder)
+    connection = open_provenance(provenance_file)
+    merged = dict([(row[0], row[1:]) for row in connection.execute(
+        "SELECT destination, source, size FROM provenance WHERE method NOT LIKE 'error%'")])
+
+    # Determine files still to merge and create folders
+    tasks = []
+    summary = {'skipped': 0}
+    for source, destination, tile_id, batch in plan:
+        destination = dest_folder + '/' + destination
+        if destination in merged and merged[destination][0] == source and os.path.exists(destination) \
+                and os.path.getsize(destination) == merged[destination][1]:
+            summary['skipped'] += 1
+            continue
+        if not os.path.exists(os.path.dirname(destination)): os.makedirs(os.path.dirname(destination))
+        tasks.append((source, destination, tile_id, batch, methods))
+
+    # Merge in parallel and record provenance
+    pool = ThreadPool(processes = n_threads)
+    batch = []
+    for record in pool.imap_unordered(merge_file_task, tasks, chunksize = 16):
+        method = 'error' if record[4].startswith('error') else record[4]
+        summary[method] = summary.get(method, 0) + 1
+        batch.append(record)
+        if len(batch) >= 1000:
+            connection.executemany('INSERT OR REPLACE INTO provenance VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+            connection.commit()
+            batch = []
+    connection.executemany('INSERT OR REPLACE INTO provenance VALUES (?, ?, ?, ?, ?, ?, ?)', batch)
+    connection.commit()
+    pool.close()
+    pool.join()
+    connection.close()
+    return summary
@@ -0,0 +1,128 @@
+### Functions for calculating the landscape openness of a terrain model in-process for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Positive openness (Yokoyama et al. 2002) in a direction is the zenith angle of the horizon within the search radius,
+# i.e. 90 degrees minus the maximum elevation angle from the cell to any cell along that direction. Eight directions
+# (N, NE, E, SE, S, SW, W, NW) are used. The elevation angles are calculated for all cells at once by shifting the
+# terrain model one step at a time along each direction (vectorised array operations, no loop over cells). Only the
+# running maximum of the height difference / distance ratio is kept per direction (the arctangent is monotonic and
+# only applied once per direction), and the mean, minimum and maximum openness over the directions are accumulated
+# in the same sweep. This replaces the opals.Openness runs (one per selection mode) and the gdal_calc / gdalinfo /
+# gdalwarp post-processing of their outputs.
+# The search follows the square kernel of opals.Openness: kernel_size steps in each direction, diagonal steps are
+# sqrt(2) cell sizes long. No data cells (NaN) are ignored; directions without any valid cell within the search
+# radius (e.g. pointing off the edge of the raster) are left out of the mean, minimum and maximum.
+# Openness is returned in radians (as by opals.Openness). The mean openness (150 m) and the openness difference (50 m)
+# are registered for the block processing (see blocks.py) with a halo of the search radius, which also splits large
+# blocks into strips of rows processed in parallel threads.
+
+## Imports
+import math
+import numpy
+
+from dklidar import blocks
+
+# Directions as (row, col) steps: N, NE, E, SE, S, SW, W, NW
+directions = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+##### Function definitions
+
+## Slices of the cells that have a target cell at a given offset along an axis
+def offset_slices(offset, n):
+    """
+    :param offset: offset in cells (positive or negative)
+    :param n: length of the axis
+    :return: tuple of (slice of the cells, slice of their target cells at the offset)
+    """
+    return slice(max(0, -offset), n - max(0, offset)), slice(max(0, offset), n + min(0, offset))
+
+
+## Maximum elevation angle along a direction
+def max_elevation_angle(dem, cell_size, kernel_size, direction):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param kernel_size: search radius in cells (number of steps)
+    :param direction: tuple of (row step, col step), see directions
+    :return: 2D array of the maximum elevation angle in radians, NaN where no valid cell lies within the search radius
+    """
+    n_rows, n_cols = dem.shape
+    max_ratio = numpy.full(dem.shape, numpy.nan)
+    step_length = cell_size * math.sqrt(direction[0] ** 2 + direction[1] ** 2)
+    for step in range(1, kernel_size + 1):
+        rows, target_rows = offset_slices(direction[0] * step, n_rows)
+        cols, target_cols = offset_slices(direction[1] * step, n_cols)
+        if rows.start >= rows.stop or cols.start >= cols.stop: break
+        ratio = (dem[target_rows, target_cols] - dem[rows, cols]) / (step * step_length)
+        numpy.fmax(max_ratio[rows, cols], ratio, out = max_ratio[rows, cols])
+    return numpy.arctan(max_ratio)
+
+
+## Positive openness: mean, minimum and maximum over the eight directions
+def openness(dem, cell_size, kernel_size):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN
+    :param cell_size: cell size in m
+    :param kernel_size: search radius in cells (e.g. 15 for 150 m at 10 m)
+    :return: tuple of 2D arrays (mean, minimum, maximum) of the positive openness in radians, NaN for no data cells
+    """
+    openness_sum = numpy.zeros(dem.shape)
+    openness_count = numpy.zeros(dem.shape, dtype = numpy.int8)
+    openness_min = numpy.full(dem.shape, numpy.nan)
+    openness_max = numpy.full(dem.shape, numpy.nan)
+    for direction in directions:
+        direction_openness = math.pi / 2 - max_elevation_angle(dem, cell_size, kernel_size, direction)
+        valid = ~numpy.isnan(direction_openness)
+        openness_sum[valid] += direction_openness[valid]
+        openness_count += valid
+        numpy.fmin(openness_min, direction_openness, out = openness_min)
+        numpy.fmax(openness_max, direction_openness, out = openness_max)
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        openness_mean = numpy.where(openness_count > 0, openness_sum / openness_count, numpy.nan)
+    no_data = numpy.isnan(dem)
+    for values in (openness_mean, openness_min, openness_max):
+        values[no_data] = numpy.nan
+    return openness_mean, openness_min, openness_max
+
+
+## Set the outer cells of a raster to no data
+def mask_edge(values, n_cells):
+    """
+    :param values: 2D float array
+    :param n_cells: width of the edge in cells
+    :return: copy of the array with the outer n_cells rows and columns set to NaN
+    """
+    values = values.copy()
+    values[:n_cells] = numpy.nan
+    values[-n_cells:] = numpy.nan
+    values[:, :n_cells] = numpy.nan
+    values[:, -n_cells:] = numpy.nan
+    return values
+
+
+## Mean openness of a block (kernel for the block processing, see blocks.py)
+def openness_mean_block(dem, cell_size, core_bounds):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, covering the block plus a halo of 15 cells
+    :param cell_size: cell size in m
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m
+    :return: dictionary with the 2D array of the mean openness (15 cells search radius) in radians ('openness_mean')
+    """
+    return {'openness_mean': openness(dem, cell_size, 15)[0]}
+
+
+## Minimum and maximum openness of a block (kernel for the block processing, see blocks.py)
+def openness_difference_block(dem, cell_size, core_bounds):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, covering the block plus a halo of 5 cells
+    :param cell_size: cell size in m
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m
+    :return: dictionary with the 2D arrays of the minimum and maximum openness (5 cells search radius) in radians
+    ('openness_min' and 'openness_max')
+    """
+    openness_mean, openness_min, openness_max = openness(dem, cell_size, 5)
+    return {'openness_min': openness_min, 'openness_max': openness_max}
+
+
+blocks.register('openness_mean', 15, openness_mean_block)
+blocks.register('openness_difference', 5, openness_difference_block)
@@ -0,0 +1,310 @@
+### Functions for reading point clouds into NumPy arrays for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The functions in this module decode the PUNKTSKY laz tiles directly into structured NumPy arrays. This allows the
+# point statistics to be computed in-process without importing the tiles into an ODM first and without an OPALS
+# licence. The reader is pluggable: readers are registered by name in the 'readers' dictionary and the one to use
+# is selected with settings.point_backend. The height above ground (normalizedZ) is obtained by sampling the 0.4 m DTM
+# at the point locations and kept in a separate float32 array (or memory-mapped sidecar file) alongside the points.
+# With settings.point_statistics = 'laz' scripts/process_tiles.py uses this normalisation (through
+# points.laz_export_point_statistics) instead of adding normalizedZ to the ODM with opals.AddInfo.
+
+## Imports
+import os
+import struct
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar.backends import laspy, gdal
+
+## Layout of the point arrays
+# The amplitude corresponds to the LAS intensity (OPALS imports the intensity as 'Amplitude')
+point_dtype = numpy.dtype([('x', numpy.float64),
+                           ('y', numpy.float64),
+                           ('z', numpy.float64),
+                           ('classification', numpy.uint8),
+                           ('amplitude', numpy.uint16),
+                           ('point_source_id', numpy.uint16),
+                           ('gps_time', numpy.float64)])
+
+##### Function definitions
+
+## Generate laz file path for a tile
+def laz_file_name(tile_id):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: path to the laz file of the tile
+    """
+    return settings.laz_folder + '/PUNKTSKY_1km_' + tile_id + '.laz'
+
+
+## laspy reader
+def laspy_read_chunks(file_name, chunk_size):
+    """
+    Decodes a las / laz file chunk by chunk using laspy.
+    :param file_name: path to the las / laz file
+    :param chunk_size: number of points per chunk
+    :return: generator of structured arrays with the layout of point_dtype
+    """
+    reader = laspy.open(file_name)
+    try:
+        for points in reader.chunk_iterator(chunk_size):
+            chunk = numpy.empty(len(points), dtype = point_dtype)
+            chunk['x'] = points.x
+            chunk['y'] = points.y
+            chunk['z'] = points.z
+            chunk['classification'] = points.classification
+            chunk['amplitude'] = points.intensity
+            chunk['point_source_id'] = points.point_source_id
+            chunk['gps_time'] = points.gps_time
+            yield chunk
+    finally:
+        reader.close()
+
+
+## laspy header reader
+def laspy_read_header(file_name):
+    """
+    Reads the point count and bounding box from the header of a las / laz file without decoding the points.
+    :param file_name: path to the las / laz file
+    :return: dictionary with keys 'point_count', 'xmin', 'ymin', 'zmin', 'xmax', 'ymax', 'zmax'
+    """
+    reader = laspy.open(file_name)
+    try:
+        header = reader.header
+        return {'point_count': int(header.point_count),
+                'xmin': header.mins[0], 'ymin': header.mins[1], 'zmin': header.mins[2],
+                'xmax': header.maxs[0], 'ymax': header.maxs[1], 'zmax': header.maxs[2]}
+    finally:
+        reader.close()
+
+
+## Registered point cloud readers: backend name -> (chunk reader, header reader)
+readers = {'laspy': (laspy_read_chunks, laspy_read_header)}
+
+
+## Register an additional reader
+def register_reader(name, read_chunks, read_header):
+    """
+    Registers a point cloud reader that can then be selected with settings.point_backend.
+    :param name: name of the backend
+    :param read_chunks: function(file_name, chunk_size) returning a generator of arrays with the layout of point_dtype
+    :param read_header: function(file_name) returning a dictionary as laspy_read_header()
+    :return: nothing
+    """
+    readers[name] = (read_chunks, read_header)
+
+
+## Get reader functions for a backend
+def get_reader(backend = None):
+    """
+    :param backend: name of the backend, defaults to settings.point_backend
+    :return: tuple of (chunk reader, header reader)
+    """
+    if backend is None: backend = settings.point_backend
+    if backend not in readers:
+        raise Exception('Unknown point cloud backend: ' + str(backend))
+    return readers[backend]
+
+
+## Stream the points of a tile in chunks
+def iter_tile_chunks(tile_id, chunk_size = None, point_classes = None, backend = None):
+    """
+    Streams the points of a tile as structured NumPy arrays of (at most) chunk_size points. Peak memory depends on
+    the chunk size only, not on the number of points in the tile.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param chunk_size: number of points per chunk, defaults to settings.point_chunk_size
+    :param point_classes: list of point classes to keep, None keeps all points
+    :param backend: name of the point cloud backend, defaults to settings.point_backend
+    :return: generator of structured arrays with the layout of point_dtype
+    """
+    if chunk_size is None: chunk_size = settings.point_chunk_size
+    read_chunks = get_reader(backend)[0]
+
+    for chunk in read_chunks(laz_file_name(tile_id), chunk_size):
+        if point_classes is not None:
+            chunk = chunk[numpy.isin(chunk['classification'], point_classes)]
+        yield chunk
+
+
+## Read all points of a tile
+def read_tile(tile_id, point_classes = None, backend = None):
+    """
+    Reads all points of a tile into a single structured NumPy array.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param point_classes: list of point classes to keep, None keeps all points
+    :param backend: name of the point cloud backend, defaults to settings.point_backend
+    :return: structured array with the layout of point_dtype
+    """
+    chunks = list(iter_tile_chunks(tile_id, point_classes = point_classes, backend = backend))
+    if len(chunks) == 0:
+        return numpy.empty(0, dtype = point_dtype)
+    return numpy.concatenate(chunks)
+
+
+## Read the header of a tile
+def read_tile_header(tile_id, backend = None):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param backend: name of the point cloud backend, defaults to settings.point_backend
+    :return: dictionary with keys 'point_count', 'xmin', 'ymin', 'zmin', 'xmax', 'ymax', 'zmax'
+    """
+    read_header = get_reader(backend)[1]
+    return read_header(laz_file_name(tile_id))
+
+
+## Read the bounding box from the public header of a las / laz file
+def read_las_bounds(file_name):
+    """
+    Reads the bounding box directly from the public header block with struct, no point cloud backend is needed (the
+    public header is not compressed in laz files either).
+    :param file_name: path to the las / laz file
+    :return: dictionary with keys 'xmin', 'ymin', 'zmin', 'xmax', 'ymax', 'zmax'
+    """
+    las_file = open(file_name, 'rb')
+    try:
+        header = las_file.read(227)
+    finally:
+        las_file.close()
+    if len(header) < 227 or header[0:4] != b'LASF':
+        raise Exception('Not a las / laz file: ' + file_name)
+    # Max X, Min X, Max Y, Min Y, Max Z, Min Z as little-endian doubles from byte offset 179
+    xmax, xmin, ymax, ymin, zmax, zmin = struct.unpack('<6d', header[179:227])
+    return {'xmin': xmin, 'ymin': ymin, 'zmin': zmin, 'xmax': xmax, 'ymax': ymax, 'zmax': zmax}
+
+
+## Read the DTM of a tile with a one cell border from the neighbouring tiles
+def read_dtm_padded(tile_id):
+    """
+    Reads the 0.4 m DTM of a tile and adds a border of one cell taken from the eight neighbouring DTM tiles, so
+    that points near the tile edge can be interpolated. Where a neighbour is missing the edge cells of the tile are
+    repeated instead. Only the required rows / columns of the neighbours are read.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: tuple of (dtm array as float64 with nodata as NaN, x coordinate of the centre of the upper left cell,
+    y coordinate of the centre of the upper left cell, cell size)
+    """
+    dtm_file = settings.dtm_folder + '/DTM_1km_' + tile_id + '.tif'
+    dtm_raster = gdal.Open(dtm_file)
+    if dtm_raster is None:
+        raise Exception('Unable to open DTM: ' + dtm_file)
+    geo_transform = dtm_raster.GetGeoTransform()
+    cell_size = geo_transform[1]
+    n_cols = dtm_raster.RasterXSize
+    n_rows = dtm_raster.RasterYSize
+
+    def read_window(raster, x_off, y_off, x_size, y_size):
+        band = raster.GetRasterBand(1)
+        values = band.ReadAsArray(x_off, y_off, x_size, y_size).astype(numpy.float64)
+        no_data = band.GetNoDataValue()
+        if no_data is not None:
+            values[values == no_data] = numpy.nan
+        return values
+
+    # Pad the tile by repeating its edge cells, then overwrite the border with cells from the available neighbours
+    dtm = numpy.pad(read_window(dtm_raster, 0, 0, n_cols, n_rows), 1, mode = 'edge')
+    dtm_raster = None
+
+    # Windows to read from each neighbour (x_off, y_off, x_size, y_size) and where they go in the padded array
+    neighbourhood = tilegrid.neighbours(tile_id)
+    col_windows = [(n_cols - 1, 1, slice(0, 1)), (0, n_cols, slice(1, n_cols + 1)), (0, 1, slice(n_cols + 1, None))]
+    row_windows = [(n_rows - 1, 1, slice(0, 1)), (0, n_rows, slice(1, n_rows + 1)), (0, 1, slice(n_rows + 1, None))]
+    for i in range(3):
+        for j in range(3):
+            if i == 1 and j == 1:
+                continue
+            neighbour_file = settings.dtm_folder + '/DTM_1km_' + neighbourhood[i][j] + '.tif'
+            if not os.path.exists(neighbour_file):
+                continue
+            neighbour_raster = gdal.Open(neighbour_file)
+            if neighbour_raster is None:
+                continue
+            x_off, x_size, target_cols = col_windows[j]
+            y_off, y_size, target_rows = row_windows[i]
+            dtm[target_rows, target_cols] = read_window(neighbour_raster, x_off, y_off, x_size, y_size)
+            neighbour_raster = None
+
+    x_origin = geo_transform[0] - 0.5 * cell_size
+    y_origin = geo_transform[3] + 0.5 * cell_size
+    return dtm, x_origin, y_origin, cell_size
+
+
+## Bilinear interpolation of a grid at point locations
+def sample_bilinear(grid, x_origin, y_origin, cell_size, x, y):
+    """
+    Samples a grid at the given coordinates using bilinear interpolation between the four surrounding cell centres.
+    Coordinates outside of the grid are clamped to its edge. If any of the four cells is NaN the result is NaN.
+    :param grid: 2D array (north up)
+    :param x_origin: x coordinate of the centre of the upper left cell
+    :param y_origin: y coordinate of the centre of the upper left cell
+    :param cell_size: cell size of the grid
+    :param x: array of x coordinates
+    :param y: array of y coordinates
+    :return: array of interpolated values (float64)
+    """
+    # Fractional column and row indices
+    col = numpy.clip((x - x_origin) / cell_size, 0, grid.shape[1] - 1)
+    row = numpy.clip((y_origin - y) / cell_size, 0, grid.shape[0] - 1)
+    col_0 = numpy.minimum(numpy.floor(col).astype(numpy.intp), grid.shape[1] - 2)
+    row_0 = numpy.minimum(numpy.floor(row).astype(numpy.intp), grid.shape[0] - 2)
+    col_weight = col - col_0
+    row_weight = row - row_0
+
+    top = grid[row_0, col_0] * (1 - col_weight) + grid[row_0, col_0 + 1] * col_weight
+    bottom = grid[row_0 + 1, col_0] * (1 - col_weight) + grid[row_0 + 1, col_0 + 1] * col_weight
+    return top * (1 - row_weight) + bottom * row_weight
+
+
+## Height above ground for an array of points
+def normalise_points(points, dtm, out = None):
+    """
+    Calculates the height above ground (normalizedZ = z - DTM) for an array of points.
+    :param points: structured array with the layout of point_dtype
+    :param dtm: tuple as returned by read_dtm_padded()
+    :param out: optional float32 array (e.g. a slice of a memory map) to write the results into
+    :return: float32 array of normalised heights, NaN where the DTM has no data
+    """
+    grid, x_origin, y_origin, cell_size = dtm
+    normalized_z = points['z'] - sample_bilinear(grid, x_origin, y_origin, cell_size, points['x'], points['y'])
+    if out is None:
+        return normalized_z.astype(numpy.float32)
+    out[:] = normalized_z
+    return out
+
+
+## Height above ground for all points of a tile
+def normalise_tile(tile_id, points = None, point_classes = None, sidecar_file = None, backend = None):
+    """
+    Calculates the height above ground for all points of a tile, replacing the OPALS AddInfo pass that rewrites the
+    ODM. If no points are provided the tile is streamed chunk by chunk. If a sidecar file is specified, the heights
+    are written to a raw float32 file that is then memory-mapped, so neither the chunks nor the heights are kept in
+    memory.
+    The order of the heights matches the order of read_tile() with the same point_classes.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param points: optional structured array with the layout of point_dtype (e.g. from read_tile())
+    :param point_classes: list of point classes to keep when streaming, None keeps all points
+    :param sidecar_file: optional path to a file to hold the normalised heights (raw float32)
+    :param backend: name of the point cloud backend, defaults to settings.point_backend
+    :return: float32 array (or read-only memory map if sidecar_file is set) of normalised heights
+    """
+    dtm = read_dtm_padded(tile_id)
+
+    if points is not None:
+        chunks = [points]
+    else:
+        chunks = iter_tile_chunks(tile_id, point_classes = point_classes, backend = backend)
+
+    if sidecar_file is None:
+        heights = [normalise_points(chunk, dtm) for chunk in chunks]
+        if len(heights) == 0:
+            return numpy.empty(0, dtype = numpy.float32)
+        return numpy.concatenate(heights)
+
+    # Append the heights of each chunk to the sidecar file, then map it into memory
+    sidecar = open(sidecar_file, 'wb')
+    for chunk in chunks:
+        normalise_points(chunk, dtm).tofile(sidecar)
+    sidecar.close()
+    if os.path.getsize(sidecar_file) == 0:
+        return numpy.empty(0, dtype = numpy.float32)
+    return numpy.memmap(sidecar_file, dtype = numpy.float32, mode = 'r')
@@ -4,17 +4,22 @@
 ## Imports
 import re
 import os
-import opals
 import subprocess
 import numpy
 import glob
 import shutil
 
-from osgeo import gdal_array
 from datetime import datetime, timedelta
 
 from dklidar import common
 from dklidar import settings
+from dklidar import catalogue
+from dklidar import pointcloud
+from dklidar import footprints
+from dklidar import gridstats
+from dklidar import variables
+from dklidar.variables import point_count_definitions, proportion_definitions, point_count_prefix
+from dklidar.backends import opals, gdal_array
 
 ##### Function definitions
 
@@ -60,27 +65,9 @@ def odm_import_mosaic(tile_id):
     return_value = ''
     log_file = open('log.txt', 'a+')
 
-    # Retrieve row and col numbers for the current tile_id
-    center_row = int(re.sub('(\d+)_\d+', '\g<1>', tile_id))
-    center_col = int(re.sub('\d+_(\d+)', '\g<1>', tile_id))
-
-    # Determine row and column numbers for tiles in the 3 x 3 window
-    rows_to_load = [center_row - 1, center_row, center_row + 1]
-    cols_to_load = [center_col - 1, center_col, center_col + 1]
-
-    # Generate list of tile_ids for tiles to load
-    tiles_to_load = []
-    for row in rows_to_load:
-        for col in cols_to_load:
-            tile_to_load = str(row) + '_' + str(col)
-            tiles_to_load.extend([tile_to_load])
-
-    # Prep filenames and check if files exists:
-    tile_file_names = []
-    for tile_to_load in tiles_to_load:
-        tile_file_name = settings.laz_folder + '/PUNKTSKY_1km_' + tile_to_load + '.laz'
-        if os.path.exists(tile_file_name):
-            tile_file_names.append(tile_file_name)
+    # Look up the available tiles in the 3 x 3 neighbourhood in the laz catalogue
+    laz_catalogue = catalogue.get_catalogue('laz')
+    tile_file_names = laz_catalogue.file_paths(laz_catalogue.neighbours(tile_id))
     n_neighbours = len(tile_file_names)
 
     # Update log output depending of the number of valid neighbours
@@ -120,7 +107,9 @@ def odm_import_mosaic(tile_id):
 ## Def: Export tile footprint
 def odm_generate_footprint(tile_id):
     """
-    Exports footprint from an odm file based on the tile_id in the DK nationwide dataset
+    Exports footprint of the points of a tile in the DK nationwide dataset. The footprint is the bounding box of the
+    points (from the header of the laz file the odm is imported from) snapped to the 10 m cells, i.e. the extent of a
+    raster exported from the odm with the opals limit 'corner' (see footprints.py).
     :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
     :return: returns execution status
     """
@@ -130,51 +119,30 @@ def odm_generate_footprint(tile_id):
     log_file = open('log.txt', 'a+')
 
     # Generate relevant file names:
-    odm_file = settings.odm_folder + '/odm_' + tile_id + '.odm'
-    temp_tif_file = os.getcwd() + '/temp_' + tile_id + '.tif'
     footprint_file = settings.odm_footprint_folder + '/footprint_' + tile_id + '.shp'
 
-    # Try token raster export to temp tif
+    # Try reading extent of the points from the point cloud header
     try:
-        # Export temporary tif
-        export_tif = opals.Cell.Cell()
-        export_tif.inFile = odm_file
-        export_tif.outFile = temp_tif_file
-        export_tif.feature = 'min'
-        export_tif.cellSize = 10 # This is also the default cell size, so technically not needed.
-        export_tif.limit = 'corner' # This switch is really important when working with tiles!
-                                    # It sets the ROI to the extent to the bounding box of points in the ODM
-        export_tif.commons.screenLogLevel = opals.Types.LogLevel.none
-        export_tif.run()
-        log_file.write('\n' + tile_id + ' temporary raster export successful.\n\n')
+        bounds = footprints.point_cloud_bounds(tile_id)
+        log_file.write('\n' + tile_id + ' point cloud extent read.\n\n')
     except:
-        return_value = 'opalsError'
-        log_file.write('\n' + tile_id + ' temporary raster export failed.\n\n')
+        log_file.write('\n' + tile_id + ' reading point cloud extent failed.\n\n')
+        log_file.close()
+        return 'pointcloudError'
 
-    # Try generating footprint from temp tif
+    # Try generating footprint
     try:
-        # Specify gdal command
-        cmd = settings.gdaltlindex_bin + ' ' + footprint_file + ' ' + temp_tif_file
-        # Execute gdal command
-        log_file.write('\n' + tile_id + ' footprint generation... \n' + \
-            subprocess.check_output(cmd, shell=False,  stderr=subprocess.STDOUT) + \
-                     tile_id + ' successful.\n\n')
+        footprints.write_footprints(footprint_file, [(tile_id, bounds)])
+        log_file.write('\n' + tile_id + ' footprint generation... \n' + tile_id + ' successful.\n\n')
         # set exit status
         return_value = 'success'
     except:
         log_file.write('\n' + tile_id + ' footprint generation... \n' + tile_id + ' failed.\n\n')
-        if return_value == 'opalsError': pass
-        else: return_value = 'gdalError'
+        return_value = 'gdalError'
 
     # Close log file
     log_file.close()
 
-    # Remove temp raster file
-    try:
-        os.remove(temp_tif_file)
-    except:
-        pass
-
     # return status output
     return return_value
 
@@ -510,14 +478,7 @@ def odm_export_point_count(tile_id, name = 'vegetation_point_count',
     odm_file = settings.odm_folder + '/odm_' + tile_id + '.odm'
     out_folder = settings.output_folder + '/point_count'
 
-    if lower_limit < 10 and lower_limit >= 0: lower_limit_str = '0' + str(lower_limit)
-    elif lower_limit == -1: lower_limit_str = '-01'
-    else: lower_limit_str = str(lower_limit)
-
-    if upper_limit < 10 and upper_limit >= 0: upper_limit_str = '0' + str(upper_limit)
-    else: upper_limit_str = str(upper_limit)
-
-    prefix = name + '_' + lower_limit_str + 'm-' + upper_limit_str + 'm'
+    prefix = point_count_prefix(name, lower_limit, upper_limit)
     temp_file = wd + '/temp_' + tile_id +  '.tif'
     out_file = out_folder + '/' + prefix + '/' + prefix + '_' + tile_id + '.tif'
 
@@ -598,39 +559,9 @@ def odm_export_point_counts(tile_id):
     # Initiate empty list for return values
     return_values = []
 
-    ## Ground point count
-    return_values.append(odm_export_point_count(tile_id, 'ground_point_count', -1, 1, [2]))
-
-    ## Water point count
-    return_values.append(odm_export_point_count(tile_id, 'water_point_count', -1, 1, [9]))
-
-    ## Ground and water point count
-    return_values.append(odm_export_point_count(tile_id, 'ground_and_water_point_count', -1, 1, [2,9]))
-
-    ## Vegetation point count
-    return_values.append(odm_export_point_count(tile_id, 'vegetation_point_count', 0, 50, [3,4,5]))
-
-    ## Building point counts
-    return_values.append(odm_export_point_count(tile_id, 'building_point_count', -1, 50, [6]))
-
-    ## All classes
-    return_values.append(odm_export_point_count(tile_id, 'total_point_count', -1, 50, [2,3,4,5,6,9]))
-
-    ## Vegetation point counts for continous height bins
-
-    # 0-2 m at 0.5 m intervals
-    for lower in numpy.arange(0, 2.0, 0.5):
-        return_values.append(odm_export_point_count(tile_id, 'vegetation_point_count', lower, lower + 0.5, [3,4,5]))
-
-    # 2-20 m at 1 m intervals
-    for lower in range(2, 20, 1):
-        return_values.append(odm_export_point_count(tile_id, 'vegetation_point_count', lower, lower + 1, [3,4,5]))
-
-    # 20-25 m at 5 m interval
-    return_values.append(odm_export_point_count(tile_id, 'vegetation_point_count', 20, 25, [3,4,5]))
-
-    # 25 m to 50 m
-    return_values.append(odm_export_point_count(tile_id, 'vegetation_point_count', 25, 50, [3,4,5]))
+    # Export each pre-defined point count (see point_count_definitions in variables.py)
+    for name, lower_limit, upper_limit, point_classes in point_count_definitions:
+        return_values.append(odm_export_point_count(tile_id, name, lower_limit, upper_limit, point_classes))
 
     # Set return value status
     # There are only two return value states so if there is more than one return value in the list
@@ -726,55 +657,9 @@ def odm_export_proportions(tile_id):
     # Initiate return values
     return_values = []
 
-    ## Export canopy openness
-    return_values.append(odm_calc_proportions(tile_id, 'canopy_openness', 'ground_and_water_point_count_-01m-01m',
-                                              'total_point_count_-01m-50m'))
-
-    ## Export vegeation density
-    return_values.append(odm_calc_proportions(tile_id, 'vegetation_density', 'vegetation_point_count_00m-50m',
-                                              'total_point_count_-01m-50m'))
-
-    ## Export canopy height profile
-    # 0-2 m at 0.5 m intervals
-    for lower in numpy.arange(0, 2, 0.5):
-        veg_height_bin = 'vegetation_point_count_0' + str(lower) + 'm-0' + str(lower + 0.5) + 'm'
-        prop_variable_bin = 'vegetation_proportion_0' + str(lower) + 'm-0' + str(lower + 0.5) + 'm'
-        return_values.append(odm_calc_proportions(tile_id, prop_variable_bin, veg_height_bin,
-                                                  'vegetation_point_count_00m-50m'))
-
-    # 2-9 m at 1 m intervals
-    for lower in range(2, 9, 1):
-        veg_height_bin = 'vegetation_point_count_0' + str(lower) + 'm-0' + str(lower + 1) + 'm'
-        prop_variable_bin = 'vegetation_proportion_0' + str(lower) + 'm-0' + str(lower + 1) + 'm'
-        return_values.append(odm_calc_proportions(tile_id, prop_variable_bin, veg_height_bin,
-                                                   'vegetation_point_count_00m-50m'))
-
-    # 9-10 m
-    return_values.append(odm_calc_proportions(tile_id, 'vegetation_proportion_09m-10m',
-                                              'vegetation_point_count_09m-10m',
-                                              'vegetation_point_count_00m-50m'))
-
-    # 10-20 m at 1 m intervals
-    for lower in range(10, 20, 1):
-        veg_height_bin = 'vegetation_point_count_' + str(lower) + 'm-' + str(lower + 1) + 'm'
-        prop_variable_bin = 'vegetation_proportion_' + str(lower) + 'm-' + str(lower + 1) + 'm'
-        return_values.append(odm_calc_proportions(tile_id, prop_variable_bin, veg_height_bin,
-                                                  'vegetation_point_count_00m-50m'))
-
-    # 20-25 m
-    return_values.append(odm_calc_proportions(tile_id, 'vegetation_proportion_20m-25m',
-                                              'vegetation_point_count_20m-25m',
-                                              'vegetation_point_count_00m-50m'))
-
-    # 25-50 m
-    return_values.append(odm_calc_proportions(tile_id, 'vegetation_proportion_25m-50m',
-                                              'vegetation_point_count_25m-50m',
-                                              'vegetation_point_count_00m-50m'))
-
-    # Export building proportion
-    return_values.append(odm_calc_proportions(tile_id, 'building_proportion',
-                                              'building_point_count_-01m-50m',
-                                              'total_point_count_-01m-50m'))
+    # Export each pre-defined proportion (see proportion_definitions in variables.py)
+    for prop_name, point_count_id1, point_count_id2 in proportion_definitions:
+        return_values.append(odm_calc_proportions(tile_id, prop_name, point_count_id1, point_count_id2))
 
     # Set return value status
     # There are only two return value states so if there is more than one return value in the list
@@ -976,7 +861,7 @@ def odm_export_point_source_info(tile_id):
         log_file.write('\n' + tile_id + ' extracted number of unique point source ids. \n' + \
                        subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT))
         # Apply mask(s)
-        common.apply_mask('--outfile=' + out_folder_nids + '/point_source_nids_' + tile_id + '.tif')
+        common.apply_mask(out_folder_nids + '/point_source_nids_' + tile_id + '.tif')
 
         ## Calculate proportion of hits pre cell per point source using gdal_calc
 
@@ -1405,3 +1290,201 @@ def odm_remove_temp_files(tile_id):
     # return execution status
     return return_value
 
+
+
+## Convert GPS days to dates
+def gps_day_to_date(gps_days):
+    """
+    Converts (adjusted standard) GPS days, i.e. floor(GPSTime / (60*60*24)), to dates as integers in the format
+    YYYYMMDD. Uses the same conversion as odm_export_date_stamp(), applied to the unique days only. Values in 2011
+    (GPS time stamps that were not converted from GPS seconds per week, see odm_export_date_stamp()) and NaN values
+    are returned as -9999.
+    :param gps_days: array of GPS days
+    :return: Int32 array of dates
+    """
+    dates = numpy.full(gps_days.shape, -9999, dtype = numpy.int32)
+    valid = ~numpy.isnan(gps_days)
+    unique_days, inverse = numpy.unique(gps_days[valid], return_inverse = True)
+    convert_to_utc = lambda t: int((datetime(1980, 1, 6) + timedelta(seconds=t - (35 - 19) - 3600)).strftime("%Y%m%d"))
+    unique_dates = numpy.array([convert_to_utc(day * (60*60*24) + 10**9) for day in unique_days], dtype = numpy.int32)
+    unique_dates[numpy.logical_and(unique_dates >= 20110101, unique_dates <= 20111231)] = -9999
+    dates[valid] = unique_dates[inverse]
+    return dates
+
+
+## Export all point statistics for a tile directly from the laz file
+def laz_export_point_statistics(tile_id, chunk_size = None):
+    """
+    Exports the normalized_z mean and sd, canopy height, point counts, proportions, amplitude mean and sd, and
+    date stamp mode, min and max for all 10 m x 10 m cells in a tile directly from the laz file, without an ODM.
+    The points are streamed in chunks (see pointcloud.py): each chunk is normalised and added to running cell
+    statistics (see gridstats.CellAccumulator), a second pass over the chunks determines the exact canopy height
+    quantiles. Peak memory is therefore independent of the number of points in the tile, roughly chunk_size x 150
+    bytes for the chunk and its derived arrays, plus ~50 MB for the padded 0.4 m DTM and a few MB for the cell
+    statistics.
+    Alternatively (settings.canopy_height_method = 'sketch') the canopy height is derived in a single pass from a
+    per cell height histogram (see gridstats.HeightSketch). Additional canopy height percentiles can be exported by
+    setting settings.canopy_height_percentiles.
+    The folders, file names, scaling, data types and no data values of the outputs match those of the corresponding
+    odm_* functions. The extent does not: the rasters always cover the full tile (100 x 100 cells), whereas the
+    odm_* outputs cover the extent of the points snapped to the cells (opals limit 'corner'), which is smaller for
+    tiles only partly covered by points (e.g. along the coast). Cells outside the extent of the points get the values
+    of cells without points (e.g. point counts of 0, canopy height of 0, no data for means and proportions).
+    The point source information is not included, use odm_export_point_source_info() for this.
+    With settings.output_layout = 'stacked' the outputs are written as one multi-band raster per theme instead
+    (see variables.py).
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param chunk_size: number of points per chunk, defaults to settings.point_chunk_size
+    :return: execution status
+    """
+    # Initiate return value
+    return_value = ''
+    log_file = open('log.txt', 'a+')
+
+    # Set up the cell statistics
+    n_rows, n_cols = gridstats.grid_shape(tile_id)
+    n_cells = n_rows * n_cols
+    # Normalised height and amplitude (all classes)
+    all_stats = gridstats.CellAccumulator(n_cells, {'normalizedZ': ['mean', 'stdDev'],
+                                                    'amplitude': ['mean', 'stdDev']})
+    # Canopy height and date stamps (vegetation classes only), canopy height quantiles either exact or from a sketch
+    percentiles = [95] + list(settings.canopy_height_percentiles)
+    if settings.canopy_height_method == 'sketch':
+        height_sketch = gridstats.HeightSketch(n_cells, resolution = settings.canopy_height_sketch_resolution)
+        veg_features = {'_GPSDay': ['mode', 'min', 'max']}
+    else:
+        height_sketch = None
+        veg_features = {'normalizedZ': ['quantile:' + str(percentile / 100.0) for percentile in percentiles],
+                        '_GPSDay': ['mode', 'min', 'max']}
+    veg_stats = gridstats.CellAccumulator(n_cells, veg_features)
+    # Point counts: a single histogram by point class and height bin, summed for each point count
+    class_lookup = numpy.full(256, -1, dtype = numpy.int64)
+    count_classes = sorted(set([point_class for definition in point_count_definitions
+                                for point_class in definition[3]]))
+    class_lookup[count_classes] = numpy.arange(len(count_classes))
+    edges = numpy.unique([definition[1] for definition in point_count_definitions] +
+                         [definition[2] for definition in point_count_definitions])
+    histogram = numpy.zeros((n_cells, len(count_classes), len(edges) - 1), dtype = numpy.int64)
+
+    # Prepare the cell indices and attributes of a chunk of points
+    def prepare_chunk(chunk, dtm):
+        cells = gridstats.cell_index(chunk['x'], chunk['y'], tile_id)[0]
+        veg_cells = numpy.where(numpy.isin(chunk['classification'], [3,4,5]), cells, -1)
+        attributes = {'normalizedZ': pointcloud.normalise_points(chunk, dtm),
+                      'amplitude': chunk['amplitude'],
+                      '_GPSDay': numpy.floor(chunk['gps_time'] / (60*60*24))}
+        return cells, veg_cells, attributes
+
+    # Stream the points (all classes) and update the cell statistics
+    try:
+        log_file.write('\n' + tile_id + ' reading and normalising points... \n')
+        dtm = pointcloud.read_dtm_padded(tile_id)
+        n_points = 0
+        for chunk in pointcloud.iter_tile_chunks(tile_id, chunk_size, point_classes = [2,3,4,5,6,9]):
+            cells, veg_cells, attributes = prepare_chunk(chunk, dtm)
+            all_stats.update(cells, attributes)
+            veg_stats.update(veg_cells, attributes)
+            if height_sketch is not None:
+                height_sketch.update(veg_cells, attributes['normalizedZ'])
+            histogram += gridstats.cell_histogram(cells, n_cells, attributes['normalizedZ'], edges,
+                                                  class_lookup[chunk['classification']], len(count_classes))
+            n_points += len(chunk)
+        log_file.write(tile_id + ' ' + str(n_points) + ' points read. \n')
+
+        # Second pass for the exact canopy height quantiles
+        if veg_stats.needs_refine():
+            for chunk in pointcloud.iter_tile_chunks(tile_id, chunk_size, point_classes = [2,3,4,5,6,9]):
+                cells, veg_cells, attributes = prepare_chunk(chunk, dtm)
+                veg_stats.refine(veg_cells, attributes)
+        dtm = None
+
+        stats = all_stats.result()
+        stats.update(veg_stats.result())
+        for percentile in percentiles:
+            feature = 'quantile:' + str(percentile / 100.0)
+            if height_sketch is not None:
+                stats[('normalizedZ', feature)] = height_sketch.quantile(percentile / 100.0)
+        point_counts = {}
+        for name, lower_limit, upper_limit, point_classes in point_count_definitions:
+            class_indices = [count_classes.index(point_class) for point_class in point_classes]
+            bin_indices = slice(numpy.searchsorted(edges, lower_limit), numpy.searchsorted(edges, upper_limit))
+            point_counts[point_count_prefix(name, lower_limit, upper_limit)] = \
+                histogram[:, class_indices, bin_indices].sum(axis = (1, 2))
+
+        log_file.write(tile_id + ' cell statistics calculated. \n')
+    except Exception as error:
+        log_file.write(tile_id + ' calculating cell statistics failed: ' + str(error) + '\n')
+        log_file.close()
+        return 'pointcloudError'
+
+    # Write outputs
+    try:
+        outputs = []
+
+        # Normalised height mean and sd (stretched by 100, Int16)
+        for feature, out_name in [('mean', 'normalized_z_mean'), ('stdDev', 'normalized_z_sd')]:
+            outputs.append(('normalized_z/' + out_name, out_name, numpy.rint(stats[('normalizedZ', feature)] * 100),
+                            'Int16'))
+
+        # Canopy height and additional percentiles (stretched by 100, Int16), cells without vegetation points are
+        # set to 0
+        for percentile in percentiles:
+            canopy_height = stats[('normalizedZ', 'quantile:' + str(percentile / 100.0))]
+            canopy_height[numpy.isnan(canopy_height)] = 0
+            if percentile == 95:
+                outputs.append(('canopy_height', 'canopy_height', numpy.rint(canopy_height * 100), 'Int16'))
+            else:
+                out_name = 'canopy_height_p' + str(percentile)
+                outputs.append(('canopy_height_percentiles/' + out_name, out_name, numpy.rint(canopy_height * 100),
+                                'Int16'))
+
+        # Point counts (Int16)
+        for prefix in point_counts:
+            outputs.append(('point_count/' + prefix, prefix, point_counts[prefix], 'Int16'))
+
+        # Proportions (stretched by 10000, Int16), cells with a denominator of zero are set to no data
+        for prop_name, point_count_id1, point_count_id2 in proportion_definitions:
+            numerator = point_counts[point_count_id1].astype(numpy.float64)
+            denominator = point_counts[point_count_id2].astype(numpy.float64)
+            proportion = numpy.full(n_cells, numpy.nan)
+            proportion[denominator > 0] = numpy.rint(10000 * numerator[denominator > 0] / denominator[denominator > 0])
+            outputs.append(('proportions/' + prop_name, prop_name, proportion, 'Int16'))
+
+        # Amplitude mean and sd (Float32)
+        for feature, out_name in [('mean', 'amplitude_mean'), ('stdDev', 'amplitude_sd')]:
+            outputs.append(('amplitude/' + out_name, out_name, stats[('amplitude', feature)], 'Float32'))
+
+        # Date stamps (YYYYMMDD, Int32)
+        for feature, out_name in [('mode', 'date_stamp_mode'), ('min', 'date_stamp_min'), ('max', 'date_stamp_max')]:
+            outputs.append(('date_stamp/' + out_name, out_name, gps_day_to_date(stats[('_GPSDay', feature)]),
+                            'Int32'))
+
+        if settings.output_layout == 'stacked':
+            # Write one multi-band raster per theme (see variables.py)
+            theme_arrays = {}
+            for out_folder, out_name, values, data_type in outputs:
+                theme = variables.variable_info[out_name][3]
+                theme_arrays.setdefault(theme, {})[out_name] = values.reshape((n_rows, n_cols))
+            for theme in theme_arrays:
+                variables.write_tile_stack(tile_id, theme, theme_arrays[theme])
+        else:
+            for out_folder, out_name, values, data_type in outputs:
+                # Create folders if they do not already exists
+                out_folder = settings.output_folder + '/' + out_folder
+                if not os.path.exists(out_folder): os.makedirs(out_folder)
+                out_file = out_folder + '/' + out_name + '_' + tile_id + '.tif'
+                common.write_tile_raster(values.reshape((n_rows, n_cols)), out_file, tile_id, data_type)
+                # Apply mask(s)
+                common.apply_mask(out_file)
+
+        log_file.write(tile_id + ' ' + str(len(outputs)) + ' rasters exported. \n')
+        return_value = 'success'
+    except Exception as error:
+        log_file.write(tile_id + ' exporting point statistics failed: ' + str(error) + '\n')
+        return_value = 'gdalError'
+
+    # Close log file
+    log_file.close()
+
+    # Return exist status
+    return return_value
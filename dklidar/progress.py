@@ -0,0 +1,269 @@
+### Progress store for the dklidar processing - reads the step completion events written by common.log_progress_event()
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Imports
+import os
+import re
+import csv
+import math
+import time
+
+from dklidar import settings
+
+## Status strings that flag a failed processing step
+failure_pattern = re.compile('error|fail|unable', re.IGNORECASE)
+
+
+## Progress store class
+class ProgressStore(object):
+    """
+    Incremental reader for the progress event files of a processing script (log/<script_name>/events/*.csv).
+    Each call to update() only reads the bytes appended to the event files since the previous call, so the
+    event logs are tailed rather than re-read and the tile log folders never have to be globbed.
+    """
+
+    def __init__(self, script_name = 'process_tiles', window = 3600):
+        """
+        :param script_name: name of the processing script to monitor
+        :param window: length of the rolling window (in s) used for the throughput and ETA estimates
+        """
+        self.script_name = script_name
+        self.window = window
+        self.events_folder = settings.log_folder + '/' + script_name + '/events'
+        self.progress_file = settings.log_folder + '/' + script_name + '/overall_progress.csv'
+
+        # Byte offsets for each event file that has been read so far
+        self.offsets = {}
+
+        # Tile level state
+        self.start_time = None
+        self.tiles_in_flight = {}  # tile_id: [start time, time of last event, last step]
+        self.completion_times = []
+        self.n_completed = 0
+
+        # Step level state
+        self.step_counts = {}
+        self.step_failures = {}
+        self.step_durations = {}
+        self.step_times = {}
+
+        # Total number of tiles and number of tiles complete before the monitored run
+        self.n_total, self.n_complete_at_start = self.read_progress_file()
+
+    def read_progress_file(self):
+        """
+        Reads the total number of tiles and the number of tiles already completed from the overall progress file.
+        :return: tuple of (number of tiles, number of tiles complete)
+        """
+        n_total = 0
+        n_complete = 0
+        if not os.path.exists(self.progress_file):
+            return n_total, n_complete
+        progress_file = open(self.progress_file, 'r')
+        for row in csv.DictReader(progress_file):
+            n_total += 1
+            if row.get('processing') == 'complete':
+                n_complete += 1
+        progress_file.close()
+        return n_total, n_complete
+
+    def update(self):
+        """
+        Reads all events appended to the event files since the last update.
+        :return: number of new events
+        """
+        if not os.path.exists(self.events_folder):
+            return 0
+
+        n_events = 0
+        for file_name in sorted(os.listdir(self.events_folder)):
+            if not file_name.endswith('.csv'):
+                continue
+            event_file_path = self.events_folder + '/' + file_name
+            offset = self.offsets.get(file_name, 0)
+            if os.path.getsize(event_file_path) <= offset:
+                continue
+            event_file = open(event_file_path, 'rb')
+            event_file.seek(offset)
+            chunk = event_file.read()
+            event_file.close()
+            # Only consume complete lines, a worker might be mid-write
+            end = chunk.rfind(b'\n') + 1
+            self.offsets[file_name] = offset + end
+            events = []
+            for line in chunk[:end].decode('utf-8').splitlines():
+                fields = line.split(',', 3)
+                if len(fields) == 4:
+                    events.append((float(fields[0]), fields[1], fields[2], fields[3]))
+            # Events from the same process are in order, the order between processes does not matter
+            for event in events:
+                self.add_event(*event)
+            n_events += len(events)
+
+        return n_events
+
+    def add_event(self, time_stamp, tile_id, step_name, status):
+        """
+        Updates the tile and step statistics with a single event.
+        :param time_stamp: unix time stamp of the event
+        :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+        :param step_name: name of the completed processing step
+        :param status: execution status of the processing step
+        :return: nothing
+        """
+        if self.start_time is None or time_stamp < self.start_time:
+            self.start_time = time_stamp
+
+        if step_name == 'tile_start':
+            self.tiles_in_flight[tile_id] = [time_stamp, time_stamp, step_name]
+            return
+
+        if step_name == 'processing':
+            self.tiles_in_flight.pop(tile_id, None)
+            self.completion_times.append(time_stamp)
+            self.n_completed += 1
+            return
+
+        # Duration of the step is the time passed since the previous event for the tile
+        tile_state = self.tiles_in_flight.get(tile_id)
+        if tile_state is not None:
+            self.step_durations.setdefault(step_name, []).append(time_stamp - tile_state[1])
+            tile_state[1] = time_stamp
+            tile_state[2] = step_name
+        self.step_counts[step_name] = self.step_counts.get(step_name, 0) + 1
+        self.step_times.setdefault(step_name, []).append(time_stamp)
+        if failure_pattern.search(status):
+            self.step_failures[step_name] = self.step_failures.get(step_name, 0) + 1
+
+    def tiles_per_hour(self, now = None):
+        """
+        Tile throughput in the rolling window.
+        :param now: unix time stamp to evaluate the window at, defaults to the current time
+        :return: tiles per hour
+        """
+        if now is None: now = time.time()
+        n_window, window = self.window_counts(self.completion_times, now)
+        if window <= 0:
+            return 0.0
+        return n_window / window * 3600
+
+    def window_counts(self, time_stamps, now):
+        """
+        Counts the time stamps falling within the rolling window. The window is shortened to the time since the
+        start of the run, if the run has been going for less than the length of the window.
+        :return: tuple of (count, window length in s)
+        """
+        if self.start_time is None:
+            return 0, 0
+        window_start = max(now - self.window, self.start_time)
+        n_window = len([time_stamp for time_stamp in time_stamps if time_stamp >= window_start])
+        return n_window, now - window_start
+
+    def eta(self, now = None, z = 1.96):
+        """
+        Estimates the time remaining based on the completion rate in the rolling window. Completions are treated as a
+        Poisson process, the bounds are derived from the normal approximation of the rate (z = 1.96 -> 95%).
+        :param now: unix time stamp to evaluate the estimate at, defaults to the current time
+        :param z: z-score for the confidence bounds
+        :return: tuple of (lower bound, estimate, upper bound) in s, or None if no tiles were completed yet
+        """
+        if now is None: now = time.time()
+        n_window, window = self.window_counts(self.completion_times, now)
+        n_remaining = self.n_remaining()
+        if n_remaining == 0:
+            return 0.0, 0.0, 0.0
+        if n_window == 0 or window <= 0:
+            return None
+        rate = n_window / float(window)
+        rate_error = z * math.sqrt(n_window) / window
+        estimate = n_remaining / rate
+        lower = n_remaining / (rate + rate_error)
+        if rate - rate_error > 0:
+            upper = n_remaining / (rate - rate_error)
+        else:
+            upper = float('inf')
+        return lower, estimate, upper
+
+    def n_remaining(self):
+        """
+        :return: number of tiles still to be completed
+        """
+        return max(self.n_total - self.n_complete_at_start - self.n_completed, 0)
+
+    def slowest_tiles(self, n = 5, now = None):
+        """
+        :param n: number of tiles to return
+        :param now: unix time stamp, defaults to the current time
+        :return: list of (tile_id, seconds in flight, last completed step) for the n longest running tiles
+        """
+        if now is None: now = time.time()
+        tiles = [(tile_id, now - state[0], state[2]) for tile_id, state in self.tiles_in_flight.items()]
+        tiles.sort(key = lambda tile: tile[1], reverse = True)
+        return tiles[:n]
+
+    def step_summary(self, now = None):
+        """
+        :param now: unix time stamp, defaults to the current time
+        :return: list of (step_name, count, failure rate, mean duration in s, steps per hour in the rolling window)
+        """
+        if now is None: now = time.time()
+        summary = []
+        for step_name in sorted(self.step_counts.keys(), key = lambda step: min(self.step_times[step])):
+            count = self.step_counts[step_name]
+            failure_rate = self.step_failures.get(step_name, 0) / float(count)
+            durations = self.step_durations.get(step_name, [])
+            mean_duration = sum(durations) / len(durations) if len(durations) > 0 else float('nan')
+            n_window, window = self.window_counts(self.step_times[step_name], now)
+            per_hour = n_window / window * 3600 if window > 0 else 0.0
+            summary.append((step_name, count, failure_rate, mean_duration, per_hour))
+        return summary
+
+    def write_prometheus(self, file_name, now = None):
+        """
+        Writes the current progress as a Prometheus text file (e.g. for the node_exporter textfile collector).
+        The file is written to a temporary file first and then moved into place, so scrapers never see partial files.
+        :param file_name: path to the output .prom file
+        :param now: unix time stamp, defaults to the current time
+        :return: nothing
+        """
+        if now is None: now = time.time()
+        label = 'script="' + self.script_name + '"'
+        lines = []
+
+        def add_metric(name, help_text, values):
+            lines.append('# HELP dklidar_' + name + ' ' + help_text)
+            lines.append('# TYPE dklidar_' + name + ' gauge')
+            for labels, value in values:
+                if value == float('inf'):
+                    value = '+Inf'
+                else:
+                    value = repr(float(value))
+                lines.append('dklidar_' + name + '{' + ','.join([label] + labels) + '} ' + value)
+
+        add_metric('tiles_total', 'Number of tiles in the processing run.', [([], self.n_total)])
+        add_metric('tiles_completed', 'Number of tiles completed.',
+                   [([], self.n_complete_at_start + self.n_completed)])
+        add_metric('tiles_in_flight', 'Number of tiles currently being processed.', [([], len(self.tiles_in_flight))])
+        add_metric('tiles_per_hour', 'Tile throughput in the rolling window.', [([], self.tiles_per_hour(now))])
+        eta = self.eta(now)
+        if eta is not None:
+            add_metric('eta_seconds', 'Estimated time remaining with 95% confidence bounds.',
+                       [(['bound="lower"'], eta[0]), (['bound="estimate"'], eta[1]), (['bound="upper"'], eta[2])])
+        steps = self.step_summary(now)
+        add_metric('step_completed', 'Number of completions for each processing step.',
+                   [(['step="' + step[0] + '"'], step[1]) for step in steps])
+        add_metric('step_failure_rate', 'Proportion of failed executions for each processing step.',
+                   [(['step="' + step[0] + '"'], step[2]) for step in steps])
+        add_metric('step_duration_seconds', 'Mean duration of each processing step.',
+                   [(['step="' + step[0] + '"'], step[3]) for step in steps if not math.isnan(step[3])])
+        add_metric('step_per_hour', 'Throughput of each processing step in the rolling window.',
+                   [(['step="' + step[0] + '"'], step[4]) for step in steps])
+
+        temp_file_name = file_name + '.tmp'
+        prom_file = open(temp_file_name, 'w')
+        prom_file.write('\n'.join(lines) + '\n')
+        prom_file.close()
+        # os.rename does not overwrite on Windows
+        if os.path.exists(file_name):
+            os.remove(file_name)
+        os.rename(temp_file_name, file_name)
@@ -20,6 +20,7 @@ gdaltransform_bin = 'C:/OSGeo4W/OSGeo4W.bat gdaltransform '
 gdalinfo_bin = 'C:/OSGeo4W/OSGeo4W.bat gdalinfo '
 gdal_rasterize_bin = 'C:/OSGeo4W/OSGeo4W.bat gdal_rasterize '
 gdalsrsinfo_bin = 'C:/OSGeo4W/OSGeo4W.bat gdalsrsinfo '
+gdaladdo_bin = 'C:/OSGeo4W/OSGeo4W.bat gdaladdo '
 
 # set gdal version (this matters for the crs outputs)
 gdal_version = '3.3.3' # '2.2.4'
@@ -27,6 +28,7 @@ gdal_version = '3.3.3' # '2.2.4'
 # Saga binary commands
 saga_wetness_bin = 'C:/OSGeo4W/apps/saga-ltr/saga_cmd.exe --cores=1 ta_hydrology 15 '
 saga_openness_bin = 'C:/OSGeo4W/apps/saga-ltr/saga_cmd.exe --cores=1 ta_lighting 5 '
+# SAGA GIS 7.8.2, only used to create the reference outputs for scripts/validate_hydrology.py
 saga_bin = 'D:/Jakob/saga-7.8.2_x64/saga_cmd.exe --cores=1 '
 
 ### Set folder locations
@@ -74,11 +76,133 @@ crs_proj4_gdal = r'+proj=utm +zone=32 +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units
 # common nbThreads parameter - a throttle limiter for OPALS, ensures Opals subprocesses use only a single core
 nbThreads = 1
 
+# Number of threads per worker process for the in-process raster kernels (terrain indices, openness and the
+# aggregation of the DTM tiles, see blocks.py). The kernels release the GIL, so processes can be traded for threads:
+# e.g. 16 processes x 4 threads instead of 62 processes x 1 thread, which cuts the memory and start up overhead of the
+# worker processes. OPALS and SAGA are still limited by nbThreads and --cores=1.
+n_threads = 1
+
+# Edge length of the batches of tiles processed by each worker of scripts/process_tiles.py in tiles. The batches are
+# blocks of batch_n_tiles x batch_n_tiles tiles aligned to the tile grid (see blocks.tile_blocks()): the neighbourhood
+# dependent DTM derivatives are calculated once for the whole block and split into the tiles, so the halo is read
+# once per block rather than once per tile (the DTM tiles touched by the halo of a 4 x 4 block add 125% to the tiles
+# read, compared to 800% for the 3 x 3 neighbourhood of a single tile). 1 processes each tile on its own.
+batch_n_tiles = 4
+
 ## Processing Options
 
 # Output cell size
 out_cell_size = 10
 
+# Output layout: 'single_band' writes one GeoTiff per variable and tile (default), 'stacked' writes the variables of
+# a tile as bands of one GeoTiff per theme (see variables.py), band descriptions hold the variable names
+output_layout = 'single_band'
+
+# GTiff creation options for the stacks (one internal tile per band for the 100 x 100 cell tiles)
+stack_creation_options = ['TILED=YES', 'BLOCKXSIZE=112', 'BLOCKYSIZE=112', 'COMPRESS=DEFLATE', 'PREDICTOR=2',
+                          'INTERLEAVE=BAND']
+
+# Output profile applied to each raster output (see common.apply_output_profile): 'gtiff' leaves the outputs as
+# written by the gdal tools (plain, uncompressed GeoTiffs), 'cog' rewrites them as Cloud Optimised GeoTiffs with
+# 256 px internal tiles and DEFLATE compression with predictor (requires gdal >= 3.1). ZSTD can be used instead of
+# DEFLATE if gdal was built with it.
+output_profile = 'gtiff'
+output_profiles = {'gtiff': {'driver': 'GTiff', 'creation_options': []},
+                   'cog': {'driver': 'COG', 'creation_options': ['BLOCKSIZE=256', 'COMPRESS=DEFLATE', 'PREDICTOR=YES',
+                                                                 'BIGTIFF=IF_SAFER']}}
+
+# Manifest of the output files used for the (incremental) validation of the outputs (see manifest.py)
+manifest_file = log_folder + '/output_manifest.sqlite'
+
+# Checksums (see checksums.py): hash algorithm ('md5', 'blake2b', 'xxh3' or 'blake3'), read buffer size in bytes,
+# number of parallel threads and default checksum manifest. md5 is needed for comparisons with the checksums
+# supplied with the downloads.
+checksum_algorithm = 'md5'
+checksum_buffer_size = 8388608
+checksum_n_threads = 8
+checksum_manifest_file = log_folder + '/checksums.sqlite'
+
+# Tile catalogues (see catalogue.py): folder the catalogues are persisted in and the catalogued input folders as
+# name -> (folder, regular expression matching the file names with the tile id as first group)
+catalogue_folder = log_folder + '/catalogues'
+catalogues = {'laz': (laz_folder, 'PUNKTSKY_1km_(\d+_\d+)\.laz$'),
+              'dtm': (dtm_folder, 'DTM_1km_(\d+_\d+)\.tif$')}
+
+# Merging of processing batches (see merge.py): methods tried in order to create the merged files and number of
+# parallel threads
+merge_methods = ['hardlink', 'reflink', 'copy_file_range', 'copy']
+merge_n_threads = 16
+
+# National tile footprints layer (see footprints.py and scripts/generate_tile_footprints.py), the format follows from
+# the file extension: ESRI Shapefile (.shp), GeoPackage (.gpkg) or FlatGeobuf (.fgb)
+tile_footprints_file = output_folder + '/tile_footprints/tile_footprints.shp'
+
+# Extent of the national VRTs (xmin, ymin, xmax, ymax) in m (see vrt.py)
+vrt_extent = (441000, 6049000, 894000, 6403000)
+
+# Overviews of the national VRTs (see scripts/build_vrt_overviews.py): levels and compression
+vrt_overview_levels = [2, 4, 8, 16, 32, 64]
+vrt_overview_compression = 'DEFLATE'
+
+## Point cloud backend
+
+# Point statistics exported by scripts/process_tiles.py and scripts/debug.py: 'opals' adds the normalised height to
+# the ODM (opals.AddInfo) and exports each variable with a separate opals.Cell run, 'laz' exports normalised height,
+# canopy height, point counts, proportions, amplitude and date stamps in one streamed pass over the laz file
+# (points.laz_export_point_statistics). The point source information is exported from the ODM in both cases.
+# 'laz' requires the point_backend below, i.e. laspy >= 2.0 and thus Python 3 (not the OPALS Python 2.7).
+point_statistics = 'opals'
+
+# Reader used to decode the laz files for the in-process point statistics (see pointcloud.py), currently 'laspy'
+# (requires laspy >= 2.0 with the lazrs or laszip backend, no OPALS licence needed)
+point_backend = 'laspy'
+
+# Number of points decoded per chunk when streaming the laz files. Peak memory of the in-process point statistics
+# (points.laz_export_point_statistics, run by process_tiles.py with point_statistics = 'laz') is roughly
+# point_chunk_size x 150 bytes plus ~50 MB for the DTM, independent of the number of points in a tile
+# (1000000 -> ~200 MB per worker). With point_statistics = 'opals' the memory of the workers is bound by the opals.Cell
+# exports of the whole ODM instead.
+point_chunk_size = 1000000
+
+# Canopy height quantiles of the in-process point statistics (point_statistics = 'laz'): 'exact' (two passes over the
+# points) or 'sketch' (per cell height histogram, single pass, absolute error <= canopy_height_sketch_resolution / 2
+# within -1 to 50 m)
+canopy_height_method = 'exact'
+canopy_height_sketch_resolution = 0.1
+
+# Additional canopy height percentiles to export alongside the canopy height (95th percentile), e.g. [25, 50, 75, 99].
+# Only exported (and registered as variables, see variables.py) with point_statistics = 'laz'
+canopy_height_percentiles = []
+
+## National data cube (see datacube.py)
+
+# Path to the Zarr store
+cube_file = wd + '/data/ecodes_dk_cube.zarr'
+
+# Extent of the cube (xmin, ymin, xmax, ymax) in m, must be aligned to the 1 km tile grid and cover all tiles. The
+# cube covers the same extent as the national VRTs, so cube and VRT cells line up one to one.
+cube_extent = vrt_extent
+
+# Blosc compressor and compression level of the arrays
+cube_compression = 'zstd'
+cube_compression_level = 5
+
+## National hydrology stage (see hydrology.py and scripts/calc_hydrology.py)
+
+# National TWI raster (float, 10 m) from which the twi tiles are sliced
+twi_file = wd + '/data/twi_national_10m.tif'
+
+# Edge length of the blocks and width of the halo around each block in m. Catchments reaching further than the halo
+# beyond a block are truncated. Peak memory per worker is roughly 60 bytes per cell of block plus halo
+# (70 km x 70 km at 10 m -> ~3 GB).
+hydrology_block_size = 50000
+hydrology_halo = 10000
+hydrology_n_processes = 8
+
+# Minimum slope of the sink filling in degrees and convergence parameter of the flow accumulation (Kopecky et al. 2020)
+hydrology_min_slope = 0.01
+hydrology_convergence = 1.0
+
 ## Filter Strings
 
 # point filter for all three vegetation classes as OPALS WKT
@@ -0,0 +1,161 @@
+### Functions for calculating terrain indices (slope, aspect, heat load index and solar radiation) for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# All four terrain indices are calculated in one pass from a 10 m DTM window covering a tile plus a halo of one cell:
+# the gradient is calculated once (Horn 1981, as gdaldem slope / aspect), slope and aspect are derived from it and the
+# heat load index and solar radiation (McCune & Keon 2002) from the unrounded slope and aspect. This replaces the
+# gdaldem / gdalwarp / gdal_calc chain, where the heat load index and solar radiation were calculated from the
+# rounded slope and aspect outputs read back from disk, and the latitudes of the cells were obtained via xyz files
+# and gdaltransform.
+# The indices are registered for the block processing (see blocks.py) with a halo of one cell.
+# Cells with no data in their 3 x 3 neighbourhood are no data. The aspect (and with it heat load index and solar
+# radiation) of flat cells (slope = 0) is no data, unless a value for flat cells is given (slope_zero).
+
+## Imports
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import blocks
+from dklidar.backends import osr
+
+##### Function definitions
+
+## Gradient of a terrain model (Horn 1981)
+def horn_gradient(dem, cell_size):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, including a halo of one cell
+    :param cell_size: cell size in m
+    :return: tuple of 2D arrays (dz / dx towards east, dz / dy towards north) without the halo
+    """
+    z = [[dem[row:(dem.shape[0] - 2 + row), col:(dem.shape[1] - 2 + col)] for col in range(3)] for row in range(3)]
+    dz_dx = ((z[0][2] + 2 * z[1][2] + z[2][2]) - (z[0][0] + 2 * z[1][0] + z[2][0])) / (8.0 * cell_size)
+    dz_dy = ((z[0][0] + 2 * z[0][1] + z[0][2]) - (z[2][0] + 2 * z[2][1] + z[2][2])) / (8.0 * cell_size)
+    return dz_dx, dz_dy
+
+
+## Slope
+def slope(dz_dx, dz_dy):
+    """
+    :param dz_dx: 2D array of the gradient towards east
+    :param dz_dy: 2D array of the gradient towards north
+    :return: 2D array of the slope in degrees
+    """
+    return numpy.degrees(numpy.arctan(numpy.hypot(dz_dx, dz_dy)))
+
+
+## Aspect
+def aspect(dz_dx, dz_dy):
+    """
+    :param dz_dx: 2D array of the gradient towards east
+    :param dz_dy: 2D array of the gradient towards north
+    :return: 2D array of the aspect (direction of the steepest descent) in degrees clockwise from north (0 - 360),
+    NaN for flat cells
+    """
+    angle = numpy.degrees(numpy.arctan2(-dz_dy, -dz_dx))
+    azimuth = numpy.where(angle > 90, 450 - angle, 90 - angle)
+    azimuth[azimuth == 360] = 0
+    azimuth[(dz_dx == 0) & (dz_dy == 0)] = numpy.nan
+    return azimuth
+
+
+## Heat load index
+def heat_load_index(aspect_deg):
+    """
+    Heat load index following McCune & Keon 2002, based on the aspect only.
+    :param aspect_deg: 2D array of the aspect in degrees
+    :return: 2D array of the heat load index (0 - 1)
+    """
+    return (1 - numpy.cos(numpy.radians(aspect_deg - 45))) / 2
+
+
+## Solar radiation
+def solar_radiation(latitude_deg, slope_deg, aspect_deg):
+    """
+    Potential annual direct incident radiation following McCune & Keon 2002 (equation 3).
+    :param latitude_deg: 2D array of the latitude in degrees
+    :param slope_deg: 2D array of the slope in degrees
+    :param aspect_deg: 2D array of the aspect in degrees (folded about the north-south line)
+    :return: 2D array of the solar radiation in MJ / cm2 / yr
+    """
+    latitude = numpy.radians(latitude_deg)
+    slope_rad = numpy.radians(slope_deg)
+    folded_aspect = numpy.radians(180 - numpy.abs(180 - aspect_deg))
+    return numpy.exp(0.339 + 0.808 * numpy.cos(latitude) * numpy.cos(slope_rad) -
+                     0.196 * numpy.sin(latitude) * numpy.sin(slope_rad) -
+                     0.482 * numpy.cos(folded_aspect) * numpy.sin(slope_rad))
+
+
+## Latitude of the cell centres of a tile
+def cell_latitudes(tile_id, cell_size = None):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: 2D array of the latitude (WGS84) of the centre of each cell in degrees
+    """
+    return bounds_latitudes(tilegrid.tile_bounds(tile_id), cell_size)
+
+
+## Latitude of the cell centres of an extent
+def bounds_latitudes(bounds, cell_size = None):
+    """
+    :param bounds: extent (xmin, ymin, xmax, ymax) in m
+    :param cell_size: cell size in m, defaults to settings.out_cell_size
+    :return: 2D array of the latitude (WGS84) of the centre of each cell in degrees
+    """
+    if cell_size is None: cell_size = settings.out_cell_size
+    xmin, ymin, xmax, ymax = bounds
+    x, y = numpy.meshgrid(numpy.arange(xmin + cell_size / 2.0, xmax, cell_size),
+                          numpy.arange(ymax - cell_size / 2.0, ymin, -cell_size))
+    utm = osr.SpatialReference()
+    utm.ImportFromWkt(settings.crs_wkt_gdal)
+    wgs84 = osr.SpatialReference()
+    wgs84.ImportFromEPSG(4326)
+    # Keep x / y (longitude / latitude) axis order with gdal >= 3
+    if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        utm.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transformation = osr.CoordinateTransformation(utm, wgs84)
+    points = transformation.TransformPoints(numpy.column_stack([x.ravel(), y.ravel()]).tolist())
+    return numpy.array([point[1] for point in points]).reshape(x.shape)
+
+
+## All terrain indices in one pass
+def terrain_indices(dem, cell_size, latitude_deg, slope_zero = 'nodata'):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, covering the tile plus a halo of one cell
+    :param cell_size: cell size in m
+    :param latitude_deg: 2D array of the latitude of the cells of the tile in degrees (see cell_latitudes())
+    :param slope_zero: value in degrees assigned to the aspect of flat cells (slope = 0) or 'nodata'
+    :return: dictionary of 2D float arrays covering the tile: 'slope' (degrees), 'aspect' (degrees),
+    'heat_load_index' (0 - 1) and 'solar_radiation' (MJ / cm2 / yr), no data as NaN
+    """
+    dz_dx, dz_dy = horn_gradient(numpy.asarray(dem, dtype = numpy.float64), cell_size)
+    slope_deg = slope(dz_dx, dz_dy)
+    aspect_deg = aspect(dz_dx, dz_dy)
+
+    # Heat load index is not defined for flat cells
+    hli = heat_load_index(aspect_deg)
+
+    # The aspect does not affect the solar radiation of flat cells (sin(slope) = 0)
+    flat = slope_deg == 0
+    if slope_zero != 'nodata':
+        aspect_deg[flat] = slope_zero
+    radiation = solar_radiation(latitude_deg, slope_deg, aspect_deg)
+
+    return {'slope': slope_deg, 'aspect': aspect_deg, 'heat_load_index': hli, 'solar_radiation': radiation}
+
+
+## Terrain indices of a block (kernel for the block processing, see blocks.py)
+def terrain_block(dem, cell_size, core_bounds, slope_zero = 'nodata'):
+    """
+    :param dem: 2D array of elevations (north up) with no data as NaN, covering the block plus a halo of one cell
+    :param cell_size: cell size in m
+    :param core_bounds: extent (xmin, ymin, xmax, ymax) of the block in m
+    :param slope_zero: value in degrees assigned to the aspect of flat cells (slope = 0) or 'nodata'
+    :return: dictionary of 2D float arrays covering the block (see terrain_indices())
+    """
+    return terrain_indices(dem, cell_size, bounds_latitudes(core_bounds, cell_size), slope_zero)
+
+
+blocks.register('terrain_indices', 1, terrain_block)
@@ -0,0 +1,112 @@
+### Functions for handling the 1 km tile grid of the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The tile ids have the format "rrrr_ccc", where rrrr is the northing and ccc the easting of the lower left corner
+# of the tile in km (ETRS89 / UTM zone 32N). The functions in this module derive tile extents, neighbourhoods and
+# pixel windows from the ids alone, without opening any files. Rasters aligned to the grid (tiles, mosaics) can be
+# cropped to a tile by array slicing or a gdal source window (srcWin) instead of a footprint cutline.
+
+## Imports
+import re
+import numpy
+
+# Tile size in m
+tile_size = 1000
+
+##### Function definitions
+
+## Split tile id into row and column number
+def parse_tile_id(tile_id):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: tuple of (row, col) as integers
+    """
+    match = re.match('^(\d+)_(\d+)$', tile_id)
+    if match is None:
+        raise ValueError('Invalid tile_id: ' + str(tile_id))
+    return int(match.group(1)), int(match.group(2))
+
+
+## Generate tile id from row and column number
+def make_tile_id(row, col):
+    """
+    :param row: row number (northing of the lower left corner in km)
+    :param col: column number (easting of the lower left corner in km)
+    :return: tile id in the format "rrrr_ccc"
+    """
+    return str(row) + '_' + str(col)
+
+
+## Extent of a tile
+def tile_bounds(tile_id):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: tuple of (xmin, ymin, xmax, ymax) in m
+    """
+    row, col = parse_tile_id(tile_id)
+    return col * tile_size, row * tile_size, (col + 1) * tile_size, (row + 1) * tile_size
+
+
+## Neighbourhood of a tile
+def neighbours(tile_id, distance = 1):
+    """
+    Returns the tile ids in the (2 * distance + 1) x (2 * distance + 1) neighbourhood of a tile, including the tile
+    itself, row by row from north to south and west to east within each row (i.e. in raster order).
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param distance: size of the neighbourhood in tiles
+    :return: list of lists of tile ids
+    """
+    row, col = parse_tile_id(tile_id)
+    return [[make_tile_id(row - row_offset, col + col_offset) for col_offset in range(-distance, distance + 1)]
+            for row_offset in range(-distance, distance + 1)]
+
+
+## Geo transform of a tile raster
+def tile_geo_transform(tile_id, cell_size, halo = 0):
+    """
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param cell_size: cell size in m
+    :param halo: number of cells around the tile
+    :return: gdal geo transform of a north up raster covering the tile (plus halo)
+    """
+    xmin, ymin, xmax, ymax = tile_bounds(tile_id)
+    return xmin - halo * cell_size, cell_size, 0, ymax + halo * cell_size, 0, -cell_size
+
+
+## Pixel window of a tile in a raster
+def pixel_window(tile_id, geo_transform, halo = 0):
+    """
+    Calculates the window of a tile in a north up raster aligned to the tile grid, e.g. a neighbourhood mosaic.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param geo_transform: gdal geo transform of the raster
+    :param halo: number of cells to include around the tile
+    :return: tuple of (col offset, row offset, n cols, n rows) as used for gdal srcWin, offsets can be negative or
+    the window can reach beyond the raster if the raster does not cover the tile (plus halo)
+    """
+    xmin, ymin, xmax, ymax = tile_bounds(tile_id)
+    col_start = int(round((xmin - geo_transform[0]) / geo_transform[1]))
+    row_start = int(round((geo_transform[3] - ymax) / -geo_transform[5]))
+    n_cols = int(round(tile_size / geo_transform[1]))
+    n_rows = int(round(tile_size / -geo_transform[5]))
+    return col_start - halo, row_start - halo, n_cols + 2 * halo, n_rows + 2 * halo
+
+
+## Crop an array of a raster to a tile
+def crop_to_tile(values, geo_transform, tile_id, halo = 0):
+    """
+    :param values: 2D array of the raster (north up), e.g. a neighbourhood mosaic
+    :param geo_transform: gdal geo transform of the raster
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param halo: number of cells to include around the tile, parts of the halo outside the raster are set to NaN
+    :return: 2D array covering the tile (plus halo)
+    """
+    col_start, row_start, n_cols, n_rows = pixel_window(tile_id, geo_transform)
+    if col_start < 0 or row_start < 0 or col_start + n_cols > values.shape[1] or \
+            row_start + n_rows > values.shape[0]:
+        raise ValueError('Raster does not cover tile ' + tile_id)
+    if halo == 0:
+        return values[row_start:(row_start + n_rows), col_start:(col_start + n_cols)]
+
+    # Pad the raster with no data where the halo reaches beyond it
+    padded = numpy.pad(values.astype(numpy.float64), halo, mode = 'constant', constant_values = numpy.nan)
+    return padded[row_start:(row_start + n_rows + 2 * halo), col_start:(col_start + n_cols + 2 * halo)]
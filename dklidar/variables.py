@@ -0,0 +1,258 @@
+### Registry of the output variables of the DK Lidar project and multi-band (stacked) output layout
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# All output variables are listed in the 'variables' registry with their folder (relative to settings.output_folder),
+# data type and theme. With settings.output_layout = 'stacked', the variables of a tile are written (or packed after
+# processing) as the bands of one multi-band GeoTiff per theme: <output_folder>/stacks/<theme>/<theme>_<tile_id>.tif.
+# The band descriptions hold the variable names. Use read_variable() to read a variable independent of the layout.
+
+## Imports
+import os
+import numpy
+
+from dklidar import settings
+from dklidar import common
+from dklidar.backends import gdal
+
+## Generate name of a point count output (defined first as it is used to set up the registry)
+def point_count_prefix(name, lower_limit, upper_limit):
+    """
+    Generates the name of a point count output (used as folder name and file prefix), e.g.
+    'vegetation_point_count_00m-50m'.
+    :param name: identifier name for the point count
+    :param lower_limit: lower limit for the height interval (normalised height in m)
+    :param upper_limit: upper limit for the height interval (normalised height in m)
+    :return: name of the point count output
+    """
+    if lower_limit < 10 and lower_limit >= 0: lower_limit_str = '0' + str(lower_limit)
+    elif lower_limit == -1: lower_limit_str = '-01'
+    else: lower_limit_str = str(lower_limit)
+
+    if upper_limit < 10 and upper_limit >= 0: upper_limit_str = '0' + str(upper_limit)
+    else: upper_limit_str = str(upper_limit)
+
+    return name + '_' + lower_limit_str + 'm-' + upper_limit_str + 'm'
+
+
+## Point counts exported for each tile (see points.py): (name, lower height limit, upper height limit, point classes)
+point_count_definitions = [('ground_point_count', -1, 1, [2]),
+                           ('water_point_count', -1, 1, [9]),
+                           ('ground_and_water_point_count', -1, 1, [2,9]),
+                           ('vegetation_point_count', 0, 50, [3,4,5]),
+                           ('building_point_count', -1, 50, [6]),
+                           ('total_point_count', -1, 50, [2,3,4,5,6,9])]
+# Vegetation point counts for continous height bins: 0-2 m at 0.5 m intervals
+for lower in numpy.arange(0, 2.0, 0.5):
+    point_count_definitions.append(('vegetation_point_count', lower, lower + 0.5, [3,4,5]))
+# 2-20 m at 1 m intervals
+for lower in range(2, 20, 1):
+    point_count_definitions.append(('vegetation_point_count', lower, lower + 1, [3,4,5]))
+# 20-25 m and 25-50 m
+point_count_definitions.append(('vegetation_point_count', 20, 25, [3,4,5]))
+point_count_definitions.append(('vegetation_point_count', 25, 50, [3,4,5]))
+
+## Proportions exported for each tile (see points.py): (name, point count numerator, point count denominator)
+proportion_definitions = [('canopy_openness', 'ground_and_water_point_count_-01m-01m', 'total_point_count_-01m-50m'),
+                          ('vegetation_density', 'vegetation_point_count_00m-50m', 'total_point_count_-01m-50m')]
+# Canopy height profile: 0-2 m at 0.5 m intervals
+for lower in numpy.arange(0, 2, 0.5):
+    proportion_definitions.append(('vegetation_proportion_0' + str(lower) + 'm-0' + str(lower + 0.5) + 'm',
+                                   'vegetation_point_count_0' + str(lower) + 'm-0' + str(lower + 0.5) + 'm',
+                                   'vegetation_point_count_00m-50m'))
+# 2-9 m at 1 m intervals
+for lower in range(2, 9, 1):
+    proportion_definitions.append(('vegetation_proportion_0' + str(lower) + 'm-0' + str(lower + 1) + 'm',
+                                   'vegetation_point_count_0' + str(lower) + 'm-0' + str(lower + 1) + 'm',
+                                   'vegetation_point_count_00m-50m'))
+# 9-10 m
+proportion_definitions.append(('vegetation_proportion_09m-10m', 'vegetation_point_count_09m-10m',
+                               'vegetation_point_count_00m-50m'))
+# 10-20 m at 1 m intervals
+for lower in range(10, 20, 1):
+    proportion_definitions.append(('vegetation_proportion_' + str(lower) + 'm-' + str(lower + 1) + 'm',
+                                   'vegetation_point_count_' + str(lower) + 'm-' + str(lower + 1) + 'm',
+                                   'vegetation_point_count_00m-50m'))
+# 20-25 m, 25-50 m and building proportion
+proportion_definitions.append(('vegetation_proportion_20m-25m', 'vegetation_point_count_20m-25m',
+                               'vegetation_point_count_00m-50m'))
+proportion_definitions.append(('vegetation_proportion_25m-50m', 'vegetation_point_count_25m-50m',
+                               'vegetation_point_count_00m-50m'))
+proportion_definitions.append(('building_proportion', 'building_point_count_-01m-50m', 'total_point_count_-01m-50m'))
+
+## Registry of output variables: (name, folder relative to settings.output_folder, data type, theme)
+variables = [('dtm_10m', 'dtm_10m', 'Int16', 'terrain'),
+             ('slope', 'slope', 'Int16', 'terrain'),
+             ('aspect', 'aspect', 'Int16', 'terrain'),
+             ('heat_load_index', 'heat_load_index', 'Int16', 'terrain'),
+             ('solar_radiation', 'solar_radiation', 'Int32', 'terrain'),
+             ('openness_mean', 'openness_mean', 'Int16', 'terrain'),
+             ('openness_difference', 'openness_difference', 'Int16', 'terrain'),
+             ('twi', 'twi', 'Int16', 'terrain'),
+             ('normalized_z_mean', 'normalized_z/normalized_z_mean', 'Int16', 'height'),
+             ('normalized_z_sd', 'normalized_z/normalized_z_sd', 'Int16', 'height'),
+             ('canopy_height', 'canopy_height', 'Int16', 'height')]
+# Optional canopy height percentiles (see points.laz_export_point_statistics()), only exported from the laz files
+for percentile in (settings.canopy_height_percentiles if settings.point_statistics == 'laz' else []):
+    variables.append(('canopy_height_p' + str(percentile),
+                      'canopy_height_percentiles/canopy_height_p' + str(percentile), 'Int16', 'height'))
+for name, lower_limit, upper_limit, point_classes in point_count_definitions:
+    prefix = point_count_prefix(name, lower_limit, upper_limit)
+    variables.append((prefix, 'point_count/' + prefix, 'Int16', 'point_count'))
+for prop_name, point_count_id1, point_count_id2 in proportion_definitions:
+    variables.append((prop_name, 'proportions/' + prop_name, 'Int16', 'proportions'))
+variables.extend([('amplitude_mean', 'amplitude/amplitude_mean', 'Float32', 'amplitude'),
+                  ('amplitude_sd', 'amplitude/amplitude_sd', 'Float32', 'amplitude'),
+                  ('date_stamp_mode', 'date_stamp/date_stamp_mode', 'Int32', 'date_stamp'),
+                  ('date_stamp_min', 'date_stamp/date_stamp_min', 'Int32', 'date_stamp'),
+                  ('date_stamp_max', 'date_stamp/date_stamp_max', 'Int32', 'date_stamp'),
+                  ('point_source_nids', 'point_source_info/point_source_nids', 'Int16', 'point_source'),
+                  ('sea_mask', 'masks/sea_mask', 'Int16', 'masks'),
+                  ('inland_water_mask', 'masks/inland_water_mask', 'Int16', 'masks')])
+
+# Look up of the registry entries by variable name
+variable_info = dict([(variable[0], variable) for variable in variables])
+
+# Themes in order of appearance
+themes = []
+for variable in variables:
+    if variable[3] not in themes: themes.append(variable[3])
+
+# Data types in order of precedence when combining variables in a stack
+data_type_precedence = ['Int16', 'Int32', 'Float32']
+
+##### Function definitions
+
+## File path of a variable for a tile (single band layout)
+def variable_file(name, tile_id):
+    """
+    :param name: variable name as in the registry
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: path to the single band raster of the variable for the tile
+    """
+    return settings.output_folder + '/' + variable_info[name][1] + '/' + name + '_' + tile_id + '.tif'
+
+
+## Variables of a theme
+def theme_variables(theme):
+    """
+    :param theme: name of the theme
+    :return: list of the variable names in the theme, in the order of the bands in the stack
+    """
+    return [variable[0] for variable in variables if variable[3] == theme]
+
+
+## Data type of a stack
+def stack_data_type(theme):
+    """
+    :param theme: name of the theme
+    :return: data type of the stack, i.e. the data type that can hold all variables of the theme
+    """
+    return data_type_precedence[max([data_type_precedence.index(variable_info[name][2])
+                                     for name in theme_variables(theme)])]
+
+
+## File path of a stack for a tile
+def stack_file(theme, tile_id):
+    """
+    :param theme: name of the theme
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: path to the multi-band raster of the theme for the tile
+    """
+    return settings.output_folder + '/stacks/' + theme + '/' + theme + '_' + tile_id + '.tif'
+
+
+## Write a stack for a tile
+def write_tile_stack(tile_id, theme, arrays):
+    """
+    Writes the variables of a theme as the bands of a single tiled and compressed GeoTiff. The band descriptions
+    are set to the variable names. Variables of the theme that are not supplied are written as no data.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param theme: name of the theme
+    :param arrays: dictionary of variable name -> 2D array covering the tile
+    :return: path to the stack
+    """
+    names = theme_variables(theme)
+    shape = list(arrays.values())[0].shape
+    bands = numpy.full([len(names)] + list(shape), numpy.nan)
+    for i, name in enumerate(names):
+        if name in arrays:
+            bands[i] = arrays[name]
+
+    out_file = stack_file(theme, tile_id)
+    if not os.path.exists(os.path.dirname(out_file)): os.makedirs(os.path.dirname(out_file))
+    common.write_tile_raster(bands, out_file, tile_id, stack_data_type(theme), band_names = names,
+                             creation_options = settings.stack_creation_options)
+    return out_file
+
+
+## Pack the single band outputs of a tile into stacks
+def stack_tile_outputs(tile_id, remove_single_band = True):
+    """
+    Packs the single band rasters written by the processing steps into one stack per theme and (optionally)
+    removes the single band rasters. Themes without any single band rasters for the tile are skipped.
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :param remove_single_band: remove the single band rasters after they have been packed
+    :return: execution status
+    """
+    return_value = 'success'
+    for theme in themes:
+        try:
+            arrays = {}
+            for name in theme_variables(theme):
+                file_name = variable_file(name, tile_id)
+                if os.path.exists(file_name):
+                    arrays[name] = read_single_band(file_name)
+            if len(arrays) == 0:
+                continue
+            write_tile_stack(tile_id, theme, arrays)
+            if remove_single_band:
+                for name in arrays:
+                    os.remove(variable_file(name, tile_id))
+        except Exception:
+            return_value = 'gdalError'
+    return return_value
+
+
+## Read a single band raster with no data as NaN
+def read_single_band(file_name, band = 1):
+    """
+    :param file_name: path to the raster
+    :param band: band number (1-based)
+    :return: float64 array with no data values set to NaN
+    """
+    raster = gdal.Open(file_name)
+    raster_band = raster.GetRasterBand(band)
+    values = raster_band.ReadAsArray().astype(numpy.float64)
+    no_data = raster_band.GetNoDataValue()
+    if no_data is not None:
+        values[values == no_data] = numpy.nan
+    raster_band = None
+    raster = None
+    return values
+
+
+## Map variable names to the bands of a stack
+def stack_band_map(file_name):
+    """
+    :param file_name: path to a stack
+    :return: dictionary of variable name -> band number (1-based) from the band descriptions
+    """
+    raster = gdal.Open(file_name)
+    band_map = dict([(raster.GetRasterBand(band).GetDescription(), band)
+                     for band in range(1, raster.RasterCount + 1)])
+    raster = None
+    return band_map
+
+
+## Read a variable for a tile independent of the output layout
+def read_variable(name, tile_id):
+    """
+    Reads a variable for a tile from the stack of its theme if it exists, otherwise from the single band raster.
+    :param name: variable name as in the registry
+    :param tile_id: tile id in the format "rrrr_ccc" where rrrr is the row number and ccc is the column number
+    :return: float64 array with no data values set to NaN
+    """
+    file_name = stack_file(variable_info[name][3], tile_id)
+    if os.path.exists(file_name):
+        return read_single_band(file_name, stack_band_map(file_name)[name])
+    return read_single_band(variable_file(name, tile_id))
@@ -0,0 +1,341 @@
+### Functions for building and updating the mosaic VRTs of the output variables for the DK Lidar project
+### Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# The VRT of a variable folder (<folder>/<folder name>.vrt) mosaics all tiles in the folder. As the position of each
+# tile follows from its tile id (see tilegrid.py) and all tiles of a variable share the same size, data type and no
+# data value, the VRT is written directly from the file names. Only one tile is opened (as a template) rather than
+# every file as with gdalbuildvrt. Tiles can be added or removed by rewriting the source list of an existing VRT.
+
+## Imports
+import os
+import re
+from xml.sax.saxutils import escape
+from xml.etree.ElementTree import iterparse
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import variables
+from dklidar.backends import gdal
+
+# Pattern of the tile id at the end of an output file name, e.g. "dtm_10m_6049_441.tif"
+tile_file_pattern = re.compile('^.*_(\d{4}_\d{3})\.tif$')
+
+##### Function definitions
+
+## Tile id of an output file
+def file_tile_id(file_name):
+    """
+    :param file_name: output file name (with or without path)
+    :return: tile id in the format "rrrr_ccc", or None if the file name does not end in a tile id
+    """
+    match = tile_file_pattern.match(os.path.basename(file_name))
+    if match is None:
+        return None
+    return match.group(1)
+
+
+## List the variable folders in the output folder
+def list_variable_folders(output_folder = None):
+    """
+    Lists the folders holding the tiles of a variable, i.e. the sub-folders of the output folder or, for grouped
+    variables (e.g. point_count), their sub-folders.
+    :param output_folder: output folder, defaults to settings.output_folder
+    :return: list of folder paths
+    """
+    if output_folder is None: output_folder = settings.output_folder
+    folders = []
+    for folder in sorted(os.listdir(output_folder)):
+        folder = os.path.join(output_folder, folder)
+        if not os.path.isdir(folder): continue
+        sub_folders = [os.path.join(folder, sub_folder) for sub_folder in sorted(os.listdir(folder))
+                       if os.path.isdir(os.path.join(folder, sub_folder))]
+        if len(sub_folders) > 0:
+            folders.extend(sub_folders)
+        else:
+            folders.append(folder)
+    return [re.sub('\\\\', '/', folder) for folder in folders]
+
+
+## File name of the VRT of a variable folder
+def vrt_file_name(folder):
+    """
+    :param folder: variable folder
+    :return: path to the VRT of the folder (named after the folder)
+    """
+    folder = re.sub('[\\\\/]+$', '', folder)
+    return folder + '/' + os.path.basename(folder) + '.vrt'
+
+
+## List the tiles in a variable folder
+def list_tile_files(folder):
+    """
+    :param folder: variable folder
+    :return: sorted list of the names (without path) of the tile rasters in the folder
+    """
+    return sorted([file_name for file_name in os.listdir(folder) if file_tile_id(file_name) is not None])
+
+
+## Raster properties of a tile used as template for the VRT
+def raster_template(file_name):
+    """
+    :param file_name: path to a tile raster
+    :return: dictionary with the raster properties shared by all tiles of a variable
+    """
+    raster = gdal.Open(file_name)
+    band = raster.GetRasterBand(1)
+    block_x_size, block_y_size = band.GetBlockSize()
+    template = {'x_size': raster.RasterXSize,
+                'y_size': raster.RasterYSize,
+                'n_bands': raster.RasterCount,
+                'cell_size': raster.GetGeoTransform()[1],
+                'srs': raster.GetProjection(),
+                'data_type': gdal.GetDataTypeName(band.DataType),
+                'no_data': band.GetNoDataValue(),
+                'block_x_size': block_x_size,
+                'block_y_size': block_y_size,
+                'band_names': [raster.GetRasterBand(i).GetDescription() for i in range(1, raster.RasterCount + 1)]}
+    band = None
+    raster = None
+    return template
+
+
+## Format a number for the VRT
+def format_value(value):
+    """
+    :param value: number
+    :return: number as string, integers without decimals
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+## Generate the VRT xml
+def vrt_xml(file_names, template, extent = None):
+    """
+    :param file_names: names of the tile rasters (relative to the VRT)
+    :param template: raster properties of the tiles (see raster_template())
+    :param extent: extent of the VRT (xmin, ymin, xmax, ymax) in m, defaults to settings.vrt_extent
+    :return: VRT as string
+    """
+    if extent is None: extent = settings.vrt_extent
+    xmin, ymin, xmax, ymax = extent
+    cell_size = template['cell_size']
+    x_size = int(round((xmax - xmin) / cell_size))
+    y_size = int(round((ymax - ymin) / cell_size))
+
+    # Position of each tile in the VRT
+    sources = []
+    for file_name in file_names:
+        tile_xmin, tile_ymin, tile_xmax, tile_ymax = tilegrid.tile_bounds(file_tile_id(file_name))
+        if tile_xmin < xmin or tile_ymin < ymin or tile_xmax > xmax or tile_ymax > ymax:
+            raise ValueError('Tile ' + file_name + ' outside of the VRT extent ' + str(extent))
+        sources.append((escape(file_name),
+                        int(round((tile_xmin - xmin) / cell_size)),
+                        int(round((ymax - tile_ymax) / cell_size))))
+
+    lines = ['<VRTDataset rasterXSize="' + str(x_size) + '" rasterYSize="' + str(y_size) + '">',
+             '  <SRS dataAxisToSRSAxisMapping="1,2">' + escape(template['srs']) + '</SRS>',
+             '  <GeoTransform> ' + ', '.join([format_value(value) for value in
+                                             [xmin, cell_size, 0, ymax, 0, -cell_size]]) + '</GeoTransform>']
+    source_properties = '      <SourceProperties RasterXSize="' + str(template['x_size']) + \
+                        '" RasterYSize="' + str(template['y_size']) + \
+                        '" DataType="' + template['data_type'] + \
+                        '" BlockXSize="' + str(template['block_x_size']) + \
+                        '" BlockYSize="' + str(template['block_y_size']) + '" />'
+    source_rect = '      <SrcRect xOff="0" yOff="0" xSize="' + str(template['x_size']) + \
+                  '" ySize="' + str(template['y_size']) + '" />'
+    for band in range(1, template['n_bands'] + 1):
+        lines.append('  <VRTRasterBand dataType="' + template['data_type'] + '" band="' + str(band) + '">')
+        if template['band_names'][band - 1] != '':
+            lines.append('    <Description>' + escape(template['band_names'][band - 1]) + '</Description>')
+        if template['no_data'] is not None:
+            lines.append('    <NoDataValue>' + format_value(template['no_data']) + '</NoDataValue>')
+        for file_name, x_offset, y_offset in sources:
+            lines.append('    <ComplexSource>')
+            lines.append('      <SourceFilename relativeToVRT="1">' + file_name + '</SourceFilename>')
+            lines.append('      <SourceBand>' + str(band) + '</SourceBand>')
+            lines.append(source_properties)
+            lines.append(source_rect)
+            lines.append('      <DstRect xOff="' + str(x_offset) + '" yOff="' + str(y_offset) +
+                         '" xSize="' + str(template['x_size']) + '" ySize="' + str(template['y_size']) + '" />')
+            if template['no_data'] is not None:
+                lines.append('      <NODATA>' + format_value(template['no_data']) + '</NODATA>')
+            lines.append('    </ComplexSource>')
+        lines.append('  </VRTRasterBand>')
+    lines.append('</VRTDataset>')
+    return '\n'.join(lines) + '\n'
+
+
+## Write a VRT
+def write_vrt(vrt_file, file_names, template = None):
+    """
+    Writes the VRT to a temporary file first, so that readers never see a partially written VRT.
+    :param vrt_file: path to the VRT
+    :param file_names: names of the tile rasters (in the same folder as the VRT)
+    :param template: raster properties of the tiles, defaults to those of the first tile
+    :return: nothing
+    """
+    file_names = sorted(file_names)
+    if template is None: template = raster_template(os.path.dirname(vrt_file) + '/' + file_names[0])
+    temp_file = vrt_file + '.temp'
+    out_file = open(temp_file, 'w')
+    out_file.write(vrt_xml(file_names, template))
+    out_file.close()
+    if os.path.exists(vrt_file): os.remove(vrt_file)
+    os.rename(temp_file, vrt_file)
+
+
+## Build the VRT of a variable folder
+def build_vrt(folder):
+    """
+    :param folder: variable folder
+    :return: execution status
+    """
+    try:
+        file_names = list_tile_files(folder)
+        if len(file_names) == 0:
+            return 'no tiles'
+        write_vrt(vrt_file_name(folder), file_names)
+        return 'success'
+    except Exception:
+        return 'gdalError'
+
+
+## Update the VRT of a variable folder
+def update_vrt(folder, add = None, remove = None):
+    """
+    Adds and / or removes tiles from the VRT of a variable folder. If neither is specified, the VRT is synchronised
+    with the tiles in the folder. The VRT is only rewritten if its list of tiles changes, and is built from scratch
+    if it does not exist yet.
+    :param folder: variable folder
+    :param add: names of tile rasters to add
+    :param remove: names of tile rasters to remove
+    :return: execution status
+    """
+    vrt_file = vrt_file_name(folder)
+    if not os.path.exists(vrt_file):
+        return build_vrt(folder)
+    try:
+        sources = vrt_sources(vrt_file)
+        if add is None and remove is None:
+            file_names = set(list_tile_files(folder))
+        else:
+            file_names = (sources | set([os.path.basename(file_name) for file_name in (add or [])])) - \
+                         set([os.path.basename(file_name) for file_name in (remove or [])])
+        if file_names == sources:
+            return 'unchanged'
+        if len(file_names) == 0:
+            os.remove(vrt_file)
+            return 'success'
+        write_vrt(vrt_file, file_names)
+        return 'success'
+    except Exception:
+        return 'gdalError'
+
+
+## List the sources of a VRT
+def vrt_sources(vrt_file):
+    """
+    :param vrt_file: path to the VRT
+    :return: set of the source file names (as written in the VRT) of the first band
+    """
+    return set(vrt_band_sources(vrt_file)[0])
+
+
+## List the sources of each band of a VRT
+def vrt_band_sources(vrt_file):
+    """
+    Parses the SourceFilename entries of a VRT with a streaming parser (the VRT is never held in memory as a whole).
+    :param vrt_file: path to the VRT
+    :return: list (one entry per band) of lists of source file names
+    """
+    band_sources = []
+    for event, element in iterparse(vrt_file, events = ('start', 'end')):
+        if event == 'start' and element.tag == 'VRTRasterBand':
+            band_sources.append([])
+        elif event == 'end' and element.tag == 'SourceFilename':
+            band_sources[-1].append(element.text)
+        elif event == 'end' and element.tag in ['ComplexSource', 'SimpleSource']:
+            element.clear()
+    return band_sources
+
+
+## Data type of the bands of a VRT
+def vrt_band_data_type(vrt_file):
+    """
+    Parses the data type of the first band of a VRT with a streaming parser (stops at the first band).
+    :param vrt_file: path to the VRT
+    :return: data type of the band, None if the VRT has no bands
+    """
+    for event, element in iterparse(vrt_file, events = ('start',)):
+        if element.tag == 'VRTRasterBand':
+            return element.get('dataType')
+    return None
+
+
+## Data type of a tile raster
+def tile_data_type(file_name):
+    """
+    :param file_name: path to a tile raster
+    :return: data type of the first band, read from the header only (no data is decoded)
+    """
+    raster = gdal.Open(file_name)
+    if raster is None:
+        raise Exception('Unable to open raster: ' + file_name)
+    data_type = gdal.GetDataTypeName(raster.GetRasterBand(1).DataType)
+    raster = None
+    return data_type
+
+
+## Expected data type of the tiles in a variable folder
+def expected_data_type(folder):
+    """
+    :param folder: variable folder
+    :return: data type of the variable according to the variable registry (variables.py), or None if the folder
+    does not belong to a registered variable
+    """
+    folder = re.sub('[\\\\/]+', '/', folder).rstrip('/')
+    output_folder = re.sub('[\\\\/]+', '/', settings.output_folder).rstrip('/')
+    if not folder.startswith(output_folder + '/'):
+        return None
+    relative_folder = folder[len(output_folder) + 1:]
+    for name, variable_folder, data_type, theme in variables.variables:
+        if variable_folder == relative_folder:
+            return data_type
+    return None
+
+
+## Check the completeness of the VRT of a variable folder
+def check_vrt(folder, data_types = None):
+    """
+    Compares the sources of the VRT of a variable folder with the tiles in the folder in a single pass over both,
+    using set differences. Reports tiles missing from the VRT, sources in the VRT without a tile in the folder
+    (extra) and tiles with a data type that differs from that of the variable (registry, or the VRT band if the
+    variable is not registered). The data types written to the VRT are those of the template tile (see vrt_xml()),
+    so the data types of the tiles themselves are checked: taken from data_types (e.g. the output manifest, see
+    manifest.folder_data_types()) or otherwise read from the header of each tile.
+    :param folder: variable folder
+    :param data_types: optional dictionary of tile file name -> data type, e.g. from the output manifest
+    :return: list of (file name, error) tuples, empty if the VRT is complete
+    """
+    vrt_file = vrt_file_name(folder)
+    if not os.path.exists(vrt_file):
+        return [('', 'vrt file missing')]
+    if data_types is None: data_types = {}
+    data_type = expected_data_type(folder)
+    if data_type is None: data_type = vrt_band_data_type(vrt_file)
+    sources = vrt_sources(vrt_file)
+    file_names = set(list_tile_files(folder))
+    errors = [(file_name, 'missing') for file_name in sorted(file_names - sources)]
+    errors += [(file_name, 'extra') for file_name in sorted(sources - file_names)]
+    for file_name in sorted(file_names & sources):
+        try:
+            tile_type = data_types.get(file_name)
+            if tile_type is None: tile_type = tile_data_type(folder.rstrip('/') + '/' + file_name)
+        except Exception:
+            errors.append((file_name, 'unreadable'))
+            continue
+        if tile_type != data_type:
+            errors.append((file_name, 'wrong data type (' + tile_type + ' instead of ' + str(data_type) + ')'))
+    return errors
@@ -10,7 +10,7 @@ import pandas
 import glob
 import re
 import scandir
-import hashlib
+from dklidar import checksums
 
 # Status
 print('#' * 80)
@@ -163,14 +163,16 @@ def check_var(var_folder):
     print('\tDone.\n')
     return(files_with_errors)
 
-# The function below is thanks to stackoverflow usesrs quantumSoup and user2653663
-# https://stackoverflow.com/questions/3431825/generating-an-md5-checksum-of-a-file
+# Checksums of the source and destination trees (see dklidar/checksums.py), filled in the main body of the script.
+# The checksum manifests are kept next to the script, so unchanged files are not hashed again in later checks.
+tree_checksums = {}
+
 def md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    # Look up checksum of file in the checksums of its tree (None if the file could not be hashed)
+    for root in tree_checksums:
+        if fname.startswith(root + '/'):
+            return tree_checksums[root].get(fname[len(root) + 1:])
+    return None
 
 def check_tiles(tiles_to_check, files_df, source_folder, out_folder):
     # Subset files to check
@@ -188,8 +190,12 @@ def check_tiles(tiles_to_check, files_df, source_folder, out_folder):
           # Check whether files exists
           if os.path.isfile(source_folder + '/' + files_to_check[i]):
                 if os.path.isfile(out_folder + '/' + files_to_check[i]): 
-                    match = md5(source_folder + '/' + files_to_check[i]) == md5(out_folder + '/' + files_to_check[i])
-                    if not match:
+                    source_md5 = md5(source_folder + '/' + files_to_check[i])
+                    out_md5 = md5(out_folder + '/' + files_to_check[i])
+                    if source_md5 is None or out_md5 is None:
+                        files.append(files_to_check[i])
+                        status.append('checksum_missing')
+                    elif not source_md5 == out_md5:
                         files.append(files_to_check[i])
                         status.append('md5_mismatch')
                 else:
@@ -239,6 +245,17 @@ if missing_tiles > 0:
 else:
     print('\n=> Sets are complete, proceeding as planned.\n')
   
+## Hash all source and destination trees in parallel
+
+# Status
+print('Calculating checksums...'),
+for root, manifest_name in [(folder_original_processing, 'checksums_original_processing.sqlite'),
+                            (folder_reprocessing_1, 'checksums_reprocessing_1.sqlite'),
+                            (folder_reprocessing_2, 'checksums_reprocessing_2.sqlite'),
+                            (dest_folder, 'checksums_merged.sqlite')]:
+    tree_checksums[root] = checksums.hash_tree(root, manifest_name, 'md5')
+print(' done.\n')
+
 ## Check tiles for all variables
 
 # Status
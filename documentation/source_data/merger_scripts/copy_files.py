@@ -9,6 +9,7 @@ import shutil
 import pandas
 import glob
 import re
+from dklidar import merge
 
 ## Status
 print('\n' + '#' * 80)
@@ -84,28 +85,16 @@ def copy_tiles(tiles_to_copy, files_df, out_folder):
 
     # Subset files to copy
     files_to_copy = files_df[files_df['tile_id'].
-                             isin(tiles_to_copy)]['file_name'].tolist()
-    
-    # Set counter to 0:
-    progress = 0 
-    
-    # Copy files
-    for i in range(0, len(files_to_copy)):
-          # Check whether file exists, if not copy
-          if not os.path.isfile(os.getcwd() + '/' + out_folder +
-                                re.sub('.*/(.*)', '\g<1>', files_to_copy[i])):
-                # Copy file
-                shutil.copy(files_to_copy[i],
-                            os.getcwd() + '/' + out_folder +
-                            re.sub('.*/(.*)', '\g<1>', files_to_copy[i]))
-          # Update progress
-          progress = float(i + 1) / float(len(files_to_copy))
-          # Update progress bar
-          print('\r|' +
-                '#' * int(round(progress * 54)) +
-                '-' * int(round((1 - progress) * 54)) +
-                '| ' +
-                str(int(round(progress * 100))) + '%'),
+                             isin(tiles_to_copy)]
+
+    # Plan merge: (source file, destination file, tile_id, batch)
+    plan = [(file_name, re.sub('.*/(.*)', '\g<1>', file_name), tile_id, re.sub('(.*)/.*', '\g<1>', file_name))
+            for tile_id, file_name in zip(files_to_copy['tile_id'], files_to_copy['file_name'])]
+
+    # Link / copy files in parallel (hardlinks where possible), skips files already merged
+    summary = merge.merge_files(plan, os.getcwd() + '/' + out_folder,
+                                provenance_file = os.getcwd() + '/merge_provenance.sqlite')
+    print(', '.join([method + ': ' + str(summary[method]) for method in sorted(summary)])),
 
 # Copy laz files
 print('\nCopying GST2014 laz files...')
@@ -10,6 +10,7 @@ import pandas
 import glob
 import re
 import scandir
+from dklidar import merge
 
 # Status
 print('#' * 80)
@@ -115,24 +116,15 @@ def get_tile_ids(file_names):
 def copy_tiles(tiles_to_copy, files_df, source_folder, out_folder):
     # Subset files to copy
     files_to_copy = files_df[files_df['tile_id'].
-                             isin(tiles_to_copy['tile_id'].tolist())]['file_name'].tolist() 
-    # Set counter to 0:
-    progress = 0 
-    # Copy files
-    for i in range(0, len(files_to_copy)):
-          # Check whether file exists, if not copy
-          if not os.path.isfile(out_folder + '/' + files_to_copy[i]):
-                # Copy file
-                shutil.copy(source_folder + '/' + files_to_copy[i],
-                            out_folder + '/' + files_to_copy[i])
-          # Update progress
-          progress = float(i + 1) / float(len(files_to_copy))
-          # Update progress bar
-          print('\r\t|' +
-                '-' * int(round(progress * 54)) +
-                ' ' * int(round((1 - progress) * 54)) +
-                '| ' +
-                str(int(round(progress * 100))) + '%'),
+                             isin(tiles_to_copy['tile_id'].tolist())]
+    # Plan merge: (source file, destination file, tile_id, batch)
+    plan = [(source_folder + '/' + file_name, file_name, tile_id, source_folder)
+            for tile_id, file_name in zip(files_to_copy['tile_id'], files_to_copy['file_name'])]
+    # Link / copy files in parallel (hardlinks where possible), skips files already merged
+    # provenance is recorded in the merged output folder
+    summary = merge.merge_files(plan, out_folder,
+                                provenance_file = dest_folder + '/merge_provenance.sqlite')
+    print('\t' + ', '.join([method + ': ' + str(summary[method]) for method in sorted(summary)])),
 
 def check_dir(folder_path):
     # Check if dir exists
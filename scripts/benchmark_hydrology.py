@@ -0,0 +1,68 @@
+# Short script to benchmark the hydrology calculations (dklidar/hydrology.py) for different block sizes: a 3 km tile
+# neighbourhood mosaic, a 30 km block and a block of the national hydrology stage (settings.hydrology_block_size plus
+# halo). Times sink filling, flow accumulation and the TWI (incl. slope and specific catchment area) on synthetic
+# terrain, or on the DTM around a tile if a tile id is supplied (requires gdal and the DTM tiles).
+# Usage: python benchmark_hydrology.py [sizes in km, comma separated] [tile id]
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import time
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import hydrology
+from dklidar import blocks
+from dklidar import backends
+
+# Block sizes in km and optional tile id at the centre of the DTM blocks
+national_size = (settings.hydrology_block_size + 2 * settings.hydrology_halo) / 1000
+sizes = [float(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else [3, 30, national_size]
+tile_id = sys.argv[2] if len(sys.argv) > 2 else None
+cell_size = settings.out_cell_size
+
+
+## Synthetic terrain: smooth random surface with a regional gradient and closed depressions
+def synthetic_dem(n_cells, seed = 42):
+    random = numpy.random.RandomState(seed)
+    coarse = random.rand(n_cells // 50 + 2, n_cells // 50 + 2) * 20
+    dem = numpy.kron(coarse, numpy.ones((50, 50)))[:n_cells, :n_cells]
+    dem = dem + numpy.linspace(0, n_cells * cell_size / 1000.0, n_cells)[numpy.newaxis, :]
+    return dem + random.rand(n_cells, n_cells) * 0.1
+
+
+## Time a function call
+def timed(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return result, time.time() - start_time
+
+
+print('#' * 80)
+print('Benchmarking hydrology at ' + str(cell_size) + ' m (numba ' +
+      ('available' if backends.is_available(backends.numba) else 'not installed, plain Python kernels') + ')\n')
+
+# Compile the kernels on a small raster first, so compilation is not included in the timings
+hydrology.twi(synthetic_dem(100), cell_size)
+
+print('size [km]'.rjust(10) + 'cells'.rjust(14) + 'fill [s]'.rjust(12) + 'accum. [s]'.rjust(12) + 'twi [s]'.rjust(12) +
+      'cells / s'.rjust(14))
+print('-' * 80)
+for size in sizes:
+    n_cells = int(round(size * 1000 / cell_size))
+    if tile_id is None:
+        dem = synthetic_dem(n_cells)
+    else:
+        xmin, ymin, xmax, ymax = tilegrid.tile_bounds(tile_id)
+        half_size = size * 1000 / 2.0
+        dem = blocks.read_dtm_window((xmin + 500 - half_size, ymin + 500 - half_size,
+                                        xmax - 500 + half_size, ymax - 500 + half_size), cell_size)
+    (filled, order), fill_time = timed(hydrology.priority_flood, dem, cell_size)
+    accumulation, accumulation_time = timed(hydrology.flow_accumulation, filled, cell_size, None, order)
+    filled = order = accumulation = None
+    twi, twi_time = timed(hydrology.twi, dem, cell_size)
+    print(('%g' % size).rjust(10) + str(dem.size).rjust(14) + ('%.2f' % fill_time).rjust(12) +
+          ('%.2f' % accumulation_time).rjust(12) + ('%.2f' % twi_time).rjust(12) +
+          ('%.0f' % (dem.size / twi_time)).rjust(14))
+print('-' * 80)
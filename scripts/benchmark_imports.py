@@ -0,0 +1,66 @@
+# Short script to benchmark the import time of the dklidar modules
+# Each import is timed in a fresh Python interpreter, as a pool worker would experience it.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import subprocess
+
+# Number of repeats per import
+n_repeats = 5
+
+# Imports to benchmark: the dklidar modules and, for reference, an eager import of the backends
+imports = ['dklidar.settings',
+           'dklidar.backends',
+           'dklidar.common',
+           'dklidar.points',
+           'dklidar.dtm',
+           'dklidar.progress',
+           'opals',
+           'osgeo.gdal_array',
+           'pandas']
+
+# Python snippet run in the fresh interpreter: times the import and reports which backends were loaded
+snippet = '''
+import sys, time
+start = time.time()
+import %s
+duration = time.time() - start
+loaded = [name for name in ['opals', 'osgeo', 'pandas'] if name in sys.modules]
+sys.stdout.write(repr(duration) + ' ' + ','.join(loaded))
+'''
+
+
+## Time a single import in a fresh interpreter
+def time_import(module_name):
+    try:
+        output = subprocess.check_output([sys.executable, '-c', snippet % module_name],
+                                         stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        return None, 'import failed'
+    output = output.decode('utf-8').strip().split(' ')
+    loaded = output[1] if len(output) > 1 else '-'
+    return float(output[0]), loaded
+
+
+if __name__ == '__main__':
+    # Status
+    print('#' * 80)
+    print('Import times of the dklidar modules (best of ' + str(n_repeats) + ' runs in a fresh interpreter)\n')
+    print('module'.ljust(24) + 'time [ms]'.rjust(12) + '   backends loaded')
+    print('-' * 80)
+
+    for module_name in imports:
+        timings = []
+        loaded = '-'
+        for i in range(n_repeats):
+            duration, loaded = time_import(module_name)
+            if duration is None:
+                break
+            timings.append(duration)
+        if len(timings) == 0:
+            print(module_name.ljust(24) + 'n/a'.rjust(12) + '   ' + loaded)
+        else:
+            print(module_name.ljust(24) + ('%.1f' % (min(timings) * 1000)).rjust(12) + '   ' + loaded)
+
+    print('-' * 80)
@@ -0,0 +1,67 @@
+# Script to build overviews for the national VRTs of all output variables
+# The overviews are written as compressed external overview files (.vrt.ovr) next to the VRTs, so that the
+# nationwide mosaics can be displayed and read at coarse resolutions without touching each of the tiles.
+# Run after the VRTs have been generated. Overview levels and compression are set in dklidar/settings.py.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import glob
+import re
+import datetime
+import subprocess
+import multiprocessing
+
+from dklidar import settings
+
+# Set number of parallel processes:
+n_processes = 16
+
+# Variables with categorical values or codes, resampled using the nearest neighbour (all others are averaged)
+nearest_patterns = ['mask', 'date_stamp', 'point_source', 'aspect']
+
+
+## Build overviews for a VRT
+def build_overviews(vrt_file):
+    resampling = 'nearest' if any([pattern in vrt_file for pattern in nearest_patterns]) else 'average'
+    cmd = settings.gdaladdo_bin + \
+          '-ro -r ' + resampling + ' ' + \
+          '--config COMPRESS_OVERVIEW ' + settings.vrt_overview_compression + ' ' + \
+          '--config PREDICTOR_OVERVIEW 2 --config GDAL_TIFF_OVR_BLOCKSIZE 256 ' + \
+          vrt_file + ' ' + ' '.join([str(level) for level in settings.vrt_overview_levels])
+    try:
+        subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
+        return vrt_file, 'success'
+    except:
+        return vrt_file, 'gdalError'
+
+
+#### Main body of script
+if __name__ == '__main__':
+
+    ## Start timer
+    startTime = datetime.datetime.now()
+
+    ## Status output to console
+    print('\n' + '-' * 80 + 'Starting build_vrt_overviews.py at ' + str(startTime.strftime('%c')) + '\n')
+
+    # List vrts (same as generate_list_of_vrts.py)
+    vrts = glob.glob(settings.output_folder + '*/*.vrt') + glob.glob(settings.output_folder + '*/*/*.vrt')
+    vrts = [re.sub('\\\\', '/', vrt) for vrt in vrts]
+
+    # Set up processing pool
+    multiprocessing.set_executable(settings.python_exec_path)
+    pool = multiprocessing.Pool(processes=n_processes)
+
+    # Build overviews
+    print(datetime.datetime.now().strftime('%X') + ' Building overviews for ' + str(len(vrts)) + ' vrts ... '),
+    overview_status = pool.map(build_overviews, vrts)
+    pool.close()
+    print('done.')
+
+    # Report failures
+    failed = [vrt_file for vrt_file, return_value in overview_status if return_value != 'success']
+    if len(failed) > 0:
+        print('Building overviews failed for ' + str(len(failed)) + ' vrts:\n' + '\n'.join(sorted(failed)))
+
+    # Print out time elapsed:
+    print('\nTime elapsed: ' + str(datetime.datetime.now() - startTime))
@@ -0,0 +1,56 @@
+# Script to build (or update) the mosaic VRTs of all output variables (see dklidar/vrt.py)
+# The VRTs are written from the tile ids in the file names, only one tile per variable is opened. By default the
+# existing VRTs are updated, i.e. only rewritten if tiles were added to or removed from a folder. Use --rebuild to
+# rebuild all VRTs from scratch. Replaces make_vrt_subfolders.bat.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import datetime
+import multiprocessing
+
+from dklidar import settings
+from dklidar import vrt
+
+# Set number of parallel processes:
+n_processes = 16
+
+
+## Build or update the VRT of a folder
+def build_folder_vrt(folder):
+    if '--rebuild' in sys.argv:
+        return folder, vrt.build_vrt(folder)
+    return folder, vrt.update_vrt(folder)
+
+
+#### Main body of script
+if __name__ == '__main__':
+
+    ## Start timer
+    startTime = datetime.datetime.now()
+
+    ## Status output to console
+    print('\n' + '-' * 80 + 'Starting build_vrts.py at ' + str(startTime.strftime('%c')) + '\n')
+
+    # List variable folders
+    folders = vrt.list_variable_folders()
+
+    # Set up processing pool
+    multiprocessing.set_executable(settings.python_exec_path)
+    pool = multiprocessing.Pool(processes=n_processes)
+
+    # Build vrts
+    print(datetime.datetime.now().strftime('%X') + ' Building vrts for ' + str(len(folders)) + ' folders ... '),
+    vrt_status = pool.map(build_folder_vrt, folders)
+    pool.close()
+    print('done.')
+
+    # Report
+    for status in ['success', 'unchanged', 'no tiles', 'gdalError']:
+        print(status.ljust(12) + str(len([folder for folder, return_value in vrt_status if return_value == status])))
+    failed = [folder for folder, return_value in vrt_status if return_value == 'gdalError']
+    if len(failed) > 0:
+        print('Building vrts failed for:\n' + '\n'.join(sorted(failed)))
+
+    # Print out time elapsed:
+    print('\nTime elapsed: ' + str(datetime.datetime.now() - startTime))
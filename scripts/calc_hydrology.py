@@ -0,0 +1,56 @@
+# Script for the national hydrology stage: calculates the TWI following Kopecky et al. 2020 on large blocks of the
+# national 10 m DTM (see dklidar/hydrology.py) and writes it into the national TWI raster (settings.twi_file).
+# Each block is processed with a halo (settings.hydrology_halo) around it, so catchments are only truncated if they
+# reach further than the halo beyond the block. The blocks are processed in parallel, the main process writes the
+# results into the raster. Run before process_tiles.py, which slices the twi tiles from the raster.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import datetime
+import multiprocessing
+
+from dklidar import settings
+from dklidar import hydrology
+from dklidar import catalogue
+
+
+#### Main body of script
+if __name__ == '__main__':
+
+    ## Start timer
+    startTime = datetime.datetime.now()
+
+    ## Status output to console
+    print('\n' + '-' * 80 + 'Starting calc_hydrology.py at ' + str(startTime.strftime('%c')) + '\n')
+
+    # Create national TWI raster
+    print(datetime.datetime.now().strftime('%X') + ' Creating ' + settings.twi_file + ' ... '),
+    twi_raster = hydrology.create_twi_raster()
+    print('done.')
+
+    # Determine blocks
+    blocks = hydrology.block_bounds()
+    print(datetime.datetime.now().strftime('%X') + ' Processing ' + str(len(blocks)) + ' blocks of ' +
+          str(settings.hydrology_block_size / 1000) + ' km with a ' + str(settings.hydrology_halo / 1000) +
+          ' km halo ...')
+
+    # Set up processing pool, the workers use the dtm catalogue of the main process
+    catalogue.get_catalogue('dtm')
+    multiprocessing.set_executable(settings.python_exec_path)
+    pool = multiprocessing.Pool(processes=settings.hydrology_n_processes, initializer=catalogue.set_loaded_catalogues,
+                                initargs=(catalogue.loaded_catalogues,))
+
+    # Calculate TWI for each block and write into the national raster
+    n_done = 0
+    for core_bounds, values in pool.imap_unordered(hydrology.twi_block, blocks):
+        n_done += 1
+        if values is not None:
+            hydrology.write_twi_block(twi_raster, core_bounds, values)
+            twi_raster.FlushCache()
+        print(datetime.datetime.now().strftime('%X') + ' Block ' + str(n_done) + '/' + str(len(blocks)) + ' ' +
+              str(core_bounds) + (' done.' if values is not None else ' no DTM, skipped.'))
+    pool.close()
+    twi_raster = None
+
+    # Print out time elapsed:
+    print('\nTime elapsed: ' + str(datetime.datetime.now() - startTime))
@@ -1,92 +1,47 @@
-# EcoDes-DK15 check validity of outputs based on whether gdal can open the file.
+# EcoDes-DK15 check completeness of the vrts: compares the sources of each vrt with the tiles in its folder.
 # Jakob J. Assmann j.assmann@bio.au.dk 2 December 2021
 
+# The sources of each vrt are parsed once (streaming xml parser) into a set and compared with the set of tiles in the
+# folder (see dklidar/vrt.py: check_vrt()). Reports tiles missing from the vrt, extra sources without a tile and
+# tiles with the wrong data type. The data types of the tiles are taken from the output manifest (see
+# check_outputs_integrity.py) for files that have not changed since they were validated, all other tiles are opened
+# with gdal (header only).
+
 # Dependencies
-import scandir
-import pandas
-import re
 import os
+import pandas
 import tqdm
-import itertools
 import multiprocessing
-from osgeo import gdal
 from dklidar import settings
-
-# Switch on gdal Python exceptions
-gdal.UseExceptions()
+from dklidar import vrt
+from dklidar import manifest
 
 ## 1) Function definitions
-# Check file function
+# Check vrt function
 def check_vrt_completeness(folder):
-    var_name = re.sub('.*/(.*)$', '\g<1>', folder)
-    vrt_file_name = folder + '/' + var_name + '.vrt'
-    file_names = []
-    status = []
-    # Check presence of vrt file
-    if os.path.exists(vrt_file_name):
-        # Open file
-        vrt_file = open(vrt_file_name, 'r')
-        # Read content
-        vrt_file_contents = ''.join(vrt_file.readlines())
-        # List folder content
-        file_list = list_files(folder)
-        # drop non tif files from list
-        file_list = list(itertools.compress(
-            file_list,
-            [bool(re.search('tif', x)) for x in file_list]))
-        # Search tif files in vrt
-        #progress = 0
-        for i in range(0, len(file_list)):
-            if not bool(re.search(
-                re.sub('.*/(.*)$', '\g<1>', file_list[i]),
-                vrt_file_contents)):
-                file_names.append(re.sub('.*/(.*)$', '\g<1>', file_list[i]))
-                status.append('missing')
-##            # Update progress
-##            progress = float(i + 1) / float(len(file_list))
-##            # Update progress bar
-##            print('\r|' +
-##                  '#' * int(round(progress * 54)) +
-##                  '-' * int(round((1 - progress) * 54)) +
-##                  '| ' +
-##                  str(int(round(progress * 100))) + '%'),
-    else:
-        file_names.append('')
-        status.append('vrt file missing')
+    var_name = os.path.basename(folder.rstrip('/'))
+    data_types = {}
+    if os.path.exists(settings.manifest_file):
+        connection = manifest.open_manifest()
+        data_types = manifest.folder_data_types(connection, folder)
+        connection.close()
+    errors = vrt.check_vrt(folder, data_types)
     # Combined outputs to df
-    status_check_df = pandas.DataFrame(zip(*[file_names, status]),
-                                columns = ['file_name','error'])
+    status_check_df = pandas.DataFrame(errors, columns = ['file_name','error'])
     status_check_df['variable'] = var_name
     return(status_check_df)
 
-def list_files(folder_path):
-    files = []
-    # Scan directory
-    for file_name in scandir.scandir(folder_path):
-        files.append(folder_path + '/' + file_name.name)
-    return(files)
-
 if __name__ == '__main__':
     ## 2) Prepare environment
-    
+
     # Status
     print('#' * 80 + '\n')
     print('Checking EcoDes-DK15 vrts for completeness\n\n')
     print('Preparing environment... '),
 
     # determine output folder structure based on original processing
-    folders = [] 
-    for folder in scandir.scandir(settings.output_folder):
-        if folder.is_dir():
-            sub_folders = [sub_folder.path for sub_folder in scandir.scandir(folder.path) if sub_folder.is_dir()]
-            if len(sub_folders) > 0:
-                for sub_folder in sub_folders:
-                    folders.append(sub_folder)
-            else:
-                folders.append(folder.path)
-    # Clean up folder paths
-    folders = map(lambda folder: re.sub('\\\\', '/', folder), folders)
-        
+    folders = vrt.list_variable_folders()
+
     # Status
     print('done.'),
     print('Checking vrts... '),
@@ -105,8 +60,13 @@ if __name__ == '__main__':
 
     # Status
     print('done.'),
-    print('\nFound ' + str(len(status_df.index)) + ' missing files.')
-    print('Check log file for names of missing files:\n\t' +
+    print('\nFound ' + str(len(status_df.index)) + ' problems: ' +
+          str(sum(status_df['error'] == 'missing')) + ' missing, ' +
+          str(sum(status_df['error'] == 'extra')) + ' extra, ' +
+          str(sum(status_df['error'].str.startswith('wrong data type'))) + ' wrong data type, ' +
+          str(sum(status_df['error'] == 'unreadable')) + ' unreadable, ' +
+          str(sum(status_df['error'] == 'vrt file missing')) + ' vrt files missing.')
+    print('Check log file for names of the files:\n\t' +
           settings.log_folder + '/missing_files_in_vrts.csv')
 
 # End of File
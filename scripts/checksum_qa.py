@@ -1,5 +1,6 @@
 # Short script to confirm transferred file integrity using md5 checksums.
-# Prerequisite is that checsum were generated using create_checksums.bat
+# The md5 checksums of the local files are calculated with dklidar/checksums.py (create_checksums.bat is no longer
+# needed).
 # A comparsions of the sets of laz tiles and dtm tiles is also carried out.
 # Jakob Assmann j.assmann@bios.au.dk 16 January 2020
 
@@ -10,72 +11,59 @@ import numpy as np
 import pandas
 import re
 from dklidar import settings
+from dklidar import checksums
+from dklidar import catalogue
 
-### Read in filenames using unix filename extensions from glob
-### 1) Pointcloud files (laz)
-##orig_md5_files = glob.glob(settings.laz_folder + '*.md5')
-##local_md5_files = glob.glob(settings.laz_folder + '*.local_md5')
-### 2) DTM files (tif)
-##orig_md5_files.extend(glob.glob(settings.dtm_folder + "*.md5"))
-##local_md5_files.extend(glob.glob(settings.dtm_folder + "*.local_md5"))
-##
-### Initiate empty lists
-##md5_orig = list()
-##md5_local = list()
-##
-### Fill lists with md5 sums from files
-##for file_name in orig_md5_files:
-##    file = open(file_name)
-##    md5_orig.append(file.read(32))
-##for file_name in local_md5_files:
-##    file = open(file_name)
-##    md5_local.append(file.read(32))
-##
-### Zip all lists into one data frame
-##df = pandas.DataFrame(zip(orig_md5_files, md5_orig, local_md5_files, md5_local),
-##                      columns=['orig_file', 'orig_md5', 'local_file', 'local_md5'])
-##
-### Add md5_vheck comparison column to df
-##md5_check = df['orig_md5'] == df['local_md5']
-##df['md5_check'] = md5_check
-##
-### Print dataframe overiview to console
-##print()
-##print('df overview:')
-##print(df.head())
-##print()
-##
-### Filter rows where the check returned false
-##print('Non matching md5 checksums:' + str(np.sum([not i for i in df['md5_check']])))
-##damaged_files = df[df['md5_check'] == False]
-##print(damaged_files)
-##
-### Export csv
-##damaged_files.to_csv(settings.laz_folder + '../damaged_files.csv', index=False)
-##
 # ---------------------------------------------------
-# Check for completeness of datasets
+# Check md5 checksums of downloads
+
+# Calculate md5 checksums of the pointcloud and dtm files in parallel (see dklidar/checksums.py). The checksums are
+# kept in a checksum manifest per folder, so files that have not changed since the last run are not hashed again.
+local_md5 = {}
+for folder, pattern, manifest_name in [(settings.laz_folder, '\.laz$', 'checksums_laz.sqlite'),
+                                       (settings.dtm_folder, '\.tif$', 'checksums_dtm.sqlite')]:
+    checksums_folder = checksums.hash_tree(folder, settings.log_folder + '/' + manifest_name, 'md5', pattern)
+    for file_name in checksums_folder:
+        local_md5[re.sub('[\\\\/]+', '/', folder + '/' + file_name)] = checksums_folder[file_name]
+
+# Read original md5 checksums supplied with the downloads (<file name>.md5)
+orig_md5_files = glob.glob(settings.laz_folder + '*.md5')
+orig_md5_files.extend(glob.glob(settings.dtm_folder + "*.md5"))
+orig_files = []
+md5_orig = []
+md5_local = []
+for md5_file in orig_md5_files:
+    file = open(md5_file)
+    md5_orig.append(file.read(32).lower())
+    file.close()
+    orig_file = re.sub('[\\\\/]+', '/', re.sub('\.md5$', '', md5_file))
+    orig_files.append(orig_file)
+    md5_local.append(local_md5.get(orig_file))
+
+# Zip all lists into one data frame
+df = pandas.DataFrame(list(zip(orig_files, md5_orig, md5_local)), columns=['file', 'orig_md5', 'local_md5'])
 
-# Load file names
-dtm_files = glob.glob(settings.dtm_folder + '/*.tif')
-laz_files = glob.glob(settings.laz_folder + '/*.laz')
+# Add md5_check comparison column to df
+df['md5_check'] = df['orig_md5'] == df['local_md5']
 
-# initiate empty lists for tile_ids
-dtm_tile_ids = []
-laz_tile_ids = []
+# Filter rows where the check returned false
+print('Non matching md5 checksums:' + str(np.sum([not i for i in df['md5_check']])))
+damaged_files = df[df['md5_check'] == False]
+print(damaged_files)
 
-# fill dictionaries with tile_id, as well as row number and column number for each file name:
-for file_name in dtm_files:
-    tile_id = re.sub('.*DTM_1km_(\d*_\d*).tif', '\g<1>', file_name)
-    dtm_tile_ids.append(tile_id)
+# Export csv
+damaged_files.to_csv(settings.laz_folder + '../damaged_files.csv', index=False)
 
-for file_name in laz_files:
-    tile_id = re.sub('.*PUNKTSKY_1km_(\d*_\d*).laz', '\g<1>', file_name)
-    laz_tile_ids.append(tile_id)
+# ---------------------------------------------------
+# Check for completeness of datasets
+
+# Load tile catalogues
+dtm_catalogue = catalogue.get_catalogue('dtm')
+laz_catalogue = catalogue.get_catalogue('laz')
 
 # Determine differences between sets of tiles
-missing_laz_tiles = set(dtm_tile_ids) - set(laz_tile_ids)
-missing_dtm_tiles = set(laz_tile_ids) - set(dtm_tile_ids)
+missing_laz_tiles = list(dtm_catalogue.difference(laz_catalogue))
+missing_dtm_tiles = list(laz_catalogue.difference(dtm_catalogue))
 
 df_missing_dtm = pandas.DataFrame(zip(missing_dtm_tiles), columns=['tile_id'])
 df_missing_dtm.to_csv(settings.dtm_folder + '../missing_dtm_tile_ids.csv', index=False)
@@ -93,12 +81,11 @@ print(df_missing_laz.head())
 # DTMs with missing LAZs
 out_file = open(settings.dtm_folder + '../dtm_files_with_missing_laz.txt', 'a+')
 for tile_id in missing_laz_tiles:
-    out_file.write(settings.dtm_folder + 'DTM_1km_' + tile_id + '.tif\n')
+    out_file.write(dtm_catalogue.file_path(tile_id) + '\n')
 out_file.close()
 
 # LAZs with missing DTMs
 out_file = open(settings.laz_folder + '../laz_files_with_missing_dtm.txt', 'a+')
 for tile_id in missing_dtm_tiles:
-    out_file.write(settings.laz_folder  +'PUNKTSKY_1km_' + tile_id + '.laz\n')
+    out_file.write(laz_catalogue.file_path(tile_id) + '\n')
 out_file.close()
-
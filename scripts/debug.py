@@ -55,8 +55,7 @@ if not os.path.exists(settings.dtm_folder):
     print('dtm_folder ' + settings.dtm_folder + ' does not exist. Exiting script...')
     exit()
 # Conmfirm other folders exists and if not create them
-for folder in [settings.dtm_mosaics_folder, settings.dtm_footprint_folder,
-               settings.odm_folder, settings.odm_footprint_folder, settings.output_folder]:
+for folder in [settings.dtm_mosaics_folder, settings.odm_folder, settings.odm_footprint_folder, settings.output_folder]:
     if not os.path.exists(folder):
         os.mkdir(folder)
 
@@ -70,41 +69,17 @@ startTime = datetime.datetime.now()
 print('#' * 60)
 print('\nTesting DTM Functions\n')
 
-# Generate tile footprint
-print('=> Generate Tile Footprint')
-print(dtm.dtm_generate_footprint(tile_id))
-
-# Generate tile neighbourhood mosaic
-print('=> Generate Neighbourhood Mosaic')
-print(dtm.dtm_neighbourhood_mosaic(tile_id))
-
 # Validate CRS
 print('=> Validate CRS')
-print(dtm.dtm_validate_crs(tile_id))
+print(dtm.dtm_validate_crs(tile_id, mosaic = False))
 
 # Aggregate tile to 10 m
 print('=> Aggregate tile to 10 m')
 print(dtm.dtm_aggregate_tile(tile_id))
 
-# Aggregate neighbourhood mosaic to 10 m
-print('=> Aggregate Neighbourhood Mosaic to 10 m')
-print(dtm.dtm_aggregate_mosaic(tile_id))
-
-# Calculate slope
-print('=> Calculate Slope')
-print(dtm.dtm_calc_slope(tile_id))
-
-# Calculate aspect
-print('=> Calculate Aspect')
-print(dtm.dtm_calc_aspect(tile_id, -1))
-
-# Calculate heat index
-print('=> Calculate Heat Index')
-print(dtm.dtm_calc_heat_index(tile_id, -10))
-
-# Calculate solar radiation
-print('=> Calculate Solar Radiation')
-print(dtm.dtm_calc_solar_radiation(tile_id))
+# Calculate slope, aspect, heat load index and solar radiation
+print('=> Calculate Terrain Indices')
+print(dtm.dtm_terrain_indices(tile_id, -1))
 
 # Calculate landscape openness mean
 print('=> Calculate Openness Mean')
@@ -150,37 +125,45 @@ print(points.odm_validate_crs(tile_id))
 print('=> Generating footprints from ODM')
 print(points.odm_generate_footprint(tile_id))
 
-## Normalise height
-print('=> Normalize Height')
-print(points.odm_add_normalized_z(tile_id))
+## Point statistics: from the ODM (one opals run per variable) or in one pass over the laz file
+if settings.point_statistics == 'laz':
+    ## Export normalised height, canopy height, point counts, proportions, amplitude and date stamps
+    print('=> Export Point Statistics from laz')
+    print(points.laz_export_point_statistics(tile_id))
+else:
+    ## Normalise height
+    print('=> Normalize Height')
+    print(points.odm_add_normalized_z(tile_id))
 
-## Export mean normalised height for 10 m x 10 m cell
-print('=> Export Normalize Height')
-print(points.odm_export_normalized_z(tile_id))
+    ## Export mean normalised height for 10 m x 10 m cell
+    print('=> Export Normalize Height')
+    print(points.odm_export_normalized_z(tile_id))
 
-## Export canopy height
-print('=> Export Canopy Height')
-print(points.odm_export_canopy_height(tile_id))
+    ## Export canopy height
+    print('=> Export Canopy Height')
+    print(points.odm_export_canopy_height(tile_id))
 
-## Export point counts for pre-defined intervals and classess
-print('=> Export Point Counts')
-print(points.odm_export_point_counts(tile_id))
+    ## Export point counts for pre-defined intervals and classess
+    print('=> Export Point Counts')
+    print(points.odm_export_point_counts(tile_id))
 
-## Export proportions based on point counts
-print('=> Export Proportions')
-print(points.odm_export_proportions(tile_id))
+    ## Export proportions based on point counts
+    print('=> Export Proportions')
+    print(points.odm_export_proportions(tile_id))
 
 ## Export point source information
 print('=> Export Point Source Information')
 print(points.odm_export_point_source_info(tile_id))
 
-## Export amplitude mean and sd
-print('=> Export Amplitude Mean and SD')
-print(points.odm_export_amplitude(tile_id))
+# Amplitude and date stamps from the ODM (included in the point statistics from the laz file)
+if settings.point_statistics != 'laz':
+    ## Export amplitude mean and sd
+    print('=> Export Amplitude Mean and SD')
+    print(points.odm_export_amplitude(tile_id))
 
-## Export date stamp
-print('=> Exporting Date Stamps')
-print(points.odm_export_date_stamp(tile_id))
+    ## Export date stamp
+    print('=> Exporting Date Stamps')
+    print(points.odm_export_date_stamp(tile_id))
 
 ## Additional export for selected point counts (to speed up testing)
 #### Export total point count
@@ -0,0 +1,66 @@
+# Script to export the EcoDes-DK outputs into the national data cube (Zarr, see dklidar/datacube.py)
+# The tiles are written in parallel, each worker writes the chunks of its tiles only, so no locking is needed.
+# Re-running the script (re-)writes all tiles into the existing cube, use --overwrite to start from an empty cube.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import os
+import sys
+import glob
+import re
+import datetime
+import multiprocessing
+
+from dklidar import settings
+from dklidar import datacube
+
+# Set number of parallel processes:
+n_processes = 54
+
+# Variable used to determine the tiles to export
+base_var = 'dtm_10m'
+
+
+## Write a tile into the cube and report on failure
+def export_tile(tile_id):
+    return tile_id, datacube.write_tile(tile_id)
+
+
+#### Main body of script
+if __name__ == '__main__':
+
+    ## Start timer
+    startTime = datetime.datetime.now()
+
+    ## Status output to console
+    print('\n' + '-' * 80 + 'Starting export_datacube.py at ' + str(startTime.strftime('%c')) + '\n')
+
+    # Create cube if needed
+    if '--overwrite' in sys.argv or not os.path.exists(settings.cube_file):
+        print(datetime.datetime.now().strftime('%X') + ' Creating cube ' + settings.cube_file + ' ... '),
+        datacube.create_cube(overwrite = True)
+        print('done.')
+
+    # Determine tile ids
+    tile_ids = [re.sub('.*_(\d*_\d*).tif', '\g<1>', file_name)
+                for file_name in glob.glob(settings.output_folder + '/' + base_var + '/*.tif')]
+
+    # Set up processing pool
+    multiprocessing.set_executable(settings.python_exec_path)
+    pool = multiprocessing.Pool(processes=n_processes)
+
+    # Export tiles
+    print(datetime.datetime.now().strftime('%X') + ' Exporting ' + str(len(tile_ids)) + ' tiles ... '),
+    export_status = pool.map(export_tile, tile_ids)
+    pool.close()
+    print('done.')
+
+    # Report failures
+    failed = sorted([(tile_id, return_value) for tile_id, return_value in export_status if return_value != 'success'])
+    if len(failed) > 0:
+        print('Export failed for ' + str(len(failed)) + ' tiles:')
+        for tile_id, return_value in failed:
+            print('\t' + tile_id + ' ' + return_value)
+
+    # Print out time elapsed:
+    print('\nTime elapsed: ' + str(datetime.datetime.now() - startTime))
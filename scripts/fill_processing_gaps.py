@@ -8,7 +8,6 @@
 
 # Dependencies
 import os
-import glob
 import pandas
 import re
 import scandir
@@ -17,6 +16,7 @@ import sys
 import subprocess
 import shutil
 from dklidar import settings
+from dklidar import catalogue
 
 ## 1) Determine output folder structure
 
@@ -44,8 +44,7 @@ folders = [folder for folder in folders if not bool(re.match('.*point_source_cou
 
 ## Get reference set of tiles based on dtm_10m
 dtm_10m = [folder for folder in folders if bool(re.match('.*dtm_10m.*', folder))][0]
-dtm_10m_tiles = [re.sub('.*_(\d*_\d*).tif', '\g<1>', file_name) for file_name in glob.glob(dtm_10m + '/*.tif')]
-dtm_10m_tiles = set(dtm_10m_tiles)
+dtm_10m_catalogue = catalogue.TileCatalogue.scan(dtm_10m, '_(\d+_\d+)\.tif$')
 
 print(' done.')
 
@@ -60,9 +59,7 @@ missing_tiles = {}
 for folder in folders:
     variable_name = re.sub('.*[\\\\\/]', '', folder)
     print('\t' + variable_name)
-    tiles = [re.sub('.*_(\d*_\d*).tif', '\g<1>', file_name) for file_name in glob.glob(folder + '/*.tif')]
-    tiles = set(tiles)
-    tiles_missing = dtm_10m_tiles - tiles
+    tiles_missing = set(dtm_10m_catalogue.difference(catalogue.TileCatalogue.scan(folder, '_(\d+_\d+)\.tif$')))
     missing_tiles.update({variable_name: tiles_missing})
 
 # Status
@@ -2,20 +2,21 @@
 ### Jakob Assmann j.assann@bios.au.dk 29 January 2019
 
 ## Imports
-import glob
 import re
 import os
 import shutil
 import datetime
 import time
 import multiprocessing
-import pandas
-import opals
 
 from dklidar import points
 from dklidar import dtm
 from dklidar import settings
+from dklidar import catalogue
+from dklidar import blocks
 from dklidar import common
+from dklidar import variables
+from dklidar.backends import opals, pandas
 
 #### Prepare the environment
 
@@ -36,31 +37,13 @@ if not os.path.exists(settings.dtm_folder):
     print('dtm_folder ' + settings.dtm_folder + ' does not exist. Exiting script...')
     exit()
 # Conmfirm other folders exists and if not create them
-for folder in [settings.dtm_mosaics_folder, settings.dtm_footprint_folder,
-               settings.odm_folder, settings.odm_footprint_folder, settings.output_folder]:
+for folder in [settings.dtm_mosaics_folder, settings.odm_folder, settings.odm_footprint_folder, settings.output_folder]:
     if not os.path.exists(folder):
         os.mkdir(folder)
 
-# Load file names
-dtm_files = glob.glob(settings.dtm_folder + '/*.tif')
-laz_files = glob.glob(settings.laz_folder + '/*.laz')
 
-# initiate empty lists for tile_ids
-dtm_tile_ids = []
-laz_tile_ids = []
-
-# fill dictionaries with tile_id, as well as row number and column number for each file name:
-for file_name in dtm_files:
-    tile_id = re.sub('.*DTM_1km_(\d*_\d*).tif', '\g<1>', file_name)
-    dtm_tile_ids.append(tile_id)
-
-for file_name in laz_files:
-    tile_id = re.sub('.*PUNKTSKY_1km_(\d*_\d*).laz', '\g<1>', file_name)
-    laz_tile_ids.append(tile_id)
-
-
-## Define processing steps for each tile to be carried out in parallel
-def process_tile(tile_id):
+## Define processing steps for each batch of tiles to be carried out in parallel
+def process_batch(batch):
 
     ## Prepare environment
     # Generate temporary wd for parallel worker, this will allow for smooth logging and opals sessions to run in parallel
@@ -71,11 +54,6 @@ def process_tile(tile_id):
         os.mkdir(temp_wd)
     os.chdir(temp_wd)
 
-    # Create folder for logging
-    tile_log_folder = settings.log_folder + '/process_tiles/' + tile_id
-    if not os.path.exists(tile_log_folder):
-        os.mkdir(tile_log_folder)
-
     # Stagger processing if this is the first turn during a processing id
     # This is a crucial step to reduce the chance of the functions using gdal_rasterize to run directly in parallel
     # (generate mask function), if more than 10 gdla_rasterize instances run in parallel there is a massive drop in
@@ -85,9 +63,48 @@ def process_tile(tile_id):
         time.sleep(5 * int(re.sub('[(),]', '', str(multiprocessing.current_process()._identity))))
         lock_file = open(temp_wd + '/first_go_complete.txt', 'w')
         lock_file.close()
-    # opals loadModules
+    # opals loadModules (once per batch)
     opals.loadAllModules()
 
+    # Tiles of the batch (block of tiles, see blocks.tile_blocks())
+    core_bounds, tile_ids = batch
+
+    ## Steps carried out for each tile on its own
+    tile_status = {}
+    for tile_id in tile_ids:
+        tile_status[tile_id] = process_tile(tile_id)
+
+    ## Neighbourhood dependent terrain model derived variables, calculated once for the whole batch
+    # Calculate slope, aspect, heat load index and solar radiation, landscape openness mean and difference
+    for step_name in ['dtm_terrain_indices', 'dtm_openness_mean', 'dtm_openness_difference']:
+        return_values = dtm.dtm_process_batch(step_name, tile_ids)
+        for tile_id in tile_ids:
+            # Update progress variables
+            tile_status[tile_id][0].append(step_name)
+            tile_status[tile_id][1].append([return_values[tile_id]])
+            common.log_progress_event('process_tiles', tile_id, step_name, return_values[tile_id])
+        # gather logs for step and tiles
+        common.gather_logs('process_tiles', step_name, tile_ids)
+
+    ## Remaining steps and logging for each tile
+    for tile_id in tile_ids:
+        finalise_tile(tile_id, tile_status[tile_id][0], tile_status[tile_id][1])
+
+    # Change back to original working directory
+    os.chdir(wd)
+
+
+## Define processing steps for each tile within a batch
+def process_tile(tile_id):
+
+    # Create folder for logging
+    tile_log_folder = settings.log_folder + '/process_tiles/' + tile_id
+    if not os.path.exists(tile_log_folder):
+        os.mkdir(tile_log_folder)
+
+    # Record start of processing for the progress monitor
+    common.log_progress_event('process_tiles', tile_id, 'tile_start', 'started')
+
     ## Logging: Keep track of progress for each step and overall progress
     # Initiate progress variables
     steps = ['processing']
@@ -98,6 +115,7 @@ def process_tile(tile_id):
     # Update progress variables
     steps.append('generate_water_masks')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'generate_water_masks', return_value)
     # gather logs for step and tile
     common.gather_logs('process_tiles', 'generate_water_masks', tile_id)
 
@@ -106,6 +124,7 @@ def process_tile(tile_id):
     # Update progress variables
     steps.append('odm_import_single_tile')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'odm_import_single_tile', return_value)
     # gather logs for step and tile
     common.gather_logs('process_tiles', 'odm_import_single_tile', tile_id)
 
@@ -114,111 +133,121 @@ def process_tile(tile_id):
     # Update progress variables
     steps.append('odm_validate_crs')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'odm_validate_crs', return_value)
 
     ## Export footprint
     return_value = points.odm_generate_footprint(tile_id)
     # Update progress variables
     steps.append('odm_generate_footprint')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'odm_generate_footprint', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'odm_generate_footprint', tile_id)
 
-    ## Normalise height
-    return_value = points.odm_add_normalized_z(tile_id)
-    # Update progress variables
-    steps.append('odm_add_normalized_z')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_add_normalized_z', tile_id)
-
-    ## Export mean normalised height for 10 m x 10 m cell
-    return_value = points.odm_export_normalized_z(tile_id)
-    # Update progress variables
-    steps.append('odm_export_normalized_z')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_normalized_z', tile_id)
-
-    ## Export canopy height
-    return_value = points.odm_export_canopy_height(tile_id)
-    # Update progress variables
-    steps.append('odm_export_canopy_height')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_canopy_height', tile_id)
-
-    ## Export point counts for pre-defined intervals and classess
-    return_value = points.odm_export_point_counts(tile_id)
-    # Update progress variables
-    steps.append('odm_export_point_counts')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_point_counts', tile_id)
-
-    ## Export proportions based on point counts
-    return_value = points.odm_export_proportions(tile_id)
-    # Update progress variables
-    steps.append('odm_export_proportions')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_proportions', tile_id)
+    ## Point statistics: from the ODM (one opals run per variable) or in one pass over the laz file
+    if settings.point_statistics == 'laz':
+        ## Export normalised height, canopy height, point counts, proportions, amplitude and date stamps
+        # in one pass over the laz file
+        return_value = points.laz_export_point_statistics(tile_id)
+        # Update progress variables
+        steps.append('laz_export_point_statistics')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'laz_export_point_statistics', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'laz_export_point_statistics', tile_id)
+    else:
+        ## Normalise height
+        return_value = points.odm_add_normalized_z(tile_id)
+        # Update progress variables
+        steps.append('odm_add_normalized_z')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_add_normalized_z', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_add_normalized_z', tile_id)
+
+        ## Export mean normalised height for 10 m x 10 m cell
+        return_value = points.odm_export_normalized_z(tile_id)
+        # Update progress variables
+        steps.append('odm_export_normalized_z')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_normalized_z', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_normalized_z', tile_id)
+
+        ## Export canopy height
+        return_value = points.odm_export_canopy_height(tile_id)
+        # Update progress variables
+        steps.append('odm_export_canopy_height')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_canopy_height', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_canopy_height', tile_id)
+
+        ## Export point counts for pre-defined intervals and classess
+        return_value = points.odm_export_point_counts(tile_id)
+        # Update progress variables
+        steps.append('odm_export_point_counts')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_point_counts', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_point_counts', tile_id)
+
+        ## Export proportions based on point counts
+        return_value = points.odm_export_proportions(tile_id)
+        # Update progress variables
+        steps.append('odm_export_proportions')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_proportions', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_proportions', tile_id)
 
     ## Export point source information
     return_value = points.odm_export_point_source_info(tile_id)
     # Update progress variables
     steps.append('odm_export_point_source_info')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'odm_export_point_source_info', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'odm_export_point_source_info', tile_id)
 
-    ## Export amplitude mean and sd
-    return_value = points.odm_export_amplitude(tile_id)
-    # Update progress variables
-    steps.append('odm_export_amplitude')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_amplitude', tile_id)
+    # Amplitude and date stamps from the ODM (included in the point statistics from the laz file)
+    if settings.point_statistics != 'laz':
+        ## Export amplitude mean and sd
+        return_value = points.odm_export_amplitude(tile_id)
+        # Update progress variables
+        steps.append('odm_export_amplitude')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_amplitude', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_amplitude', tile_id)
+
+        ## Export date stamps
+        return_value = points.odm_export_date_stamp(tile_id)
+        # Update progress variables
+        steps.append('odm_export_date_stamp')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'odm_export_date_stamp', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'odm_export_date_stamp', tile_id)
 
-    ## Export date stamps
-    return_value = points.odm_export_date_stamp(tile_id)
-    # Update progress variables
-    steps.append('odm_export_date_stamp')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'odm_export_date_stamp', tile_id)
-    
     ## Remove unneeded odm files
     return_value = points.odm_remove_temp_files(tile_id)
     # Update progress variables
     steps.append('odm_remove_temp_files')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'odm_remove_temp_files', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'odm_remove_temp_files', tile_id)
 
 
     ## Terrain model derived variables
 
-    ## Generate tile footprint
-    return_value = dtm.dtm_generate_footprint(tile_id)
-    # Update progress variables
-    steps.append('dtm_generate_footprint')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_generate_footprint', tile_id)
-
-    ## Generate neighbourhood mosaic
-    return_value = dtm.dtm_neighbourhood_mosaic(tile_id)
-    # Update progress variables
-    steps.append('dtm_neighbourhood_mosaic')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_neighbourhood_mosaic', tile_id)
-
     ## Validate CRS
-    return_value = dtm.dtm_validate_crs(tile_id)
+    return_value = dtm.dtm_validate_crs(tile_id, mosaic = False)
     # Update progress variables
     steps.append('dtm_validate_crs')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'dtm_validate_crs', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'dtm_validate_crs', tile_id)
 
@@ -227,90 +256,52 @@ def process_tile(tile_id):
     # Update progress variables
     steps.append('dtm_aggregate_tile')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'dtm_aggregate_tile', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'dtm_aggregate_tile', tile_id)
 
-    ## Generate 10 m aggregate of neighbourhood mosaic
-    return_value = dtm.dtm_aggregate_mosaic(tile_id)
-    # Update progress variables
-    steps.append('dtm_aggregate_mosaic')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_aggregate_mosaic', tile_id)
-    
-    ## Calculate slope
-    return_value = dtm.dtm_calc_slope(tile_id)
-    # Update progress variables
-    steps.append('dtm_calc_slope')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_calc_slope', tile_id)
-
-    ## Calculate aspect
-    return_value = dtm.dtm_calc_aspect(tile_id)
-    # Update progress variables
-    steps.append('dtm_calc_aspect')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_calc_aspect', tile_id)
-
-    ## Calculate heat index
-    return_value = dtm.dtm_calc_heat_index(tile_id)
-    # Update progress variables
-    steps.append('dtm_calc_heat_index')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_calc_heat_index', tile_id)
-
-    ## Calculate solar radiation
-    return_value = dtm.dtm_calc_solar_radiation(tile_id)
-    # Update progress variables
-    steps.append('dtm_calc_solar_radiation')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_calc_solar_radiation', tile_id)
-
-    ## Calculate landscape openness mean
-    return_value = dtm.dtm_openness_mean(tile_id)
-    # Update progress variables
-    steps.append('dtm_openness_mean')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_openness_mean', tile_id)
-
-    ## Calculate landscape openness difference
-    return_value = dtm.dtm_openness_difference(tile_id)
-    # Update progress variables
-    steps.append('dtm_openness_difference')
-    status_steps.append([return_value])
-    # gather logs for step and tile]
-    common.gather_logs('process_tiles', 'dtm_openness_difference', tile_id)
-
     ## Calculate Kopecky TWI
     return_value = dtm.dtm_kopecky_twi(tile_id)
     # Update progress variables
     steps.append('dtm_kopecky_twi')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'dtm_kopecky_twi', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'dtm_kopecky_twi', tile_id)
 
+    return steps, status_steps
+
+
+## Define remaining processing steps and logging for each tile within a batch
+def finalise_tile(tile_id, steps, status_steps):
+
     ## Remove unneeded dtm files
     return_value = dtm.dtm_remove_temp_files(tile_id)
     # Update progress variables
     steps.append('dtm_remove_temp_files')
     status_steps.append([return_value])
+    common.log_progress_event('process_tiles', tile_id, 'dtm_remove_temp_files', return_value)
     # gather logs for step and tile]
     common.gather_logs('process_tiles', 'dtm_remove_temp_files', tile_id)
 
+    ## Pack single band outputs into one multi-band raster per theme (stacked output layout only)
+    if settings.output_layout == 'stacked':
+        return_value = variables.stack_tile_outputs(tile_id)
+        # Update progress variables
+        steps.append('stack_tile_outputs')
+        status_steps.append([return_value])
+        common.log_progress_event('process_tiles', tile_id, 'stack_tile_outputs', return_value)
+        # gather logs for step and tile]
+        common.gather_logs('process_tiles', 'stack_tile_outputs', tile_id)
+
     ## Logging: finalise log outputs
     # Zip into pandas data frame
     status_df = pandas.DataFrame(zip(*status_steps), index = [tile_id], columns=steps)
     status_df.index.name = 'tile_id'
     # Export as CSV
-    status_df.to_csv(tile_log_folder + '/status.csv', index=True, header=True)
-
-    # Change back to original working directory
-    os.chdir(wd)
+    status_df.to_csv(settings.log_folder + '/process_tiles/' + tile_id + '/status.csv', index=True, header=True)
+    # Record completion of tile for the progress monitor
+    common.log_progress_event('process_tiles', tile_id, 'processing', 'complete')
 
     # Print tile_id to console to update on status
     print(datetime.datetime.now().strftime('%X') + ' ' + tile_id + ' '),
@@ -325,6 +316,12 @@ if __name__ == '__main__':
     ## Status output to console
     print('\n' + '-' * 80 + 'Starting process_tiles.py at ' + str(startTime.strftime('%c')) + '\n')
 
+    ## Load tile catalogues (the folders are only scanned if they changed since the catalogues were last persisted)
+    # Loaded in the main process only and handed to the workers when the pool is set up (see below)
+    catalogue.get_catalogue('dtm')
+    laz_catalogue = catalogue.get_catalogue('laz')
+    laz_tile_ids = list(laz_catalogue)
+
     ## Prepare process managment and logging
     progress_df = common.init_log_folder('process_tiles', laz_tile_ids)
 
@@ -341,13 +338,17 @@ if __name__ == '__main__':
 ##    print('Processing ' + str(len(tiles_to_process)) + ' tiles. \n')
 ##    time.sleep(60)
     
-    # Set up processing pool
+    # Set up processing pool, the workers use the catalogues of the main process
     multiprocessing.set_executable(settings.python_exec_path)
-    pool = multiprocessing.Pool(processes=n_processes)
+    pool = multiprocessing.Pool(processes=n_processes, initializer=catalogue.set_loaded_catalogues,
+                                initargs=(catalogue.loaded_catalogues,))
+
+    # Group tiles into batches of settings.batch_n_tiles x settings.batch_n_tiles tiles
+    batches = blocks.tile_blocks(tiles_to_process, settings.batch_n_tiles)
 
-    # Execute processing of tiles
-    print(datetime.datetime.now().strftime('%X') + ' Processing tiles: ... '),
-    tile_processing = pool.map_async(process_tile, tiles_to_process)
+    # Execute processing of batches of tiles
+    print(datetime.datetime.now().strftime('%X') + ' Processing tiles in ' + str(len(batches)) + ' batches: ... '),
+    tile_processing = pool.map_async(process_batch, batches, chunksize = 1)
     # Make sure all processes finish before carrying on.
     tile_processing.wait()
     print('... done.')
@@ -3,88 +3,128 @@
 ### Jakob Assmann j.assann@bios.au.dk 20 April 2020
 
 ## Imports
-import glob
 import os
+import sys
 import datetime
 import time
 
 from dklidar import settings
-
-# Set working directory
-os.chdir(settings.wd)
-
-# Set number of parallel processes:
-n_processes = 62 # 54
+from dklidar import progress
 
 # set update interval
 update_interval = 60 # 60 s
 
-# Load tile file names and derive total number of files to process
-laz_files = glob.glob(settings.laz_folder + '/*.laz')
-n_total = len(laz_files)
-
-# Check nubmer of files already processed
-n_processed_at_start = len(glob.glob(settings.log_folder + '/process_tiles/*_*'))
-
-# set start date and time:
-start_time = datetime.datetime.fromtimestamp(os.path.getmtime(settings.log_folder + '/process_tiles/overall_progress.csv'))
-# Initate progress variables
-progress = 0
-
-# Update progress till complete
-while progress < 1:
-    # Obtain n sum of n tiles in process and completed
-    n_sum = len(glob.glob(settings.log_folder + '/process_tiles/*_*'))
-    # Calculate n of fully processed tiles
-    n_processed = n_sum - n_processes
-    progress = float(n_processed) / float(n_total)
-
-    # Calculate time differences
-    time_passed = datetime.datetime.now() - start_time
-    if (n_processed - n_processed_at_start) <= 54:
-        time_estimated = 'estimating'
+# set rolling window for throughput and ETA estimates
+rolling_window = 3600 # 1 h
+
+# Prometheus text file to export the progress to (set to None to disable)
+prometheus_file = settings.log_folder + '/process_tiles/progress.prom'
+
+# ANSI escape sequence to clear the terminal and return the cursor to the top left corner
+clear_screen = '\033[2J\033[H'
+
+# Enable processing of ANSI escape sequences in the Windows console
+if os.name == 'nt':
+    os.system('')
+
+
+## Function to format a time delta given in s
+def format_seconds(seconds):
+    if seconds is None:
+        return 'estimating'
+    if seconds == float('inf'):
+        return 'unknown'
+    return str(datetime.timedelta(seconds = int(round(seconds))))
+
+
+## Function to render the progress as text
+def render(store, now):
+    lines = []
+    n_complete = store.n_complete_at_start + store.n_completed
+    if store.n_total > 0:
+        ratio = float(n_complete) / float(store.n_total)
     else:
-        time_estimated = (time_passed / (n_processed - n_processed_at_start)) * (n_total - n_processed)
-
-
-    # Check whether the overall_progress.csv has been updated, if so
-    # assume the processing of the last 54 files is done
-    overal_progress_timestamp = datetime.datetime.fromtimestamp(
-        os.path.getmtime(settings.log_folder + '/process_tiles/overall_progress.csv'))
-    if not overal_progress_timestamp == start_time:
-        progress = 1
-        n_processed = n_total
-
-    # Print stats on screen
-    os.system('cls')
-    print('\n')
-    print('-' * 80),
-    print(' ' * (79 - len('Jakob Assmann j.assmann@bios.au.dk 2020 ')) +
-          'Jakob Assmann j.assmann@bios.au.dk 2020 ')
-    print(' \'process_tiles.py\' progress:')
-    print('  - processing with ' + str(n_processes) + ' parallel threads')
-    print('  - start time: ' + str(start_time.ctime()))
-    print('  - execute \'stop.bat\' to pause \ interrupt processing')
-    print('\n')
-    print(' update interval: ' + str(update_interval) + ' s' +
-          ' ' * (79 - len(' update interval: ' + str(update_interval) + ' s' + 'last update: ' + str(datetime.datetime.now().ctime()))) +
-          'last update: ' + str(datetime.datetime.now().ctime()))
-    print('-' * 80)
-    print('\n' * 2)
-    print(' ' + str(n_processed) + ' / ' + str(n_total) + ' tiles' +
-          ' ' * (80 - len(' ' + str(n_processed) + ' / ' + str(n_total) + ' tiles' + str(int(round(progress * 100))) + '% ')) +
-          str(int(round(progress * 100))) + '%'),
-    print('-' * 80),
-    print('#' * int(round(78*progress)))
-    print('-' * 80),
-    print('passed: ' + str(time_passed).split('.')[0] +
-          ' ' * (79 - len('passed: ' + str(time_passed).split('.')[0] +
-                          'remaining (estimate): ' + str(time_estimated).split('.')[0] + ' ')) +
-          'remaining (estimate): ' + str(time_estimated).split('.')[0] + ' ')
-    print(' ' * (79 - len('press CRTL+C to exit progress monitor ')) + 'press CRTL+C to exit progress monitor ')
-
-    # Wait for next update
-    time.sleep(update_interval)
+        ratio = 0
+    if store.start_time is not None:
+        start_time = datetime.datetime.fromtimestamp(store.start_time).ctime()
+        time_passed = format_seconds(now - store.start_time)
+    else:
+        start_time = 'waiting for first tile'
+        time_passed = format_seconds(0)
+    eta = store.eta(now)
+    last_update = 'last update: ' + datetime.datetime.fromtimestamp(now).ctime()
+
+    lines.append('-' * 80)
+    lines.append(' ' * (79 - len('Jakob Assmann j.assmann@bios.au.dk 2020 ')) +
+                 'Jakob Assmann j.assmann@bios.au.dk 2020 ')
+    lines.append(' \'process_tiles.py\' progress:')
+    lines.append('  - tiles in flight: ' + str(len(store.tiles_in_flight)))
+    lines.append('  - start time: ' + start_time)
+    lines.append('  - execute \'stop.bat\' to pause \\ interrupt processing')
+    lines.append('')
+    lines.append(' update interval: ' + str(update_interval) + ' s' +
+                 ' ' * (79 - len(' update interval: ' + str(update_interval) + ' s' + last_update)) + last_update)
+    lines.append('-' * 80)
+    lines.append('')
+    status = ' ' + str(n_complete) + ' / ' + str(store.n_total) + ' tiles'
+    percentage = str(int(round(ratio * 100))) + '%'
+    lines.append(status + ' ' * (79 - len(status + percentage)) + percentage)
+    lines.append('-' * 80)
+    lines.append('#' * int(round(78 * ratio)))
+    lines.append('-' * 80)
+    throughput = 'throughput: ' + str(round(store.tiles_per_hour(now), 1)) + ' tiles / h'
+    lines.append('passed: ' + time_passed + ' ' * (79 - len('passed: ' + time_passed + throughput)) + throughput)
+    if eta is None:
+        lines.append('remaining (estimate): ' + format_seconds(None))
+    else:
+        lines.append('remaining (estimate): ' + format_seconds(eta[1]) +
+                     ' [95% CI: ' + format_seconds(eta[0]) + ' - ' + format_seconds(eta[2]) + ']')
+    lines.append('')
+
+    # Step table
+    lines.append(' step' + ' ' * 28 + '     done    fail %    mean s    per h')
+    for step_name, count, failure_rate, mean_duration, per_hour in store.step_summary(now):
+        lines.append(' ' + step_name[:31].ljust(32) +
+                     str(count).rjust(9) +
+                     ('%.1f' % (failure_rate * 100)).rjust(10) +
+                     ('%.1f' % mean_duration).rjust(10) +
+                     ('%.0f' % per_hour).rjust(9))
+    lines.append('')
+
+    # Slowest tiles in flight
+    lines.append(' slowest tiles in flight:')
+    for tile_id, seconds, step_name in store.slowest_tiles(5, now):
+        lines.append('  ' + tile_id + '  ' + format_seconds(seconds).rjust(10) + '  last step: ' + step_name)
+    lines.append('')
+    lines.append(' ' * (79 - len('press CRTL+C to exit progress monitor ')) + 'press CRTL+C to exit progress monitor ')
+    return '\n'.join(lines)
+
+
+#### Main body of script
+if __name__ == '__main__':
+
+    # Initiate progress store
+    store = progress.ProgressStore('process_tiles', window = rolling_window)
+
+    # Update progress till complete
+    while True:
+        # Read new events
+        store.update()
+        now = time.time()
+
+        # Print stats on screen
+        sys.stdout.write(clear_screen + render(store, now) + '\n')
+        sys.stdout.flush()
+
+        # Export stats for Prometheus
+        if prometheus_file is not None:
+            store.write_prometheus(prometheus_file, now)
+
+        # Stop once all tiles have been processed
+        if store.n_total > 0 and store.n_remaining() == 0:
+            break
+
+        # Wait for next update
+        time.sleep(update_interval)
 
     # End of while loop
-
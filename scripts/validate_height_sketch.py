@@ -0,0 +1,61 @@
+# Short script to validate the approximate canopy height quantiles (gridstats.HeightSketch) against the exact ones
+# for a sample of tiles. Reports the maximum absolute error per quantile, overall and for the cells where the error
+# bound (resolution / 2) applies, i.e. the cells with all vegetation heights between -1 and 50 m.
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import glob
+import re
+import random
+import numpy
+
+from dklidar import settings
+from dklidar import pointcloud
+from dklidar import gridstats
+
+# Number of tiles to sample (optionally supplied as first argument) and quantiles to check
+n_tiles = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+quantiles = [0.25, 0.5, 0.75, 0.95, 0.99]
+
+# Sample tiles
+tile_ids = [re.sub('.*PUNKTSKY_1km_(\d*_\d*).laz', '\g<1>', file_name)
+            for file_name in glob.glob(settings.laz_folder + '/*.laz')]
+random.seed(42)
+tile_ids = random.sample(tile_ids, min(n_tiles, len(tile_ids)))
+
+print('#' * 80)
+print('Validating height sketch (resolution ' + str(settings.canopy_height_sketch_resolution) + ' m, error bound ' +
+      str(settings.canopy_height_sketch_resolution / 2) + ' m) on ' + str(len(tile_ids)) + ' tiles\n')
+print('tile_id'.ljust(12) + 'quantile'.rjust(10) + 'max error [m]'.rjust(16) + 'within range [m]'.rjust(18) +
+      '   bound held')
+print('-' * 80)
+
+all_held = True
+for tile_id in tile_ids:
+    # Read vegetation points and normalise height
+    veg_points = pointcloud.read_tile(tile_id, point_classes = [3,4,5])
+    heights = pointcloud.normalise_tile(tile_id, points = veg_points)
+    cells, n_rows, n_cols = gridstats.cell_index(veg_points['x'], veg_points['y'], tile_id)
+    n_cells = n_rows * n_cols
+
+    # Exact quantiles and range of the heights in each cell
+    features = ['min', 'max'] + ['quantile:' + str(quantile) for quantile in quantiles]
+    exact = gridstats.cell_statistics(cells, n_cells, {'normalizedZ': heights}, {'normalizedZ': features})
+    in_range = (exact[('normalizedZ', 'min')] >= -1) & (exact[('normalizedZ', 'max')] < 50)
+
+    # Approximate quantiles
+    sketch = gridstats.HeightSketch(n_cells, resolution = settings.canopy_height_sketch_resolution)
+    sketch.update(cells, heights)
+
+    for quantile in quantiles:
+        error = numpy.abs(sketch.quantile(quantile) - exact[('normalizedZ', 'quantile:' + str(quantile))])
+        max_error = numpy.nanmax(error) if numpy.any(~numpy.isnan(error)) else 0.0
+        max_error_in_range = numpy.nanmax(error[in_range]) if numpy.any(~numpy.isnan(error[in_range])) else 0.0
+        held = max_error_in_range <= settings.canopy_height_sketch_resolution / 2 + 1e-6
+        all_held = all_held and held
+        print(tile_id.ljust(12) + str(quantile).rjust(10) + ('%.4f' % max_error).rjust(16) +
+              ('%.4f' % max_error_in_range).rjust(18) + '   ' + str(held))
+
+print('-' * 80)
+print('Error bound held for all tiles and quantiles: ' + str(all_held))
@@ -0,0 +1,133 @@
+# Short script to validate the in-process hydrology calculations (dklidar/hydrology.py) against SAGA GIS 7.8.2 for a
+# sample of tiles. The SAGA outputs (filled DTM, MFD catchment area, specific catchment area, slope and TWI, as
+# previously calculated by dtm.dtm_kopecky_twi()) are stored in a reference folder; use --create to (re-)create them
+# with the SAGA binary set in settings.saga_bin. Both are calculated on the 10 m DTM of the 3 x 3 tile neighbourhood of
+# each tile (read with blocks.read_dtm_window(), written to the reference folder as the SAGA input) and compared on the
+# tile in the centre (the outer tiles are affected by edge effects). Exits with status 1 if nothing was compared.
+# Usage: python validate_hydrology.py [n_tiles] [reference folder] [--create]
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import os
+import re
+import random
+import subprocess
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import blocks
+from dklidar import catalogue
+from dklidar import hydrology
+from dklidar import variables
+from dklidar.backends import gdal
+
+# Number of tiles to sample and reference folder
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+n_tiles = int(arguments[0]) if len(arguments) > 0 else 10
+reference_folder = arguments[1] if len(arguments) > 1 else settings.scratch_folder + '/saga_references'
+reference_folder = re.sub('\\\\', '/', reference_folder)
+if not os.path.exists(reference_folder): os.makedirs(reference_folder)
+
+# Products compared: name -> (SAGA file suffix, tolerance, share of cells that needs to be within the tolerance)
+products = {'filled': ('_filled.sdat', 0.01, 1.0),
+            'catchment_area': ('_flow_mfd.sdat', 0.01, 0.95),
+            'slope': ('_slope.sdat', 0.001, 0.99),
+            'twi': ('_twi.sdat', 0.1, 0.95)}
+product_names = ['filled', 'catchment_area', 'slope', 'twi']
+
+
+## Read the 10 m DTM of the 3 x 3 tile neighbourhood of a tile
+def read_neighbourhood(tile_id):
+    cell_size = settings.out_cell_size
+    bounds = blocks.expand_bounds(tilegrid.tile_bounds(tile_id), int(tilegrid.tile_size / cell_size), cell_size)
+    return blocks.read_dtm_window(bounds, cell_size), (bounds[0], cell_size, 0, bounds[3], 0, -cell_size)
+
+
+## Write the DTM of the neighbourhood as the SAGA input
+def write_neighbourhood(dem, geo_transform, out_file):
+    out_raster = gdal.GetDriverByName('GTiff').Create(out_file, dem.shape[1], dem.shape[0], 1, gdal.GDT_Float32)
+    out_raster.SetGeoTransform(geo_transform)
+    out_raster.SetProjection(settings.crs_wkt_gdal)
+    out_band = out_raster.GetRasterBand(1)
+    out_band.SetNoDataValue(-9999)
+    out_band.WriteArray(numpy.where(numpy.isnan(dem), -9999, dem))
+    out_band.FlushCache()
+    out_band = None
+    out_raster = None
+
+
+## Create the SAGA reference outputs for a tile (commands as in the SAGA based dtm_kopecky_twi())
+def create_references(tile_id, dem, geo_transform):
+    prefix = reference_folder + '/' + tile_id
+    mosaic_file = prefix + '_dtm_10m.tif'
+    write_neighbourhood(dem, geo_transform, mosaic_file)
+    commands = [settings.saga_bin + 'ta_preprocessor 5 -ELEV ' + mosaic_file + ' -FILLED ' + prefix + '_filled.sdat ' +
+                '-MINSLOPE ' + str(settings.hydrology_min_slope),
+                settings.saga_bin + 'ta_hydrology 0 -ELEVATION ' + prefix + '_filled.sdat -METHOD 4 -CONVERGENCE ' +
+                str(settings.hydrology_convergence) + ' -FLOW ' + prefix + '_flow_mfd.sdat',
+                settings.saga_bin + 'ta_hydrology 19 -DEM ' + prefix + '_filled.sdat -TCA ' + prefix +
+                '_flow_mfd.sdat -WIDTH ' + prefix + '_width.sdat -SCA ' + prefix + '_sca.sdat',
+                settings.saga_bin + 'ta_morphometry 0 -ELEVATION ' + prefix + '_filled.sdat -METHOD 7 -SLOPE ' +
+                prefix + '_slope.sdat',
+                settings.saga_bin + 'ta_hydrology 20 -SLOPE ' + prefix + '_slope.sdat -AREA ' + prefix +
+                '_sca.sdat -TWI ' + prefix + '_twi.sdat']
+    for cmd in commands:
+        subprocess.check_output(cmd, shell=False, stderr=subprocess.STDOUT)
+
+
+# Sample tiles with a DTM
+tile_ids = list(catalogue.get_catalogue('dtm'))
+if '--create' not in sys.argv:
+    tile_ids = [tile_id for tile_id in tile_ids if os.path.exists(reference_folder + '/' + tile_id + '_twi.sdat')]
+random.seed(42)
+tile_ids = random.sample(tile_ids, min(n_tiles, len(tile_ids)))
+
+print('#' * 80)
+print('Validating in-process hydrology against SAGA GIS outputs in ' + reference_folder + ' on ' +
+      str(len(tile_ids)) + ' tiles\n')
+print('tile_id'.ljust(12) + 'product'.rjust(16) + 'median diff'.rjust(14) + 'max diff'.rjust(12) +
+      'within tol.'.rjust(14) + '   parity')
+print('-' * 80)
+
+all_parity = True
+n_compared = 0
+for tile_id in tile_ids:
+    dem, geo_transform = read_neighbourhood(tile_id)
+    if dem is None: continue
+    if '--create' in sys.argv: create_references(tile_id, dem, geo_transform)
+
+    # In-process calculations on the neighbourhood
+    cell_size = geo_transform[1]
+    filled, order = hydrology.priority_flood(dem, cell_size)
+    accumulation = hydrology.flow_accumulation(filled, cell_size, None, order)
+    slope = hydrology.slope(filled, cell_size)
+    results = {'filled': filled, 'catchment_area': accumulation, 'slope': slope,
+               'twi': numpy.log(hydrology.specific_catchment_area(accumulation, filled, cell_size) /
+                                numpy.tan(numpy.maximum(slope, hydrology.min_twi_slope)))}
+
+    for product in product_names:
+        suffix, tolerance, required_share = products[product]
+        reference = variables.read_single_band(reference_folder + '/' + tile_id + suffix)
+        difference = numpy.abs(tilegrid.crop_to_tile(results[product], geo_transform, tile_id) -
+                               tilegrid.crop_to_tile(reference, geo_transform, tile_id))
+        # Catchment areas are compared relative to the SAGA catchment area
+        if product == 'catchment_area':
+            difference = difference / tilegrid.crop_to_tile(reference, geo_transform, tile_id)
+        valid = ~numpy.isnan(difference)
+        if not numpy.any(valid):
+            print(tile_id.ljust(12) + product.rjust(16) + 'no overlapping cells'.rjust(40))
+            continue
+        share_within = numpy.mean(difference[valid] <= tolerance)
+        parity = share_within >= required_share
+        all_parity = all_parity and parity
+        n_compared += 1
+        print(tile_id.ljust(12) + product.rjust(16) + ('%.4f' % numpy.median(difference[valid])).rjust(14) +
+              ('%.4f' % numpy.max(difference[valid])).rjust(12) + ('%.2f %%' % (100 * share_within)).rjust(14) +
+              '   ' + str(parity))
+
+print('-' * 80)
+print('Parity with SAGA GIS for all tiles and products (' + str(n_compared) + ' compared): ' +
+      str(all_parity and n_compared > 0))
+if n_compared == 0: sys.exit(1)
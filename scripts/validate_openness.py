@@ -0,0 +1,80 @@
+# Short script to validate the in-process landscape openness (dklidar/openness.py) against the outputs of the
+# previous opals.Openness based processing for a sample of tiles. Reports the mean and maximum absolute difference
+# (in degrees) and the share of cells differing by no more than the tolerance for openness_mean and
+# openness_difference. Exits with status 1 if no tile was compared. The reference folder has to hold the outputs of
+# the opals.Openness based processing and can not be the output folder (which holds the in-process outputs once
+# process_tiles.py has been rerun).
+# Usage: python validate_openness.py <reference output folder (opals outputs)> [n_tiles]
+# Jakob Assmann j.assmann@bios.au.dk 19 October 2026
+
+# Dependencies
+import sys
+import os
+import glob
+import re
+import random
+import numpy
+
+from dklidar import settings
+from dklidar import tilegrid
+from dklidar import openness
+from dklidar import blocks
+from dklidar import catalogue
+from dklidar import variables
+
+# Reference folder, number of tiles to sample and tolerance in degrees
+if len(sys.argv) < 2:
+    print('Usage: python validate_openness.py <reference output folder (opals outputs)> [n_tiles]')
+    sys.exit(1)
+reference_folder = re.sub('\\\\', '/', sys.argv[1]).rstrip('/')
+n_tiles = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+tolerance = 1
+if not os.path.isdir(reference_folder):
+    print('Reference folder ' + reference_folder + ' does not exist. Exiting script...')
+    sys.exit(1)
+if os.path.realpath(reference_folder) == os.path.realpath(settings.output_folder):
+    print('Reference folder ' + reference_folder + ' is the output folder, the opals outputs are needed as reference. '
+          'Exiting script...')
+    sys.exit(1)
+
+# Sample tiles with reference outputs
+tile_ids = [re.sub('.*openness_mean_(\d*_\d*).tif', '\g<1>', file_name)
+            for file_name in glob.glob(reference_folder + '/openness_mean/openness_mean_*.tif')]
+tile_ids = [tile_id for tile_id in tile_ids if tile_id in catalogue.get_catalogue('dtm')]
+random.seed(42)
+tile_ids = random.sample(tile_ids, min(n_tiles, len(tile_ids)))
+
+print('#' * 80)
+print('Validating in-process openness against ' + reference_folder + ' on ' + str(len(tile_ids)) + ' tiles\n')
+print('tile_id'.ljust(12) + 'variable'.rjust(22) + 'mean diff'.rjust(12) + 'max diff'.rjust(10) +
+      ('within ' + str(tolerance) + ' deg').rjust(16))
+print('-' * 80)
+
+all_within = True
+n_compared = 0
+for tile_id in tile_ids:
+    # Mean openness (150 m) and openness difference (50 m) as calculated by dtm.py (tile plus halo, see blocks.py)
+    openness_mean = blocks.process_block('openness_mean', tilegrid.tile_bounds(tile_id))['openness_mean']
+    openness_50m = blocks.process_block('openness_difference', tilegrid.tile_bounds(tile_id))
+    openness_diff = numpy.rint(numpy.degrees(openness_50m['openness_max']) -
+                               numpy.degrees(openness_50m['openness_min']))
+    results = {'openness_mean': numpy.rint(numpy.degrees(openness_mean)), 'openness_difference': openness_diff}
+
+    for variable in ['openness_mean', 'openness_difference']:
+        reference_file = reference_folder + '/' + variable + '/' + variable + '_' + tile_id + '.tif'
+        if not os.path.exists(reference_file): continue
+        difference = numpy.abs(results[variable] - variables.read_single_band(reference_file))
+        valid = ~numpy.isnan(difference)
+        if not numpy.any(valid):
+            print(tile_id.ljust(12) + variable.rjust(22) + 'no overlapping cells'.rjust(38))
+            continue
+        share_within = numpy.mean(difference[valid] <= tolerance)
+        all_within = all_within and share_within > 0.99
+        n_compared += 1
+        print(tile_id.ljust(12) + variable.rjust(22) + ('%.3f' % numpy.mean(difference[valid])).rjust(12) +
+              ('%.0f' % numpy.max(difference[valid])).rjust(10) + ('%.2f %%' % (100 * share_within)).rjust(16))
+
+print('-' * 80)
+print('More than 99 % of cells within ' + str(tolerance) + ' deg for all tiles (' + str(n_compared) + ' compared): ' +
+      str(all_within and n_compared > 0))
+if n_compared == 0: sys.exit(1)